@@ -1,18 +1,25 @@
 import os
 import re
 import sys
+import time
 import traceback
-from typing import List, Tuple
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Dict, List, Set, Tuple
 
 from llama_index.core.llms import LLM
 
+from .bash_tools import CommandResult
+from .benchmark_read_helper import TypeBenchmark
+from .checkpoint import Checkpoint
 from .log_utils import get_logger, set_log_dir, switch_log_to_file, switch_log_to_stdout
+from .rtl_canonical import get_rtl_hash
 from .rtl_editor import RTLEditor
 from .rtl_generator import RTLGenerator
 from .sim_judge import SimJudge
-from .sim_reviewer import SimReviewer
+from .sim_reviewer import SimReviewer, sim_review_golden_benchmark
 from .tb_generator import TBGenerator
-from .token_counter import TokenCounter, TokenCounterCached
+from .token_counter import TokenCount, TokenCounter, TokenCounterCached
+from .workspace import Workspace
 
 logger = get_logger(__name__)
 
@@ -28,12 +35,24 @@ class TopAgent:
         self.sim_max_retry = 4
         self.rtl_max_candidates = 20
         self.rtl_selected_candidates = 2
+        # Candidates generated and simulated per wave; None: all in one wave
+        self.rtl_candidates_wave_size: int | None = None
+        self.sim_max_workers: int | None = None  # None: one per core
         self.is_ablation = False
+        self.resume = False  # Continue from the checkpoint of an unfinished run
+        self.checkpoint: Checkpoint | None = None
+        # Run intermediate writes and simulations in a RAM-backed workspace
+        self.use_workspace = True
+        self.workspace: Workspace | None = None
+        self.work_dir_per_run = ""
         self.redirect_log = False
         self.output_path = "./output"
         self.log_path = "./log"
         self.golden_tb_path: str | None = None
         self.golden_rtl_blackbox_path: str | None = None
+        # Benchmark to judge the final rtl.sv against; None skips the golden review
+        self.golden_review_benchmark_path: str | None = None
+        self.golden_review_result: Tuple[bool, CommandResult] | None = None
         self.tb_gen: TBGenerator | None = None
         self.rtl_gen: RTLGenerator | None = None
         self.sim_reviewer: SimReviewer | None = None
@@ -46,6 +65,12 @@ class TopAgent:
     def set_log_path(self, log_path: str) -> None:
         self.log_path = log_path
 
+    def set_sim_max_workers(self, sim_max_workers: int | None) -> None:
+        self.sim_max_workers = sim_max_workers
+
+    def set_rtl_candidates_wave_size(self, wave_size: int | None) -> None:
+        self.rtl_candidates_wave_size = wave_size
+
     def set_ablation(self, is_ablation: bool) -> None:
         self.is_ablation = is_ablation
 
@@ -56,9 +81,36 @@ class TopAgent:
         else:
             switch_log_to_stdout()
 
+    def set_resume(self, resume: bool) -> None:
+        self.resume = resume
+
+    def set_use_workspace(self, use_workspace: bool) -> None:
+        self.use_workspace = use_workspace
+
+    def set_golden_review_benchmark_path(self, benchmark_path: str | None) -> None:
+        self.golden_review_benchmark_path = benchmark_path
+
+    def save_stage(self, stage: str, **data: Any) -> None:
+        """Checkpoint a completed stage, with the token counts spent so far"""
+        assert self.checkpoint
+        data["token_cnts"] = self.token_counter.dump_token_cnts()
+        if self.workspace:
+            self.workspace.sync()
+        self.checkpoint.save(stage, data)
+
+    def load_stage(self, stage: str) -> Dict[str, Any] | None:
+        """Restore a stage completed before a restart, None if not completed"""
+        assert self.checkpoint
+        data = self.checkpoint.get(stage)
+        if data is None:
+            return None
+        self.token_counter.load_token_cnts(data["token_cnts"])
+        logger.info(f"Restored stage '{stage}' from checkpoint")
+        return data
+
     def write_output(self, content: str, file_name: str) -> None:
-        assert self.output_dir_per_run
-        with open(f"{self.output_dir_per_run}/{file_name}", "w") as f:
+        assert self.work_dir_per_run
+        with open(f"{self.work_dir_per_run}/{file_name}", "w") as f:
             f.write(content)
 
     def run_instance(self, spec: str) -> Tuple[bool, str]:
@@ -78,7 +130,12 @@ class TopAgent:
         self.tb_gen.set_golden_tb_path(self.golden_tb_path)
         if not self.golden_tb_path:
             logger.info("No golden testbench provided")
-        testbench, interface = self.tb_gen.chat(spec)
+        tb_stage = self.load_stage("tb")
+        if tb_stage:
+            testbench, interface = tb_stage["testbench"], tb_stage["interface"]
+        else:
+            testbench, interface = self.tb_gen.chat(spec)
+            self.save_stage("tb", testbench=testbench, interface=interface)
         logger.info("Initial tb:")
         logger.info(testbench)
         logger.info("Initial if:")
@@ -88,92 +145,228 @@ class TopAgent:
         self.rtl_gen.reset()
         logger.info(spec)
 
-        is_syntax_pass, rtl_code = self.rtl_gen.chat(
-            input_spec=spec,
-            testbench=testbench,
-            interface=interface,
-            rtl_path=os.path.join(self.output_dir_per_run, "rtl.sv"),
-        )
+        rtl_stage = self.load_stage("initial_rtl")
+        if rtl_stage:
+            is_syntax_pass, rtl_code = (
+                rtl_stage["is_syntax_pass"],
+                rtl_stage["rtl_code"],
+            )
+        else:
+            is_syntax_pass, rtl_code = self.rtl_gen.chat(
+                input_spec=spec,
+                testbench=testbench,
+                interface=interface,
+                rtl_path=os.path.join(self.work_dir_per_run, "rtl.sv"),
+            )
+            self.save_stage(
+                "initial_rtl", is_syntax_pass=is_syntax_pass, rtl_code=rtl_code
+            )
         if not is_syntax_pass:
             return False, rtl_code
         self.write_output(rtl_code, "rtl.sv")
         logger.info("Initial rtl:")
         logger.info(rtl_code)
 
-        tb_need_fix = True
-        rtl_need_fix = True
-        sim_log = ""
-        for i in range(self.sim_max_retry):
-            # run simulation judge, overwrite is_sim_pass
-            is_sim_pass, sim_mismatch_cnt, sim_log = self.sim_reviewer.review()
-            if is_sim_pass:
-                tb_need_fix = False
-                rtl_need_fix = False
-                break
-            self.sim_judge.reset()
-            tb_need_fix = self.sim_judge.chat(spec, sim_log, rtl_code, testbench)
-            if tb_need_fix:
-                self.tb_gen.reset()
-                if i == 0:
-                    self.tb_gen.gen_display_queue = False
-                    logger.info("Fallback from display queue to display moment")
-                else:
-                    self.tb_gen.set_failed_trial(sim_log, rtl_code, testbench)
+        sim_stage = self.load_stage("sim_loop")
+        if sim_stage:
+            testbench = sim_stage["testbench"]
+            tb_need_fix = sim_stage["tb_need_fix"]
+            rtl_need_fix = sim_stage["rtl_need_fix"]
+            is_sim_pass = sim_stage["is_sim_pass"]
+            sim_mismatch_cnt = sim_stage["sim_mismatch_cnt"]
+            sim_log = sim_stage["sim_log"]
+            self.write_output(testbench, "tb.sv")
+        else:
+            tb_need_fix = True
+            rtl_need_fix = True
+            sim_log = ""
+            for i in range(self.sim_max_retry):
+                # run simulation judge, overwrite is_sim_pass
+                is_sim_pass, sim_mismatch_cnt, sim_result = self.sim_reviewer.review()
+                sim_log = sim_result.render()
+                if is_sim_pass:
+                    tb_need_fix = False
+                    rtl_need_fix = False
+                    break
+                self.sim_judge.reset()
+                tb_need_fix = self.sim_judge.chat(spec, sim_log, rtl_code, testbench)
+                if tb_need_fix:
+                    self.tb_gen.reset()
+                    if i == 0:
+                        self.tb_gen.gen_display_queue = False
+                        logger.info("Fallback from display queue to display moment")
+                    else:
+                        self.tb_gen.set_failed_trial(sim_log, rtl_code, testbench)
 
-                testbench, _ = self.tb_gen.chat(spec)
-                self.write_output(testbench, "tb.sv")
-                logger.info("Revised tb:")
-                logger.info(testbench)
-            else:
-                break
+                    testbench, _ = self.tb_gen.chat(spec)
+                    self.write_output(testbench, "tb.sv")
+                    logger.info("Revised tb:")
+                    logger.info(testbench)
+                else:
+                    break
+            self.save_stage(
+                "sim_loop",
+                testbench=testbench,
+                tb_need_fix=tb_need_fix,
+                rtl_need_fix=rtl_need_fix,
+                is_sim_pass=is_sim_pass,
+                sim_mismatch_cnt=sim_mismatch_cnt,
+                sim_log=sim_log,
+            )
 
         assert not tb_need_fix, f"tb_need_fix should be False. sim_log: {sim_log}"
 
         candidates_info: List[Tuple[str, int, str]] = []
-        if rtl_need_fix:
+        candidates_stage = self.load_stage("candidates")
+        if candidates_stage:
+            rtl_code = candidates_stage["rtl_code"]
+            sim_mismatch_cnt = candidates_stage["sim_mismatch_cnt"]
+            sim_log = candidates_stage["sim_log"]
+            rtl_need_fix = candidates_stage["rtl_need_fix"]
+            candidates_info = [
+                (rtl_code_candidate, sim_mismatch_cnt_candidate, sim_log_candidate)
+                for (
+                    rtl_code_candidate,
+                    sim_mismatch_cnt_candidate,
+                    sim_log_candidate,
+                ) in candidates_stage["candidates_info"]
+            ]
+            self.write_output(rtl_code, "rtl.sv")
+        elif rtl_need_fix:
             # Candidates Generation
             assert (
                 sim_mismatch_cnt > 0
             ), f"rtl_need_fix should be True only when sim_mismatch_cnt > 0. sim_log: {sim_log}"
             self.rtl_gen.reset()
+            rtl_path = os.path.join(self.work_dir_per_run, "rtl.sv")
             candidates = [
                 self.rtl_gen.chat(
                     input_spec=spec,
                     testbench=testbench,
                     interface=interface,
-                    rtl_path=os.path.join(self.output_dir_per_run, "rtl.sv"),
+                    rtl_path=rtl_path,
                     enable_cache=True,
                 )
             ]  # Write Cache
-            if self.rtl_max_candidates > 1:
-                candidates += self.rtl_gen.gen_candidates(
-                    input_spec=spec,
-                    testbench=testbench,
-                    interface=interface,
-                    rtl_path=os.path.join(self.output_dir_per_run, "rtl.sv"),
-                    candidates_num=self.rtl_max_candidates - 1,
-                    enable_cache=True,
+            # Generate and simulate candidates in waves, stop at the first pass
+            wave_size = self.rtl_candidates_wave_size or self.rtl_max_candidates
+            generated_cnt = 1
+            wave_gen_cnt = 0
+            wave_gen_token_cnt = TokenCount(in_token_cnt=0, out_token_cnt=0)
+            wave_gen_seconds = 0.0
+            wave_idx = 0
+            # Canonical hashes of candidates simulated in earlier waves
+            simulated_hashes: Set[str] = set()
+            syntax_pass_cnt = 0
+            while True:
+                candidates_num = min(
+                    wave_size - len(candidates),
+                    self.rtl_max_candidates - generated_cnt,
                 )
-            for i in range(self.rtl_max_candidates):
+                if candidates_num > 0:
+                    start_time = time.time()
+                    token_cnt_before = self.token_counter.get_sum_count()
+                    candidates += self.rtl_gen.gen_candidates(
+                        input_spec=spec,
+                        testbench=testbench,
+                        interface=interface,
+                        rtl_path=rtl_path,
+                        candidates_num=candidates_num,
+                        enable_cache=True,
+                    )
+                    token_cnt_after = self.token_counter.get_sum_count()
+                    wave_gen_seconds += time.time() - start_time
+                    wave_gen_token_cnt += TokenCount(
+                        in_token_cnt=token_cnt_after.in_token_cnt
+                        - token_cnt_before.in_token_cnt,
+                        out_token_cnt=token_cnt_after.out_token_cnt
+                        - token_cnt_before.out_token_cnt,
+                    )
+                    wave_gen_cnt += candidates_num
+                    generated_cnt += candidates_num
+                wave_idx += 1
+                syntax_pass_candidates = [
+                    rtl_code_candidate
+                    for is_syntax_pass_candiate, rtl_code_candidate in candidates
+                    if is_syntax_pass_candiate
+                ]
+                # Candidates with the same canonical form share one simulation
+                unique_candidates: Dict[str, str] = {}
+                for rtl_code_candidate in syntax_pass_candidates:
+                    rtl_hash = get_rtl_hash(rtl_code_candidate)
+                    if rtl_hash not in simulated_hashes:
+                        unique_candidates.setdefault(rtl_hash, rtl_code_candidate)
+                simulated_hashes.update(unique_candidates)
+                syntax_pass_cnt += len(syntax_pass_candidates)
                 logger.info(
-                    f"Candidate generation: round {i + 1} / {self.rtl_max_candidates}"
+                    f"Candidate simulation wave {wave_idx}: {len(syntax_pass_candidates)} / {len(candidates)} passed syntax check, {len(unique_candidates)} unique"
                 )
-                is_syntax_pass_candiate, rtl_code_candidate = candidates[i]
-                if not is_syntax_pass_candiate:
-                    continue
-                self.write_output(rtl_code_candidate, "rtl.sv")
-                is_sim_pass_candidate, sim_mismatch_cnt_candidate, sim_log_candidate = (
-                    self.sim_reviewer.review()
+                candidate_reviews = self.sim_reviewer.review_candidates(
+                    list(unique_candidates.values()), max_workers=self.sim_max_workers
                 )
-                if is_sim_pass_candidate:
-                    rtl_code = rtl_code_candidate
-                    sim_mismatch_cnt = sim_mismatch_cnt_candidate
-                    sim_log = sim_log_candidate
-                    rtl_need_fix = False
+                for rtl_code_candidate, candidate_review in zip(
+                    unique_candidates.values(), candidate_reviews
+                ):
+                    # Candidates after the first passing one are cancelled
+                    if candidate_review is None:
+                        break
+                    (
+                        is_sim_pass_candidate,
+                        sim_mismatch_cnt_candidate,
+                        sim_result_candidate,
+                    ) = candidate_review
+                    sim_log_candidate = sim_result_candidate.render()
+                    if is_sim_pass_candidate:
+                        self.write_output(rtl_code_candidate, "rtl.sv")
+                        rtl_code = rtl_code_candidate
+                        sim_mismatch_cnt = sim_mismatch_cnt_candidate
+                        sim_log = sim_log_candidate
+                        rtl_need_fix = False
+                        break
+                    candidates_info.append(
+                        (
+                            rtl_code_candidate,
+                            sim_mismatch_cnt_candidate,
+                            sim_log_candidate,
+                        )
+                    )
+                candidates = []
+                if not rtl_need_fix or generated_cnt >= self.rtl_max_candidates:
                     break
-                candidates_info.append(
-                    (rtl_code_candidate, sim_mismatch_cnt_candidate, sim_log_candidate)
+
+            if syntax_pass_cnt > 0:
+                dup_cnt = syntax_pass_cnt - len(simulated_hashes)
+                logger.info(
+                    f"Candidate dedup rate: {dup_cnt} / {syntax_pass_cnt} ({dup_cnt / syntax_pass_cnt:.1%}) duplicates not simulated"
                 )
+            skipped_cnt = self.rtl_max_candidates - generated_cnt
+            if skipped_cnt > 0 and wave_gen_cnt > 0:
+                # Estimate from the candidates generated in waves so far
+                self.token_counter.add_skipped_cnt(
+                    self.rtl_gen.__class__.__name__,
+                    TokenCount(
+                        in_token_cnt=round(
+                            wave_gen_token_cnt.in_token_cnt * skipped_cnt / wave_gen_cnt
+                        ),
+                        out_token_cnt=round(
+                            wave_gen_token_cnt.out_token_cnt
+                            * skipped_cnt
+                            / wave_gen_cnt
+                        ),
+                    ),
+                    wave_gen_seconds * skipped_cnt / wave_gen_cnt,
+                )
+                logger.info(
+                    f"Candidate generation stopped after {generated_cnt} / {self.rtl_max_candidates} candidates"
+                )
+            self.save_stage(
+                "candidates",
+                rtl_code=rtl_code,
+                sim_mismatch_cnt=sim_mismatch_cnt,
+                sim_log=sim_log,
+                rtl_need_fix=rtl_need_fix,
+                candidates_info=candidates_info,
+            )
 
         candidates_info.sort(key=lambda x: x[1])
         candidates_info_unique_sign = set()
@@ -185,20 +378,37 @@ class TopAgent:
 
         if rtl_need_fix:
             # Editor iteration
-            for i in range(self.rtl_selected_candidates):
+            start_round = 0
+            editor_stage = self.load_stage("editor")
+            if editor_stage:
+                start_round = editor_stage["next_round"]
+                is_sim_pass = editor_stage["is_sim_pass"]
+                rtl_code = editor_stage["rtl_code"]
+                self.write_output(rtl_code, "rtl.sv")
+                if is_sim_pass:
+                    rtl_need_fix = False
+                    start_round = self.rtl_selected_candidates
+            for round_idx in range(start_round, self.rtl_selected_candidates):
                 logger.info(
-                    f"Selected candidate: round {i + 1} / {self.rtl_selected_candidates}"
+                    f"Selected candidate: round {round_idx + 1} / {self.rtl_selected_candidates}"
                 )
-                i = i % len(candidates_info_unique)
+                i = round_idx % len(candidates_info_unique)
                 rtl_code, sim_mismatch_cnt, sim_log = candidates_info_unique[i]
-                with open(f"{self.output_dir_per_run}/rtl.sv", "w") as f:
+                with open(f"{self.work_dir_per_run}/rtl.sv", "w") as f:
                     f.write(rtl_code)
                 self.rtl_edit.reset()
                 is_sim_pass, rtl_code = self.rtl_edit.chat(
                     spec=spec,
-                    output_dir_per_run=self.output_dir_per_run,
+                    output_dir_per_run=self.work_dir_per_run,
                     sim_failed_log=sim_log,
                     sim_mismatch_cnt=sim_mismatch_cnt,
+                    interface=interface,
+                )
+                self.save_stage(
+                    "editor",
+                    next_round=round_idx + 1,
+                    is_sim_pass=is_sim_pass,
+                    rtl_code=rtl_code,
                 )
                 if is_sim_pass:
                     rtl_need_fix = False
@@ -222,7 +432,7 @@ class TopAgent:
         logger.info(spec)
         # Current ablation: only run RTL generation with syntax check
         is_syntax_pass, rtl_code = self.rtl_gen.ablation_chat(
-            input_spec=spec, rtl_path=os.path.join(self.output_dir_per_run, "rtl.sv")
+            input_spec=spec, rtl_path=os.path.join(self.work_dir_per_run, "rtl.sv")
         )
         self.write_output(rtl_code, "rtl.sv")
         return is_syntax_pass, rtl_code
@@ -232,8 +442,9 @@ class TopAgent:
             if os.path.exists(f"{self.output_dir_per_run}/properly_finished.tag"):
                 os.remove(f"{self.output_dir_per_run}/properly_finished.tag")
             self.token_counter.reset()
+            self.checkpoint = Checkpoint(self.output_dir_per_run, resume=self.resume)
             self.sim_reviewer = SimReviewer(
-                self.output_dir_per_run,
+                self.work_dir_per_run,
                 self.golden_rtl_blackbox_path,
             )
             self.rtl_gen = RTLGenerator(self.token_counter)
@@ -248,6 +459,8 @@ class TopAgent:
                 else self.run_instance_ablation(spec)
             )
             self.token_counter.log_token_stats()
+            if self.workspace:
+                self.workspace.sync()
             with open(f"{self.output_dir_per_run}/properly_finished.tag", "w") as f:
                 f.write("1")
         except Exception:
@@ -256,6 +469,46 @@ class TopAgent:
             ret = False, f"Exception: {exc_info[1]}"
         return ret
 
+    def get_golden_review_result(self) -> Tuple[bool, CommandResult] | None:
+        """
+        (is_pass, result) of the golden review of the last run;
+        None if no golden review benchmark is set or the review itself failed
+        """
+        return self.golden_review_result
+
+    def run_golden_review(self, benchmark_type_name: str, task_id: str) -> None:
+        """Judge the final rtl.sv with the golden testbench of the benchmark"""
+        if self.golden_review_benchmark_path is None:
+            return
+        try:
+            self.golden_review_result = sim_review_golden_benchmark(
+                task_id=task_id,
+                output_path=self.output_path,
+                benchmark_type=TypeBenchmark[benchmark_type_name],
+                benchmark_path=self.golden_review_benchmark_path,
+                work_dir_per_run=self.work_dir_per_run,
+            )
+        except Exception:
+            traceback.print_exception(*sys.exc_info())
+
+    def run_in_workspace(
+        self, spec: str, benchmark_type_name: str, task_id: str
+    ) -> Tuple[bool, str]:
+        self.workspace = (
+            Workspace(self.output_dir_per_run) if self.use_workspace else None
+        )
+        self.work_dir_per_run = (
+            self.workspace.path if self.workspace else self.output_dir_per_run
+        )
+        try:
+            result = self._run(spec)
+            self.run_golden_review(benchmark_type_name, task_id)
+        finally:
+            if self.workspace:
+                self.workspace.close()
+                self.workspace = None
+        return result
+
     def run(
         self,
         benchmark_type_name: str,
@@ -264,6 +517,13 @@ class TopAgent:
         golden_tb_path: str | None = None,
         golden_rtl_blackbox_path: str | None = None,
     ) -> Tuple[bool, str]:
+        """
+        Run a task; returns is_syntax_pass and the final rtl.sv.
+        With a golden review benchmark path set, the golden verdict of the final
+        rtl.sv is then available from get_golden_review_result.
+        """
+        # A verdict left from the previous task must not be taken for this one
+        self.golden_review_result = None
         self.golden_tb_path = golden_tb_path
         self.golden_rtl_blackbox_path = golden_rtl_blackbox_path
         log_dir_per_run = f"{self.log_path}/{benchmark_type_name}_{task_id}"
@@ -272,14 +532,13 @@ class TopAgent:
         os.makedirs(self.output_dir_per_run, exist_ok=True)
         set_log_dir(log_dir_per_run)
         if self.redirect_log:
+            # Streams are process-wide: concurrent runs need separate processes,
+            # see mage.benchmark_runner
             with open(f"{log_dir_per_run}/mage_rtl.log", "w") as f:
-                sys.stdout = f
-                sys.stderr = f
-                result = self._run(spec)
-            sys.stdout = sys.__stdout__
-            sys.stderr = sys.__stderr__
+                with redirect_stdout(f), redirect_stderr(f):
+                    result = self.run_in_workspace(spec, benchmark_type_name, task_id)
         else:
-            result = self._run(spec)
+            result = self.run_in_workspace(spec, benchmark_type_name, task_id)
         # Redirect log contains format with rich text.
         # Provide a rich-free version for log parsing or less viewing.
         if self.redirect_log:
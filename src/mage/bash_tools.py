@@ -1,6 +1,17 @@
+import asyncio
+import contextlib
 import json
-from subprocess import PIPE, Popen, TimeoutExpired
-from typing import Tuple
+import math
+import os
+import re
+import resource
+import shlex
+import signal
+import threading
+import time
+from collections import deque
+from subprocess import PIPE, Popen
+from typing import IO, AsyncIterator, Callable, Deque, Dict, List, Tuple
 
 from pydantic import BaseModel
 
@@ -8,27 +19,557 @@ from .log_utils import get_logger
 
 logger = get_logger(__name__)
 
+CANCEL_POLL_INTERVAL = 0.1  # Seconds between checks of cancel_event
+LOG_OUTPUT_MAX_CHARS = 8192
+READ_CHUNK_BYTES = 1 << 16
+
+
+class OutputLimits(BaseModel):
+    """What is kept of each output stream; everything else is dropped as it streams"""
+
+    head_lines: int = 200
+    tail_lines: int = 200
+    keep_lines: int = 100  # First lines matching the keep pattern, e.g. mismatches
+    max_line_bytes: int = 2048
+
+
+output_limits = OutputLimits()
+
+
+def set_output_limits(**kwargs: int) -> None:
+    global output_limits
+    output_limits = OutputLimits(**kwargs)
+
+
+def get_output_limits() -> OutputLimits:
+    return output_limits
+
+
+class ResourceLimits(BaseModel):
+    """rlimits of a sandboxed command; None leaves a limit unset"""
+
+    cpu_seconds: int | None = None  # None: the command's timeout
+    address_space_bytes: int | None = 4 << 30
+    file_size_bytes: int | None = 256 << 20
+
+
+resource_limits = ResourceLimits()
+
+
+def set_resource_limits(**kwargs: int | None) -> None:
+    global resource_limits
+    resource_limits = ResourceLimits(**kwargs)
+
+
+def get_resource_limits() -> ResourceLimits:
+    return resource_limits
+
+
+def apply_resource_limits(
+    pid: int, limits: ResourceLimits, timeout: float | None
+) -> None:
+    """
+    Set rlimits of a just started process, inherited by anything it spawns.
+    Uses prlimit (Linux) rather than a preexec_fn, which is unsafe with threads;
+    elsewhere the command only has its timeout.
+    """
+    if not hasattr(resource, "prlimit"):
+        return
+    cpu_seconds = limits.cpu_seconds
+    if cpu_seconds is None and timeout is not None:
+        cpu_seconds = max(math.ceil(timeout), 1)
+    for rlimit, value in (
+        # SIGXCPU at the soft limit, SIGKILL at the hard one
+        (resource.RLIMIT_CPU, cpu_seconds),
+        (resource.RLIMIT_AS, limits.address_space_bytes),
+        (resource.RLIMIT_FSIZE, limits.file_size_bytes),
+    ):
+        if value is None:
+            continue
+        hard = value + 1 if rlimit == resource.RLIMIT_CPU else value
+        try:
+            resource.prlimit(pid, rlimit, (value, hard))
+        except (ProcessLookupError, PermissionError, ValueError):
+            pass  # Exited already, or the limit is above what we may set
+
+
+# Signals of a command killed for exceeding its rlimits
+RESOURCE_LIMIT_SIGNALS = {
+    -signal.SIGXCPU: "CPU time limit exceeded.",
+    -signal.SIGXFSZ: "File size limit exceeded.",
+}
+
 
 class CommandResult(BaseModel):
-    stdout: str
-    stderr: str
+    """Result of one command, or of several run in sequence (see __add__)"""
 
+    cmd: str
+    returncode: int | None = None  # None: killed on timeout or cancel
+    wall_time: float = 0.0  # Seconds
+    peak_rss_kb: int = 0
+    stdout: str = ""
+    stderr: str = ""
+    omitted_lines: int = 0  # Dropped by OutputCapture
+    # First match of each pattern watched in stdout (group 1 if any)
+    matches: Dict[str, str] = {}
+    is_timeout: bool = False
+    is_cancelled: bool = False
+    is_stopped: bool = False  # Killed once stop_after lines matched keep_pattern
 
-def run_bash_command(cmd: str, timeout: float | None = None) -> Tuple[bool, str]:
-    logger.info(f"Running command: {cmd}")
-    process = Popen(cmd, shell=True, stdout=PIPE, stderr=PIPE, text=True)
-    try:
-        stdout, stderr = process.communicate(
-            timeout=timeout
-        )  # Set your desired timeout in seconds
-    except TimeoutExpired:
-        process.kill()
-        err_msg = f"Timeout {timeout}s reached."
+    @property
+    def is_success(self) -> bool:
+        return self.returncode == 0
+
+    @property
+    def is_interrupted(self) -> bool:
+        """Killed before finishing; says nothing about the design under test"""
+        return self.is_timeout or self.is_cancelled
+
+    def render(self) -> str:
+        """Text for prompts, in the format prompts have always used"""
+        return json.dumps({"stdout": self.stdout, "stderr": self.stderr}, indent=4)
+
+    def summary(self) -> str:
+        """Text for logs, with the rendered output capped"""
+        text = self.render()
+        if len(text) > LOG_OUTPUT_MAX_CHARS:
+            dropped_chars = len(text) - LOG_OUTPUT_MAX_CHARS
+            text = (
+                text[:LOG_OUTPUT_MAX_CHARS]
+                + f"\n[... {dropped_chars} chars not logged]"
+            )
         return (
-            False,
-            json.dumps(CommandResult(stdout="", stderr=err_msg).model_dump(), indent=4),
+            f"returncode {self.returncode}, {self.wall_time:.2f}s, "
+            f"peak RSS {self.peak_rss_kb} KB\n{text}"
+        )
+
+    def __add__(self, other: "CommandResult") -> "CommandResult":
+        return CommandResult(
+            cmd=f"{self.cmd}; {other.cmd}",
+            returncode=other.returncode if self.is_success else self.returncode,
+            wall_time=self.wall_time + other.wall_time,
+            peak_rss_kb=max(self.peak_rss_kb, other.peak_rss_kb),
+            stdout=self.stdout + other.stdout,
+            stderr=self.stderr + other.stderr,
+            omitted_lines=self.omitted_lines + other.omitted_lines,
+            matches={**other.matches, **self.matches},
+            is_timeout=self.is_timeout or other.is_timeout,
+            is_cancelled=self.is_cancelled or other.is_cancelled,
+            is_stopped=self.is_stopped or other.is_stopped,
+        )
+
+
+class OutputCapture:
+    """
+    Bounded capture of one output stream, fed chunk by chunk.
+    Keeps the first head_lines and last tail_lines lines, plus the first
+    keep_lines lines matching keep_pattern; lines are cut to max_line_bytes.
+    The first match of each of match_patterns is recorded on the way.
+    With stop_after, on_stop is called once more than stop_after lines
+    have matched keep_pattern.
+    """
+
+    def __init__(
+        self,
+        limits: OutputLimits,
+        keep_pattern: str | None = None,
+        match_patterns: Dict[str, str] | None = None,
+        stop_after: int | None = None,
+        on_stop: Callable[[], None] | None = None,
+    ) -> None:
+        self.limits = limits
+        self.keep_pattern = re.compile(keep_pattern.encode()) if keep_pattern else None
+        self.match_patterns = {
+            name: re.compile(pattern.encode(), re.MULTILINE)
+            for name, pattern in (match_patterns or {}).items()
+        }
+        self.matches: Dict[str, str] = {}
+        self.stop_after = stop_after
+        self.on_stop = on_stop
+        self.keep_match_cnt = 0
+        self.is_stopped = False
+        self.head: List[Tuple[int, bytes]] = []
+        self.kept: List[Tuple[int, bytes]] = []
+        self.tail: Deque[Tuple[int, bytes]] = deque(maxlen=limits.tail_lines)
+        self.pending = b""
+        self.line_cnt = 0
+        self.has_final_newline = True
+
+    def cut(self, line: bytes) -> bytes:
+        if len(line) <= self.limits.max_line_bytes:
+            return line
+        return line[: self.limits.max_line_bytes] + b" [... line truncated]"
+
+    def feed(self, data: bytes) -> None:
+        data = self.pending + data
+        end = data.rfind(b"\n") + 1
+        # Keep a partial line for the next chunk; a single huge line is cut early
+        self.pending = data[end : end + self.limits.max_line_bytes + 1]
+        if end:
+            self.add_lines(data[: end - 1])
+
+    def close(self) -> None:
+        if self.pending:
+            self.add_lines(self.pending)
+            self.pending = b""
+            self.has_final_newline = False
+
+    def add_lines(self, data: bytes) -> None:
+        for name, pattern in self.match_patterns.items():
+            if name in self.matches:
+                continue
+            m = pattern.search(data)
+            if m:
+                self.matches[name] = m.group(1 if m.groups() else 0).decode(
+                    errors="replace"
+                )
+        lines = data.split(b"\n")
+        first_no = self.line_cnt
+        self.line_cnt += len(lines)
+        head_cnt = max(min(self.limits.head_lines - len(self.head), len(lines)), 0)
+        self.head.extend(
+            (first_no + i, self.cut(line)) for i, line in enumerate(lines[:head_cnt])
         )
-    return (
-        process.returncode == 0,
-        json.dumps(CommandResult(stdout=stdout, stderr=stderr).model_dump(), indent=4),
+        if self.keep_pattern is not None:
+            self.add_kept(lines, first_no, head_cnt)
+        tail_start = max(head_cnt, len(lines) - self.limits.tail_lines)
+        self.tail.extend(
+            (first_no + i, self.cut(lines[i])) for i in range(tail_start, len(lines))
+        )
+
+    def add_kept(self, lines: List[bytes], first_no: int, head_cnt: int) -> None:
+        assert self.keep_pattern is not None
+        # Without stop_after, lines are only searched while there is room to keep
+        start = 0 if self.stop_after is not None else head_cnt
+        for i in range(start, len(lines)):
+            is_full = len(self.kept) >= self.limits.keep_lines
+            if is_full and self.stop_after is None:
+                break
+            if not self.keep_pattern.search(lines[i]):
+                continue
+            self.keep_match_cnt += 1
+            if i >= head_cnt and not is_full:
+                self.kept.append((first_no + i, self.cut(lines[i])))
+            if self.stop_after is not None and self.keep_match_cnt > self.stop_after:
+                self.stop()
+                return
+
+    def stop(self) -> None:
+        if self.is_stopped:
+            return
+        self.is_stopped = True
+        if self.on_stop is not None:
+            self.on_stop()
+
+    def get_text(self) -> Tuple[str, int]:
+        """Captured text, with omissions marked, and the number of omitted lines"""
+        lines = dict(self.head)
+        lines.update(self.kept)
+        lines.update(self.tail)
+        parts: List[str] = []
+        prev_no = -1
+        for no in sorted(lines):
+            if no > prev_no + 1:
+                parts.append(f"[... {no - prev_no - 1} lines omitted]")
+            parts.append(lines[no].decode(errors="replace"))
+            prev_no = no
+        text = "\n".join(parts)
+        if parts and self.has_final_newline:
+            text += "\n"
+        return text, self.line_cnt - len(lines)
+
+
+def drain(stream: IO[bytes], capture: OutputCapture) -> None:
+    while chunk := stream.read1(READ_CHUNK_BYTES):  # type: ignore
+        capture.feed(chunk)
+    capture.close()
+    stream.close()
+
+
+def kill_process_group(pid: int) -> None:
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass  # Already exited
+
+
+# Limit on commands run concurrently by run_command and arun_command,
+# shared by all threads and event loops of the process
+max_concurrent_commands = os.cpu_count() or 1
+command_slots = threading.BoundedSemaphore(max_concurrent_commands)
+COMMAND_SLOT_POLL_INTERVAL = 0.01  # Seconds, of arun_command waiting for a slot
+
+
+def set_max_concurrent_commands(max_concurrent: int) -> None:
+    """Takes effect for commands not yet waiting for a slot"""
+    global max_concurrent_commands, command_slots
+    max_concurrent_commands = max_concurrent
+    command_slots = threading.BoundedSemaphore(max_concurrent)
+
+
+def get_max_concurrent_commands() -> int:
+    return max_concurrent_commands
+
+
+@contextlib.asynccontextmanager
+async def acommand_slot() -> AsyncIterator[None]:
+    # Polled: a blocking acquire would stall the event loop,
+    # and one in a thread would leak its slot when the task is cancelled
+    slots = command_slots
+    while not slots.acquire(blocking=False):
+        await asyncio.sleep(COMMAND_SLOT_POLL_INTERVAL)
+    try:
+        yield
+    finally:
+        slots.release()
+
+
+def run_command(
+    args: List[str],
+    timeout: float | None = None,
+    cancel_event: threading.Event | None = None,
+    keep_pattern: str | None = None,
+    match_patterns: Dict[str, str] | None = None,
+    limits: ResourceLimits | None = None,
+    stop_after: int | None = None,
+) -> CommandResult:
+    """
+    Run args without a shell, in its own process group,
+    which is killed as a whole on timeout or cancel.
+    stdout and stderr are captured within output_limits; on stdout,
+    lines matching keep_pattern are kept and match_patterns are watched.
+    If cancel_event is given and gets set while the command is running,
+    the command is killed and reported as cancelled.
+    With limits, the command runs under those rlimits; exceeding the CPU time
+    limit is reported as a timeout.
+    With stop_after, the command is killed and reported as stopped once
+    more than stop_after stdout lines have matched keep_pattern.
+    At most max_concurrent_commands commands run at once; the timeout
+    starts once the command gets its slot.
+    """
+    slots = command_slots
+    while not slots.acquire(timeout=CANCEL_POLL_INTERVAL):
+        if cancel_event is not None and cancel_event.is_set():
+            return CommandResult(
+                cmd=shlex.join(args), stderr="Cancelled.", is_cancelled=True
+            )
+    try:
+        return run_command_in_slot(
+            args,
+            timeout,
+            cancel_event,
+            keep_pattern,
+            match_patterns,
+            limits,
+            stop_after,
+        )
+    finally:
+        slots.release()
+
+
+def run_command_in_slot(
+    args: List[str],
+    timeout: float | None,
+    cancel_event: threading.Event | None,
+    keep_pattern: str | None,
+    match_patterns: Dict[str, str] | None,
+    limits: ResourceLimits | None,
+    stop_after: int | None,
+) -> CommandResult:
+    cmd = shlex.join(args)
+    logger.info(f"Running command: {cmd}")
+    start_time = time.monotonic()
+    try:
+        # New session, so that a kill also reaches any process the command spawned
+        process = Popen(args, stdout=PIPE, stderr=PIPE, start_new_session=True)
+    except OSError as e:
+        # As a shell would report a missing executable
+        return CommandResult(cmd=cmd, returncode=127, stderr=f"{e}\n")
+    if limits is not None:
+        apply_resource_limits(process.pid, limits, timeout)
+    assert process.stdout and process.stderr
+    captures = make_captures(keep_pattern, match_patterns, stop_after, process.pid)
+    readers = [
+        threading.Thread(target=drain, args=(stream, capture), daemon=True)
+        for stream, capture in zip((process.stdout, process.stderr), captures)
+    ]
+    for reader in readers:
+        reader.start()
+    deadline = None if timeout is None else start_time + timeout
+    err_msg = ""
+    is_timeout = False
+    is_cancelled = False
+    # Pipes close when the command exits
+    while readers[0].is_alive() or readers[1].is_alive():
+        wait_time = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if cancel_event is not None:
+            wait_time = (
+                CANCEL_POLL_INTERVAL
+                if wait_time is None
+                else min(wait_time, CANCEL_POLL_INTERVAL)
+            )
+        for reader in readers:
+            reader.join(timeout=wait_time)
+            if reader.is_alive():
+                break
+        else:
+            break
+        if cancel_event is not None and cancel_event.is_set():
+            is_cancelled = True
+            err_msg = "Cancelled."
+        elif deadline is not None and time.monotonic() >= deadline:
+            is_timeout = True
+            err_msg = f"Timeout {timeout}s reached."
+        else:
+            continue
+        kill_process_group(process.pid)
+        break
+    for reader in readers:
+        reader.join()
+    _, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if not err_msg and captures[0].is_stopped:
+        err_msg = get_stop_msg(stop_after)
+    elif not err_msg and process.returncode in RESOURCE_LIMIT_SIGNALS:
+        err_msg = RESOURCE_LIMIT_SIGNALS[process.returncode]
+        is_timeout = process.returncode == -signal.SIGXCPU
+    return make_command_result(
+        cmd,
+        None if err_msg else process.returncode,
+        time.monotonic() - start_time,
+        rusage.ru_maxrss,
+        captures,
+        err_msg,
+        is_timeout=is_timeout,
+        is_cancelled=is_cancelled,
+        is_stopped=captures[0].is_stopped,
     )
+
+
+def make_captures(
+    keep_pattern: str | None,
+    match_patterns: Dict[str, str] | None,
+    stop_after: int | None,
+    pid: int,
+) -> List[OutputCapture]:
+    """Captures of stdout and stderr; stdout stops the process group"""
+    return [
+        OutputCapture(
+            output_limits,
+            keep_pattern,
+            match_patterns,
+            stop_after=stop_after,
+            on_stop=lambda: kill_process_group(pid),
+        ),
+        OutputCapture(output_limits),
+    ]
+
+
+def get_stop_msg(stop_after: int | None) -> str:
+    return f"Stopped after more than {stop_after} matching output lines."
+
+
+def make_command_result(
+    cmd: str,
+    returncode: int | None,
+    wall_time: float,
+    peak_rss_kb: int,
+    captures: List[OutputCapture],
+    err_msg: str,
+    is_timeout: bool = False,
+    is_cancelled: bool = False,
+    is_stopped: bool = False,
+) -> CommandResult:
+    stdout, stdout_omitted_lines = captures[0].get_text()
+    stderr, stderr_omitted_lines = captures[1].get_text()
+    return CommandResult(
+        cmd=cmd,
+        returncode=returncode,
+        wall_time=wall_time,
+        peak_rss_kb=peak_rss_kb,
+        stdout=stdout,
+        stderr=stderr + err_msg,
+        omitted_lines=stdout_omitted_lines + stderr_omitted_lines,
+        matches=captures[0].matches,
+        is_timeout=is_timeout,
+        is_cancelled=is_cancelled,
+        is_stopped=is_stopped,
+    )
+
+
+async def adrain(stream: asyncio.StreamReader, capture: OutputCapture) -> None:
+    while chunk := await stream.read(READ_CHUNK_BYTES):
+        capture.feed(chunk)
+    capture.close()
+
+
+async def arun_command(
+    args: List[str],
+    timeout: float | None = None,
+    keep_pattern: str | None = None,
+    match_patterns: Dict[str, str] | None = None,
+    limits: ResourceLimits | None = None,
+    stop_after: int | None = None,
+) -> CommandResult:
+    """
+    Async version of run_command, on an asyncio subprocess.
+    Cancel the awaiting task to kill the command.
+    Peak RSS is not measured: the event loop reaps the process.
+    """
+    async with acommand_slot():
+        cmd = shlex.join(args)
+        logger.info(f"Running command: {cmd}")
+        start_time = time.monotonic()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+        except OSError as e:
+            return CommandResult(cmd=cmd, returncode=127, stderr=f"{e}\n")
+        if limits is not None:
+            apply_resource_limits(process.pid, limits, timeout)
+        assert process.stdout and process.stderr
+        captures = make_captures(keep_pattern, match_patterns, stop_after, process.pid)
+        tasks = [
+            asyncio.ensure_future(adrain(process.stdout, captures[0])),
+            asyncio.ensure_future(adrain(process.stderr, captures[1])),
+            asyncio.ensure_future(process.wait()),
+        ]
+        try:
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+        except asyncio.CancelledError:
+            kill_process_group(process.pid)
+            for task in tasks:
+                task.cancel()
+            await asyncio.shield(process.wait())
+            raise
+        if pending:
+            # The drains reach EOF once the whole process group is gone
+            kill_process_group(process.pid)
+            await asyncio.gather(*tasks)
+            return make_command_result(
+                cmd,
+                None,
+                time.monotonic() - start_time,
+                0,
+                captures,
+                f"Timeout {timeout}s reached.",
+                is_timeout=True,
+            )
+        if captures[0].is_stopped:
+            err_msg = get_stop_msg(stop_after)
+        else:
+            err_msg = RESOURCE_LIMIT_SIGNALS.get(process.returncode or 0, "")
+        return make_command_result(
+            cmd,
+            None if err_msg else process.returncode,
+            time.monotonic() - start_time,
+            0,
+            captures,
+            err_msg,
+            is_timeout=process.returncode == -signal.SIGXCPU,
+            is_stopped=captures[0].is_stopped,
+        )
@@ -0,0 +1,396 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+from typing import Any, Dict, List
+
+from llama_index.core.llms import LLM
+from pydantic import BaseModel
+
+from .agent import TopAgent
+from .bash_tools import get_max_concurrent_commands, set_max_concurrent_commands
+from .benchmark_read_helper import (
+    TypeBenchmark,
+    TypeBenchmarkFile,
+    get_benchmark_contents,
+)
+from .gen_config import get_llm, set_exp_setting
+from .llm_cache import set_llm_cache
+from .log_utils import get_logger
+from .sim_reviewer import (
+    SimSettings,
+    get_sim_settings,
+    set_sim_cache,
+    set_sim_settings,
+    sim_review_golden_benchmark,
+)
+from .simulator import set_simulator
+
+logger = get_logger(__name__)
+
+MANIFEST_FILE_NAME = "run_manifest.jsonl"
+
+
+class BenchmarkTask(BaseModel):
+    task_id: str
+    spec: str
+    golden_tb_path: str | None
+    golden_rtl_blackbox_path: str | None
+
+
+class TaskRecord(BaseModel):
+    """Result and accounting of one benchmark task"""
+
+    task_id: str
+    is_pass: bool
+    golden_sim_log: str
+    in_token_cnt: int
+    out_token_cnt: int
+    token_limit_cnt: int
+    token_cost: float
+    run_time: float  # Seconds
+    # Whether the agent run ended without exception (properly_finished.tag)
+    properly_finished: bool = True
+
+
+def get_benchmark_tasks(args: argparse.Namespace) -> List[BenchmarkTask]:
+    type_benchmark = TypeBenchmark[args.type_benchmark.upper()]
+    spec_dict = get_benchmark_contents(
+        type_benchmark,
+        TypeBenchmarkFile.SPEC,
+        args.path_benchmark,
+        args.filter_instance,
+    )
+    golden_tb_path_dict = get_benchmark_contents(
+        type_benchmark,
+        TypeBenchmarkFile.TEST_PATH,
+        args.path_benchmark,
+        args.filter_instance,
+    )
+    golden_rtl_path_dict = get_benchmark_contents(
+        type_benchmark,
+        TypeBenchmarkFile.GOLDEN_PATH,
+        args.path_benchmark,
+        args.filter_instance,
+    )
+    return [
+        BenchmarkTask(
+            task_id=task_id,
+            spec=spec,
+            golden_tb_path=(
+                golden_tb_path_dict[task_id] if args.use_golden_tb_in_mage else None
+            ),
+            golden_rtl_blackbox_path=(
+                golden_rtl_path_dict[task_id] if args.use_golden_tb_in_mage else None
+            ),
+        )
+        for task_id, spec in spec_dict.items()
+    ]
+
+
+def get_output_path(args: argparse.Namespace) -> str:
+    return f"./output_{args.run_identifier}"
+
+
+def get_manifest_path(args: argparse.Namespace) -> str:
+    return f"{get_output_path(args)}/{MANIFEST_FILE_NAME}"
+
+
+def create_agent(args: argparse.Namespace, llm: LLM) -> TopAgent:
+    agent = TopAgent(llm)
+    agent.set_output_path(get_output_path(args))
+    agent.set_log_path(f"./log_{args.run_identifier}")
+    agent.set_redirect_log(True)
+    agent.set_resume(getattr(args, "resume", False))
+    agent.set_golden_review_benchmark_path(args.path_benchmark)
+    agent.set_rtl_candidates_wave_size(getattr(args, "rtl_candidates_wave_size", None))
+    # agent.set_ablation(True)
+    return agent
+
+
+def run_task(
+    agent: TopAgent, args: argparse.Namespace, task: BenchmarkTask
+) -> TaskRecord:
+    type_benchmark = TypeBenchmark[args.type_benchmark.upper()]
+    start_time = time.monotonic()
+    agent.run(
+        benchmark_type_name=type_benchmark.name,
+        task_id=task.task_id,
+        spec=task.spec,
+        golden_tb_path=task.golden_tb_path,
+        golden_rtl_blackbox_path=task.golden_rtl_blackbox_path,
+    )
+    run_time = time.monotonic() - start_time
+    properly_finished = os.path.exists(
+        f"{agent.output_dir_per_run}/properly_finished.tag"
+    )
+    golden_review_result = agent.get_golden_review_result()
+    if golden_review_result is not None:
+        is_pass, golden_sim_result = golden_review_result
+    else:
+        is_pass, golden_sim_result = sim_review_golden_benchmark(
+            task_id=task.task_id,
+            output_path=agent.output_path,
+            benchmark_type=type_benchmark,
+            benchmark_path=args.path_benchmark,
+        )
+    run_token_cnt = agent.token_counter.get_sum_count()
+    token_cost = agent.token_counter.token_cost
+    return TaskRecord(
+        task_id=task.task_id,
+        is_pass=is_pass,
+        golden_sim_log=golden_sim_result.render(),
+        in_token_cnt=run_token_cnt.in_token_cnt,
+        out_token_cnt=run_token_cnt.out_token_cnt,
+        token_limit_cnt=agent.token_counter.get_total_token(),
+        token_cost=(
+            run_token_cnt.in_token_cnt * token_cost.in_token_cost_per_token
+            + run_token_cnt.out_token_cnt * token_cost.out_token_cost_per_token
+        ),
+        run_time=run_time,
+        properly_finished=properly_finished,
+    )
+
+
+# Per worker process state.
+# Each worker is a separate process, so the stdout redirection in TopAgent.run
+# and the global logging manager only ever serve one task at a time.
+worker_agent: TopAgent | None = None
+worker_args: argparse.Namespace | None = None
+
+
+def set_run_settings(args: argparse.Namespace) -> None:
+    """Apply process-wide settings of a run; needed again in every worker"""
+    set_exp_setting(temperature=args.temperature, top_p=args.top_p)
+    set_llm_cache(
+        getattr(args, "llm_cache_mode", "passthrough"),
+        getattr(args, "llm_cache_path", None),
+    )
+    set_simulator(getattr(args, "simulator", "iverilog"))
+    sim_cache_path = getattr(args, "sim_cache_path", None)
+    if sim_cache_path:
+        set_sim_cache(sim_cache_path)
+
+
+def init_worker(args: argparse.Namespace, sim_settings: SimSettings) -> None:
+    global worker_agent, worker_args
+    set_run_settings(args)
+    # Including simulation settings changed in the parent beyond args
+    set_sim_settings(sim_settings)
+    # The command limit is per process: split it among the workers
+    set_max_concurrent_commands(
+        max(get_max_concurrent_commands() // getattr(args, "num_workers", 1), 1)
+    )
+    llm = get_llm(
+        model=args.model,
+        cfg_path=args.key_cfg_path,
+        max_token=args.max_token,
+        provider=args.provider,
+        # The parent process already checked the LLM before spawning workers
+        check_llm=False,
+    )
+    worker_agent = create_agent(args, llm)
+    worker_args = args
+
+
+def make_failed_task_record(task_id: str, run_time: float = 0.0) -> TaskRecord:
+    """Record of a task whose run raised; call within the except block"""
+    exc_info = sys.exc_info()
+    traceback.print_exception(*exc_info)
+    return TaskRecord(
+        task_id=task_id,
+        is_pass=False,
+        golden_sim_log=f"Exception: {exc_info[1]!r}",
+        in_token_cnt=0,
+        out_token_cnt=0,
+        token_limit_cnt=0,
+        token_cost=0.0,
+        run_time=run_time,
+        properly_finished=False,
+    )
+
+
+def run_task_in_worker(task: BenchmarkTask) -> TaskRecord:
+    assert worker_agent and worker_args, "init_worker was not called"
+    return run_task(worker_agent, worker_args, task)
+
+
+def print_task_record(record: TaskRecord, finished_cnt: int, total_cnt: int) -> None:
+    print(f"{record.task_id} took {timedelta(seconds=record.run_time)} to execute")
+    print(
+        f"({finished_cnt:03d}/{total_cnt:03d}) {record.task_id}: is_pass = {record.is_pass}"
+    )
+    print(
+        f"Current problem token count: Input {record.in_token_cnt}, Output {record.out_token_cnt}"
+    )
+    print(f"Current problem token limit consumption: {record.token_limit_cnt}")
+    print(f"{'Current problem token cost':<25}: ${record.token_cost:.2f} USD")
+
+
+def append_run_manifest(manifest_path: str, record: TaskRecord) -> None:
+    """Append one task record, durable on return"""
+    with open(manifest_path, "a") as f:
+        f.write(record.model_dump_json() + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def load_run_manifest(manifest_path: str) -> Dict[str, TaskRecord]:
+    """Records in the manifest; the latest record of a task wins"""
+    records: Dict[str, TaskRecord] = {}
+    if not os.path.exists(manifest_path):
+        return records
+    with open(manifest_path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = TaskRecord.model_validate_json(line)
+            except ValueError:
+                # Torn write of the last line on crash
+                logger.warning(f"Skip corrupted line {line_no} of {manifest_path}")
+                continue
+            records[record.task_id] = record
+    return records
+
+
+def run_round(args: argparse.Namespace, llm: LLM) -> Dict[str, TaskRecord]:
+    """
+    Run all tasks of a benchmark round.
+    Each finished task is appended to run_manifest.jsonl and record.json is
+    rewritten, so a crashed round keeps its bookkeeping.
+    With args.resume, tasks properly finished in the manifest are skipped.
+    With args.num_workers > 1, tasks run concurrently in worker processes,
+    each of which builds its own LLM client and TopAgent.
+    A task that raises is recorded as failed and not properly finished,
+    and the round goes on.
+    """
+    total_start_time = time.monotonic()
+    tasks = get_benchmark_tasks(args)
+    num_workers = getattr(args, "num_workers", 1)
+    os.makedirs(get_output_path(args), exist_ok=True)
+    manifest_path = get_manifest_path(args)
+    records: Dict[str, TaskRecord] = {}
+    if getattr(args, "resume", False):
+        task_ids = {task.task_id for task in tasks}
+        records = {
+            task_id: record
+            for task_id, record in load_run_manifest(manifest_path).items()
+            if task_id in task_ids and record.properly_finished
+        }
+        logger.info(f"Resume: {len(records)} / {len(tasks)} tasks already finished")
+    elif os.path.exists(manifest_path):
+        os.remove(manifest_path)
+    pending_tasks = [task for task in tasks if task.task_id not in records]
+
+    def on_task_finished(record: TaskRecord) -> None:
+        records[record.task_id] = record
+        append_run_manifest(manifest_path, record)
+        print_task_record(record, len(records), len(tasks))
+        write_round_record(
+            args,
+            tasks,
+            records,
+            time.monotonic() - total_start_time,
+            is_final=False,
+        )
+
+    if num_workers <= 1:
+        agent = create_agent(args, llm)
+        for task in pending_tasks:
+            print(
+                f"({len(records)+1:03d}/{len(tasks):03d}) Current task: {task.task_id}"
+            )
+            start_time = time.monotonic()
+            try:
+                record = run_task(agent, args, task)
+            except Exception:
+                record = make_failed_task_record(
+                    task.task_id, time.monotonic() - start_time
+                )
+            on_task_finished(record)
+    elif pending_tasks:
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            # Fresh interpreters: no LLM clients or event loops inherited by fork
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(args, get_sim_settings()),
+        ) as executor:
+            futures = {
+                executor.submit(run_task_in_worker, task): task
+                for task in pending_tasks
+            }
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception:
+                    # Also a worker process that died: the pool is then broken
+                    # and every task still pending lands here
+                    record = make_failed_task_record(futures[future].task_id)
+                on_task_finished(record)
+
+    write_round_record(args, tasks, records, time.monotonic() - total_start_time)
+    return records
+
+
+def write_round_record(
+    args: argparse.Namespace,
+    tasks: List[BenchmarkTask],
+    records: Dict[str, TaskRecord],
+    total_run_time_seconds: float,
+    is_final: bool = True,
+) -> None:
+    """
+    Atomically write record.json over the finished tasks.
+    Totals are printed only for the final record.
+    """
+    record_file = f"{get_output_path(args)}/record.json"
+    record_json: Dict[str, Dict[str, Any]] = {"record_per_run": {}, "total_record": {}}
+    pass_cnt = 0
+    in_token_cnt = 0
+    out_token_cnt = 0
+    token_limit_cnt = 0
+    total_cost = 0.0
+    for task in tasks:
+        if task.task_id not in records:
+            continue
+        record = records[task.task_id]
+        pass_cnt += record.is_pass
+        in_token_cnt += record.in_token_cnt
+        out_token_cnt += record.out_token_cnt
+        token_limit_cnt += record.token_limit_cnt
+        total_cost += record.token_cost
+        record_json["record_per_run"][task.task_id] = {
+            "is_pass": record.is_pass,
+            "run_token_limit_cnt": f"{record.token_limit_cnt:.2f}",
+            "run_token_cost": f"{record.token_cost:.2f}",
+            "run_time": str(timedelta(seconds=record.run_time)),
+        }
+    total_cnt = len(record_json["record_per_run"])
+    avg_cost = total_cost / total_cnt if total_cnt else 0.0
+    total_run_time = timedelta(seconds=total_run_time_seconds)
+    if is_final:
+        print(f"Pass rate: {pass_cnt}/{total_cnt}")
+        print(f"Total token count: Input {in_token_cnt}, Output {out_token_cnt}")
+        print(f"Total token limit consumption: {token_limit_cnt}")
+        print(f"{'Total cost':<25}: ${total_cost:.2f} USD")
+        print(f"{'Avg cost':<25}: ${avg_cost:.2f} USD")
+        print(f"Totally took {total_run_time} to execute")
+    record_json["total_record"] = {
+        "pass_cnt": pass_cnt,
+        "total_cnt": total_cnt,
+        "token_limit_cnt": token_limit_cnt,
+        "total_cost": f"{total_cost:.2f}",
+        "avg_cost": f"{avg_cost:.2f}",
+        "total_run_time": str(total_run_time),
+    }
+    # Write then rename, so record.json is never left half written
+    with open(f"{record_file}.tmp", "w") as f:
+        json.dump(record_json, f, indent=4)
+    os.replace(f"{record_file}.tmp", record_file)
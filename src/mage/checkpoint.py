@@ -0,0 +1,42 @@
+import json
+import os
+from typing import Any, Dict
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+CHECKPOINT_FILE_NAME = "checkpoint.json"
+
+
+class Checkpoint:
+    """
+    Results of the completed stages of one run, kept in its output directory.
+    Each save rewrites the file atomically,
+    so a crashed run keeps every stage completed before the crash.
+    """
+
+    def __init__(self, output_dir_per_run: str, resume: bool) -> None:
+        self.path = os.path.join(output_dir_per_run, CHECKPOINT_FILE_NAME)
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        if not resume:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            return
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                self.stages = json.load(f)
+            logger.info(f"Resume from checkpoint stages: {list(self.stages)}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignore unreadable checkpoint {self.path}: {e}")
+
+    def get(self, stage: str) -> Dict[str, Any] | None:
+        return self.stages.get(stage)
+
+    def save(self, stage: str, data: Dict[str, Any]) -> None:
+        self.stages[stage] = data
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(self.stages, f, indent=4)
+        os.replace(f"{self.path}.tmp", self.path)
@@ -0,0 +1,180 @@
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Iterator, List
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class DiskCache:
+    """
+    Persistent key-value cache on SQLite, shared by threads and processes.
+    Values are JSON-serializable objects.
+    When total value size exceeds max_size_bytes,
+    least recently used entries are evicted; the total is kept in its own table.
+    Cache errors never propagate: a broken cache, or a corrupt entry,
+    behaves as a miss.
+    """
+
+    def __init__(
+        self, path: str, max_size_bytes: int | None = None, table: str = "cache"
+    ) -> None:
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.table = table
+        self.local = threading.local()
+
+    @staticmethod
+    def make_key(*parts: str | bytes) -> str:
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode()
+            # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+            h.update(len(part).to_bytes(8, "little"))
+            h.update(part)
+        return h.hexdigest()
+
+    def get_connection(self) -> sqlite3.Connection:
+        # One connection per thread; re-open after fork
+        conn = getattr(self.local, "conn", None)
+        if conn is not None and self.local.pid == os.getpid():
+            return conn
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS {self.table}_last_access "
+            f"ON {self.table} (last_access)"
+        )
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table}_total ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)"
+        )
+        if conn.execute(f"SELECT 1 FROM {self.table}_total").fetchone() is None:
+            # Once per cache file, which may predate the total table
+            conn.execute(
+                f"INSERT OR IGNORE INTO {self.table}_total (id, size) "
+                f"SELECT 0, COALESCE(SUM(size), 0) FROM {self.table}"
+            )
+        self.local.conn = conn
+        self.local.pid = os.getpid()
+        return conn
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.get_connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def get(self, key: str) -> Any | None:
+        try:
+            conn = self.get_connection()
+            row = conn.execute(
+                f"SELECT value FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                f"UPDATE {self.table} SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return json.loads(row[0])
+        except json.JSONDecodeError as e:
+            logger.warning(f"DiskCache {self.path} drops corrupt entry {key}: {e}")
+            self.delete(key)
+            return None
+        except sqlite3.Error as e:
+            logger.warning(f"DiskCache {self.path} get failed: {e}")
+            return None
+
+    def put(self, key: str, value: Any) -> None:
+        content = json.dumps(value)
+        try:
+            with self.transaction() as conn:
+                old_size = self.get_size(conn, key)
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} "
+                    "(key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, content, len(content), time.time()),
+                )
+                self.add_total_size(conn, len(content) - old_size)
+            self.evict()
+        except sqlite3.Error as e:
+            logger.warning(f"DiskCache {self.path} put failed: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            with self.transaction() as conn:
+                self.delete_keys(conn, [key])
+        except sqlite3.Error as e:
+            logger.warning(f"DiskCache {self.path} delete failed: {e}")
+
+    def get_size(self, conn: sqlite3.Connection, key: str) -> int:
+        row = conn.execute(
+            f"SELECT size FROM {self.table} WHERE key = ?", (key,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def add_total_size(self, conn: sqlite3.Connection, delta: int) -> None:
+        conn.execute(f"UPDATE {self.table}_total SET size = size + ?", (delta,))
+
+    def get_total_size(self) -> int:
+        (total_size,) = (
+            self.get_connection()
+            .execute(f"SELECT size FROM {self.table}_total")
+            .fetchone()
+        )
+        return total_size
+
+    def delete_keys(self, conn: sqlite3.Connection, keys: List[str]) -> None:
+        deleted_size = sum(self.get_size(conn, key) for key in keys)
+        conn.executemany(
+            f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in keys]
+        )
+        self.add_total_size(conn, -deleted_size)
+
+    def evict(self) -> None:
+        if self.max_size_bytes is None:
+            return
+        if self.get_total_size() <= self.max_size_bytes:
+            return
+        with self.transaction() as conn:
+            # Checked again: another process may have evicted meanwhile
+            total_size = self.get_total_size()
+            evicted_keys = []
+            for key, size in conn.execute(
+                f"SELECT key, size FROM {self.table} ORDER BY last_access"
+            ):
+                if total_size <= self.max_size_bytes:
+                    break
+                evicted_keys.append(key)
+                total_size -= size
+            self.delete_keys(conn, evicted_keys)
+        if evicted_keys:
+            logger.info(f"DiskCache {self.path} evicted {len(evicted_keys)} entries")
+
+    def clear(self) -> None:
+        try:
+            with self.transaction() as conn:
+                conn.execute(f"DELETE FROM {self.table}")
+                conn.execute(f"UPDATE {self.table}_total SET size = 0")
+        except sqlite3.Error as e:
+            logger.warning(f"DiskCache {self.path} clear failed: {e}")
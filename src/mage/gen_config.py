@@ -1,15 +1,10 @@
 import os
 
 import config
-from google.oauth2 import service_account
 from llama_index.core.llms.llm import LLM
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.vertex import Vertex
 from pydantic import BaseModel
 
 from .log_utils import get_logger
-from .utils import VertexAnthropicWithCredentials
 
 logger = get_logger(__name__)
 
@@ -22,6 +17,7 @@ class Config:
             self.file_config = config.Config(self.file_path)
         self.fallback_config = {}
         self.fallback_config["OPENAI_API_BASE_URL"] = ""
+        self.fallback_config["OPENAI_COMPATIBLE_API_KEY"] = "EMPTY"
 
     def __getitem__(self, index):
         # Values in key.cfg has priority over env variables
@@ -37,10 +33,16 @@ class Config:
 
 
 def get_llm(**kwargs) -> LLM:
+    """
+    LLM of kwargs["provider"]; the SDK of a provider is imported on its first use.
+    With check_llm (default True), a one-off chat checks the LLM is reachable.
+    """
     cfg = Config(kwargs["cfg_path"])
     provider: str = kwargs["provider"]
     provider = provider.lower()
     if provider == "anthropic":
+        from llama_index.llms.anthropic import Anthropic
+
         try:
             llm: LLM = Anthropic(
                 model=kwargs["model"],
@@ -51,10 +53,31 @@ def get_llm(**kwargs) -> LLM:
         except Exception as e:
             raise Exception(f"gen_config: Failed to get {provider} LLM") from e
     elif kwargs["provider"] == "openai":
+        from llama_index.llms.openai import OpenAI
+
         try:
             llm: LLM = OpenAI(
                 model=kwargs["model"],
                 api_key=cfg["OPENAI_API_KEY"],
+                api_base=cfg["OPENAI_API_BASE_URL"] or None,
+                max_tokens=kwargs["max_token"],
+            )
+
+        except Exception as e:
+            raise Exception(f"gen_config: Failed to get {provider} LLM") from e
+    elif kwargs["provider"] == "openai_compatible":
+        if not cfg["OPENAI_API_BASE_URL"]:
+            raise ValueError(
+                "gen_config: OPENAI_API_BASE_URL is required by provider openai_compatible"
+            )
+        from .openai_compatible import OpenAICompatible
+
+        try:
+            llm: LLM = OpenAICompatible(
+                model=kwargs["model"],
+                # Local servers usually accept any key
+                api_key=cfg["OPENAI_COMPATIBLE_API_KEY"],
+                api_base=cfg["OPENAI_API_BASE_URL"],
                 max_tokens=kwargs["max_token"],
             )
 
@@ -69,6 +92,9 @@ def get_llm(**kwargs) -> LLM:
             raise FileNotFoundError(
                 f"Google Cloud Service Account file not found: {service_account_path}"
             )
+        from google.oauth2 import service_account
+        from llama_index.llms.vertex import Vertex
+
         try:
             credentials = service_account.Credentials.from_service_account_file(
                 service_account_path
@@ -88,6 +114,10 @@ def get_llm(**kwargs) -> LLM:
             raise FileNotFoundError(
                 f"Google Cloud Service Account file not found: {service_account_path}"
             )
+        from google.oauth2 import service_account
+
+        from .vertex_anthropic import VertexAnthropicWithCredentials
+
         try:
             credentials = service_account.Credentials.from_service_account_file(
                 service_account_path,
@@ -106,6 +136,13 @@ def get_llm(**kwargs) -> LLM:
     else:
         raise ValueError(f"gen_config: Invalid provider: {provider}")
 
+    if kwargs.get("check_llm", True):
+        check_llm(llm, provider)
+    return llm
+
+
+def check_llm(llm: LLM, provider: str) -> None:
+    """Liveness probe: one round trip to the LLM"""
     try:
         _ = llm.complete("Say 'Hi'")
     except Exception as e:
@@ -113,8 +150,6 @@ def get_llm(**kwargs) -> LLM:
             f"gen_config: Failed to complete LLM chat for {provider}"
         ) from e
 
-    return llm
-
 
 class ExperimentSetting(BaseModel):
     """
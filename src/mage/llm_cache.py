@@ -0,0 +1,80 @@
+import json
+from enum import Enum
+from typing import Any, Dict, List
+
+from llama_index.core.base.llms.types import ChatMessage
+
+from .disk_cache import DiskCache
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMCacheMode(Enum):
+    PASSTHROUGH = "passthrough"  # Always call the LLM, cache unused
+    RECORD = "record"  # Serve cached responses, call the LLM and record on miss
+    REPLAY = "replay"  # Only serve cached responses, fail on miss
+
+
+class LLMCacheMissError(Exception):
+    pass
+
+
+class LLMCache:
+    """
+    Disk-backed cache of LLM responses.
+    A response is keyed on model, messages, temperature, top_p and a sample index:
+    the n-th request of an identical prompt within a run gets sample index n,
+    so repeated sampling (e.g. RTL candidates) keeps its diversity on replay.
+    """
+
+    def __init__(self, path: str, mode: LLMCacheMode) -> None:
+        self.path = path
+        self.mode = mode
+        # No eviction: replay needs every recorded response
+        self.disk_cache = DiskCache(path, max_size_bytes=None, table="llm_response")
+
+    @staticmethod
+    def get_prompt_key(
+        model: str, messages: List[ChatMessage], temperature: float, top_p: float
+    ) -> str:
+        return DiskCache.make_key(
+            model,
+            json.dumps([[str(m.role.value), m.content] for m in messages]),
+            repr(temperature),
+            repr(top_p),
+        )
+
+    @staticmethod
+    def get_key(prompt_key: str, sample_idx: int) -> str:
+        return DiskCache.make_key(prompt_key, str(sample_idx))
+
+    def get(self, key: str) -> Dict[str, Any] | None:
+        ret = self.disk_cache.get(key)
+        if ret is None and self.mode == LLMCacheMode.REPLAY:
+            raise LLMCacheMissError(
+                f"LLM cache {self.path} has no response for key {key} in replay mode"
+            )
+        return ret
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self.disk_cache.put(key, value)
+
+
+llm_cache: LLMCache | None = None
+
+
+def get_llm_cache() -> LLMCache | None:
+    return llm_cache
+
+
+def set_llm_cache(mode: LLMCacheMode | str, path: str | None = None) -> None:
+    """Set the LLM response cache. Passthrough mode disables the cache."""
+    global llm_cache
+    mode = LLMCacheMode(mode)
+    if mode == LLMCacheMode.PASSTHROUGH:
+        llm_cache = None
+        return
+    assert path, f"LLM cache mode {mode.value} needs a cache path"
+    llm_cache = LLMCache(path, mode)
+    logger.info(f"LLM cache: {mode.value} with {path}")
@@ -1,6 +1,7 @@
 import logging
 import os
-from typing import Dict
+from contextlib import contextmanager
+from typing import ContextManager, Dict, Iterator
 
 from rich.logging import RichHandler
 
@@ -58,6 +59,28 @@ class LoggingManager:
         self.use_stdout = True
         self._update_handlers()
 
+    @contextmanager
+    def log_to_file(self, log_file: str) -> Iterator[None]:
+        """
+        Also write records of every logger to log_file within the context,
+        leaving the log dir and other handlers untouched.
+        """
+        os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+        handler = logging.FileHandler(log_file, mode="w")
+        handler.setLevel(logging.DEBUG)
+        handler.setFormatter(
+            logging.Formatter("[%(asctime)s - %(name)s - %(levelname)s] %(message)s")
+        )
+        loggers = list(self.loggers.values())
+        for logger in loggers:
+            logger.addHandler(handler)
+        try:
+            yield
+        finally:
+            for logger in loggers:
+                logger.removeHandler(handler)
+            handler.close()
+
     def _update_handlers(self) -> None:
         assert self.current_log_dir and os.path.isdir(self.current_log_dir)
 
@@ -110,6 +133,10 @@ def set_log_dir(new_dir: str) -> None:
     logging_manager.set_log_dir(new_dir)
 
 
+def log_to_file(log_file: str) -> ContextManager[None]:
+    return logging_manager.log_to_file(log_file)
+
+
 def switch_log_to_file() -> None:
     logging_manager.switch_to_file()
 
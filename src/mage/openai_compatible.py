@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import weakref
+from typing import Any, Dict
+
+import httpx
+from llama_index.core.base.llms.types import LLMMetadata
+from llama_index.llms.openai import OpenAI
+from openai import AsyncOpenAI
+from openai import OpenAI as SyncOpenAI
+from pydantic import Field, PrivateAttr
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Keep-alive pool shared by every OpenAICompatible LLM in the process,
+# so agents and concurrent tasks reuse connections to the inference server
+http_pool_limits = httpx.Limits(
+    max_connections=64, max_keepalive_connections=32, keepalive_expiry=60.0
+)
+HTTP_TIMEOUT = httpx.Timeout(600.0, connect=10.0)
+
+http_client: httpx.Client | None = None
+http_client_lock = threading.Lock()
+# httpx.AsyncClient connections are bound to the event loop that opened them
+async_http_clients: (
+    "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]"
+) = weakref.WeakKeyDictionary()
+
+
+def set_http_pool_limits(
+    max_connections: int | None = None,
+    max_keepalive_connections: int | None = None,
+    keepalive_expiry: float | None = None,
+) -> None:
+    """Takes effect for new pools"""
+    global http_pool_limits
+    http_pool_limits = httpx.Limits(
+        max_connections=max_connections or http_pool_limits.max_connections,
+        max_keepalive_connections=max_keepalive_connections
+        or http_pool_limits.max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry or http_pool_limits.keepalive_expiry,
+    )
+
+
+def get_http_client() -> httpx.Client:
+    global http_client
+    with http_client_lock:
+        if http_client is None or http_client.is_closed:
+            http_client = httpx.Client(limits=http_pool_limits, timeout=HTTP_TIMEOUT)
+        return http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Pooled client of the running event loop"""
+    loop = asyncio.get_running_loop()
+    with http_client_lock:
+        client = async_http_clients.get(loop)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(limits=http_pool_limits, timeout=HTTP_TIMEOUT)
+            async_http_clients[loop] = client
+        return client
+
+
+class OpenAICompatible(OpenAI):
+    """
+    LLM served by any OpenAI-compatible endpoint (vLLM, llama.cpp server, ...)
+    at api_base. Model names are not checked against OpenAI models,
+    and all calls go through the process-wide keep-alive pools above.
+    """
+
+    context_window: int = Field(
+        default=32768, description="Context window of the served model"
+    )
+
+    _aclients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = (
+        PrivateAttr(default_factory=weakref.WeakKeyDictionary)
+    )
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(reuse_client=True, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "openai_compatible_llm"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=self.max_tokens or -1,
+            is_chat_model=True,
+            model_name=self.model,
+        )
+
+    def _get_credential_kwargs(self, is_async: bool = False) -> Dict[str, Any]:
+        return {
+            **super()._get_credential_kwargs(is_async),
+            "http_client": get_async_http_client() if is_async else get_http_client(),
+        }
+
+    def _get_client(self) -> SyncOpenAI:
+        if self._client is None or self._client._client.is_closed:
+            self._client = SyncOpenAI(**self._get_credential_kwargs())
+        return self._client
+
+    def _get_aclient(self) -> AsyncOpenAI:
+        loop = asyncio.get_running_loop()
+        aclient = self._aclients.get(loop)
+        if aclient is None or aclient._client.is_closed:
+            aclient = AsyncOpenAI(**self._get_credential_kwargs(is_async=True))
+            self._aclients[loop] = aclient
+        return aclient
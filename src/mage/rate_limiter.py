@@ -0,0 +1,274 @@
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Mapping, Tuple
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+OVERLOAD_STATUS_CODES = (429, 503, 529)
+OVERLOAD_ERROR_NAMES = (
+    "RateLimitError",
+    "OverloadedError",
+    "ResourceExhausted",
+    "ServiceUnavailable",
+)
+CONCURRENCY_POLL_INTERVAL = 0.05  # Seconds between checks for a free slot
+BACKOFF_BASE = 1.0  # Seconds
+BACKOFF_MAX = 60.0  # Seconds
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at capacity per minute.
+    capacity None means unlimited. Level may go negative when actual usage
+    turns out larger than what was reserved.
+    """
+
+    def __init__(self, capacity: float | None) -> None:
+        self.capacity = capacity
+        self.level = capacity or 0.0
+        self.last_refill = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        if self.capacity is None:
+            return
+        elapsed = now - self.last_refill
+        self.level = min(self.capacity, self.level + elapsed * self.capacity / 60)
+        self.last_refill = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken, 0 if it can be taken now"""
+        if self.capacity is None:
+            return 0.0
+        self.refill(now)
+        # Never wait for more than a full bucket, or large requests would starve
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        if self.capacity is not None:
+            self.level -= amount
+
+    def set_capacity(self, capacity: float) -> None:
+        if self.capacity is None:
+            self.level = capacity
+        self.capacity = capacity
+
+    def cap_level(self, remaining: float) -> None:
+        if self.capacity is not None:
+            self.level = min(self.level, remaining)
+
+
+def parse_reset_seconds(value: str) -> float | None:
+    """
+    Parse a rate limit reset header:
+    seconds ("20"), OpenAI durations ("1m30s", "250ms") or Anthropic RFC 3339 times.
+    """
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        reset_time = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        return max(reset_time.timestamp() - time.time(), 0.0)
+    except ValueError:
+        pass
+    total = 0.0
+    number = ""
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    i = 0
+    while i < len(value):
+        if value[i].isdigit() or value[i] == ".":
+            number += value[i]
+            i += 1
+            continue
+        unit = "ms" if value[i : i + 2] == "ms" else value[i]
+        if unit not in units or not number:
+            return None
+        total += float(number) * units[unit]
+        number = ""
+        i += len(unit)
+    return total if not number else None
+
+
+def is_overload_error(e: BaseException) -> bool:
+    """Whether e reports rate limiting or provider overload (429 / 503 / 529)"""
+    response = getattr(e, "response", None)
+    for status in (
+        getattr(e, "status_code", None),
+        getattr(response, "status_code", None),
+        getattr(e, "code", None),
+    ):
+        if status in OVERLOAD_STATUS_CODES:
+            return True
+    return type(e).__name__ in OVERLOAD_ERROR_NAMES or "overloaded" in str(e).lower()
+
+
+def get_error_headers(e: BaseException) -> Mapping[str, str]:
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None)
+    return headers if headers is not None else {}
+
+
+class RateLimiter:
+    """
+    Rate limiter of one provider / model, shared by every agent and task
+    in the process.
+    Requests per minute and tokens per minute are token buckets.
+    Concurrency is adaptive: an overload error halves it and blocks new requests
+    for a jittered backoff (or the server's retry-after);
+    successes ramp it back up by one per window of successful requests.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_min: float | None = None,
+        tokens_per_min: float | None = None,
+        max_concurrency: int = 32,
+        init_concurrency: int = 8,
+    ) -> None:
+        self.name = name
+        self.lock = threading.Lock()
+        self.request_bucket = TokenBucket(requests_per_min)
+        self.token_bucket = TokenBucket(tokens_per_min)
+        self.max_concurrency = max_concurrency
+        self.concurrency = min(init_concurrency, max_concurrency)
+        self.in_flight = 0
+        self.success_streak = 0
+        self.overload_streak = 0
+        self.blocked_until = 0.0
+
+    def try_acquire(self, est_tokens: int) -> float:
+        """Take a slot: return 0 on success, otherwise seconds to wait and retry"""
+        with self.lock:
+            now = time.monotonic()
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.in_flight >= self.concurrency:
+                return CONCURRENCY_POLL_INTERVAL
+            wait = max(
+                self.request_bucket.wait_time(1, now),
+                self.token_bucket.wait_time(est_tokens, now),
+            )
+            if wait > 0:
+                return wait
+            self.request_bucket.take(1)
+            self.token_bucket.take(est_tokens)
+            self.in_flight += 1
+            return 0.0
+
+    def acquire(self, est_tokens: int) -> None:
+        while (wait := self.try_acquire(est_tokens)) > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, est_tokens: int) -> None:
+        while (wait := self.try_acquire(est_tokens)) > 0:
+            await asyncio.sleep(wait)
+
+    def release(self, est_tokens: int, used_tokens: int) -> None:
+        """Release a slot after a successful request"""
+        with self.lock:
+            self.in_flight -= 1
+            self.token_bucket.take(used_tokens - est_tokens)
+            self.overload_streak = 0
+            self.success_streak += 1
+            if (
+                self.success_streak >= self.concurrency
+                and self.concurrency < self.max_concurrency
+            ):
+                self.concurrency += 1
+                self.success_streak = 0
+
+    def release_on_cancel(self) -> None:
+        """Release a slot of a request interrupted before it finished"""
+        with self.lock:
+            self.in_flight -= 1
+
+    def release_on_error(self, e: BaseException) -> bool:
+        """
+        Release a slot after a failed request.
+        Return whether e is an overload error, in which case new requests
+        are held back until the backoff has passed.
+        """
+        with self.lock:
+            self.in_flight -= 1
+            self.update_from_headers(get_error_headers(e))
+            if not is_overload_error(e):
+                return False
+            self.concurrency = max(1, self.concurrency // 2)
+            self.success_streak = 0
+            retry_after = get_error_headers(e).get("retry-after")
+            backoff = parse_reset_seconds(retry_after) if retry_after else None
+            if backoff is None:
+                # Full jitter exponential backoff
+                backoff = random.uniform(
+                    0, min(BACKOFF_MAX, BACKOFF_BASE * 2**self.overload_streak)
+                )
+            self.overload_streak += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + backoff)
+            logger.warning(
+                f"RateLimiter {self.name}: overloaded ({type(e).__name__}), "
+                f"concurrency -> {self.concurrency}, backoff {backoff:.1f}s"
+            )
+            return True
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """Adopt OpenAI (x-ratelimit-*) / Anthropic (anthropic-ratelimit-*) headers"""
+        headers = {k.lower(): v for k, v in headers.items()}
+        for prefix in ("x-ratelimit-", "anthropic-ratelimit-"):
+            for kind, bucket in (
+                ("requests", self.request_bucket),
+                ("tokens", self.token_bucket),
+            ):
+                limit = headers.get(f"{prefix}limit-{kind}") or headers.get(
+                    f"{prefix}{kind}-limit"
+                )
+                if limit and limit.isdigit():
+                    bucket.set_capacity(float(limit))
+                remaining = headers.get(f"{prefix}remaining-{kind}") or headers.get(
+                    f"{prefix}{kind}-remaining"
+                )
+                if remaining and remaining.isdigit():
+                    bucket.cap_level(float(remaining))
+
+
+rate_limiters: Dict[Tuple[str, str], RateLimiter] = {}
+rate_limiters_lock = threading.Lock()
+rate_limit_settings: Dict[Tuple[str, str], Dict[str, float | int | None]] = {}
+
+
+def set_rate_limit(
+    provider: str,
+    model: str,
+    requests_per_min: float | None = None,
+    tokens_per_min: float | None = None,
+    max_concurrency: int = 32,
+    init_concurrency: int = 8,
+) -> None:
+    """Configure limits of provider / model. Takes effect for new limiters."""
+    with rate_limiters_lock:
+        rate_limit_settings[(provider, model)] = {
+            "requests_per_min": requests_per_min,
+            "tokens_per_min": tokens_per_min,
+            "max_concurrency": max_concurrency,
+            "init_concurrency": init_concurrency,
+        }
+        rate_limiters.pop((provider, model), None)
+
+
+def get_rate_limiter(provider: str, model: str) -> RateLimiter:
+    with rate_limiters_lock:
+        key = (provider, model)
+        if key not in rate_limiters:
+            rate_limiters[key] = RateLimiter(
+                f"{provider}/{model}", **rate_limit_settings.get(key, {})  # type: ignore
+            )
+        return rate_limiters[key]
@@ -0,0 +1,105 @@
+import re
+from typing import List
+
+from .disk_cache import DiskCache
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Strings are kept as they are, comments are dropped
+COMMENT_OR_STRING_PATTERN = re.compile(
+    r'//[^\n]*|/\*.*?\*/|("(?:\\.|[^"\\\n])*")', re.S
+)
+# Strings, words (identifiers, keywords, numbers), brackets and separators,
+# and runs of other operator characters. Whitespace between operator characters
+# is kept as a token boundary, so "a < = b" stays apart from "a <= b".
+TOKEN_PATTERN = re.compile(
+    r'"(?:\\.|[^"\\\n])*"|[\w$]+|[()\[\]{};,]|[^\w\s"$()\[\]{};,]+'
+)
+# Preprocessor directives end at a newline, which canonical forms do not keep
+PREPROCESSOR_PATTERN = re.compile(r"`[A-Za-z_]")
+# Blocks whose input / output declarations are ordered arguments, not ports
+SUBROUTINE_OPENERS = {"function", "task"}
+SUBROUTINE_CLOSERS = {"endfunction", "endtask"}
+OPENING_BRACKETS = {"(", "[", "{"}
+CLOSING_BRACKETS = {")", "]", "}"}
+# Statements with these are type definitions: member order is bit layout
+TYPE_KEYWORDS = {"typedef", "struct", "union", "enum"}
+# Declarations whose order within a run of declarations does not matter
+DECLARATION_KEYWORDS = {
+    "input",
+    "output",
+    "inout",
+    "wire",
+    "reg",
+    "logic",
+    "bit",
+    "integer",
+    "genvar",
+}
+
+
+def strip_comments(code: str) -> str:
+    return COMMENT_OR_STRING_PATTERN.sub(lambda m: m.group(1) or " ", code)
+
+
+def is_sortable_declaration(statement: List[str]) -> bool:
+    # Declarations with an initializer may depend on earlier declarations
+    return (
+        bool(statement)
+        and statement[0] in DECLARATION_KEYWORDS
+        and "=" not in statement
+        and not TYPE_KEYWORDS.intersection(statement)
+    )
+
+
+def canonicalize_rtl(rtl_code: str) -> str:
+    """
+    Canonical form of RTL code for deduplication: comments dropped,
+    whitespace normalized to single spaces between tokens, and each run of
+    consecutive top-level declarations sorted. Declarations within brackets
+    (struct / union members, whose order is bit layout) and in function / task
+    bodies (whose order is argument order) keep their order.
+    Code using preprocessor directives is its own canonical form.
+    Codes with the same canonical form behave the same in compile and simulation.
+    """
+    if PREPROCESSOR_PATTERN.search(strip_comments(rtl_code)):
+        return rtl_code
+    tokens = TOKEN_PATTERN.findall(strip_comments(rtl_code))
+    # Statements, each with whether it starts and ends at the top level:
+    # outside brackets and function / task bodies
+    statements: List[List[str]] = [[]]
+    is_top_level = [True]
+    subroutine_depth = 0
+    bracket_depth = 0
+    for token in tokens:
+        statements[-1].append(token)
+        if token in SUBROUTINE_OPENERS:
+            subroutine_depth += 1
+        elif token in SUBROUTINE_CLOSERS:
+            subroutine_depth = max(subroutine_depth - 1, 0)
+        elif token in OPENING_BRACKETS:
+            bracket_depth += 1
+        elif token in CLOSING_BRACKETS:
+            bracket_depth = max(bracket_depth - 1, 0)
+        if token == ";":
+            is_top_level[-1] = (
+                is_top_level[-1] and subroutine_depth == 0 and bracket_depth == 0
+            )
+            statements.append([])
+            is_top_level.append(subroutine_depth == 0 and bracket_depth == 0)
+    ret: List[str] = []
+    declarations: List[str] = []
+    for statement, is_top in zip(statements, is_top_level):
+        if is_top and is_sortable_declaration(statement):
+            declarations.append(" ".join(statement))
+            continue
+        ret += sorted(declarations)
+        declarations = []
+        ret.append(" ".join(statement))
+    ret += sorted(declarations)
+    return "\n".join(s for s in ret if s)
+
+
+def get_rtl_hash(rtl_code: str) -> str:
+    return DiskCache.make_key(canonicalize_rtl(rtl_code))
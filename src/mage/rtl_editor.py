@@ -128,6 +128,7 @@ class RTLEditor:
         self.is_done = False
         self.last_mismatch_cnt: int | None = None
         self.sim_reviewer = sim_reviewer
+        self.interface: str | None = None
 
     def reset(self):
         self.is_done = False
@@ -144,22 +145,29 @@ class RTLEditor:
 
     def replace_sanity_check(self) -> Dict[str, Any]:
         # Run syntax check and simulation check sequentially
-        is_syntax_pass, syntax_output = check_syntax(self.rtl_path)
-        if is_syntax_pass:
-            syntax_output = "Syntax check passed."
+        is_syntax_pass, syntax_result = check_syntax(self.rtl_path, self.interface)
         if not is_syntax_pass:
             return {
                 "is_syntax_pass": False,
                 "is_sim_pass": False,
-                "error_msg": syntax_output,
+                "error_msg": syntax_result.render(),
                 "sim_mismatch_cnt": 0,
             }
-        is_sim_pass, sim_mismatch_cnt, sim_output = self.sim_reviewer.review()
+        # Edits above the last accepted mismatch count are rejected anyway,
+        # so the testbench can stop as soon as it gets there
+        is_sim_pass, sim_mismatch_cnt, sim_result = self.sim_reviewer.review(
+            mismatch_ceiling=self.last_mismatch_cnt
+        )
+        if sim_mismatch_cnt is None:
+            # Runaway testbench stopped by the harness: count unknown,
+            # so judge the edit on a full simulation
+            logger.info("Simulation stopped without mismatch count. Rerun in full.")
+            is_sim_pass, sim_mismatch_cnt, sim_result = self.sim_reviewer.review()
         assert isinstance(sim_mismatch_cnt, int)
         return {
             "is_syntax_pass": True,
             "is_sim_pass": is_sim_pass,
-            "error_msg": "" if is_sim_pass else sim_output,
+            "error_msg": "" if is_sim_pass else sim_result.render(),
             "sim_mismatch_cnt": sim_mismatch_cnt,
         }
 
@@ -377,6 +385,7 @@ class RTLEditor:
         output_dir_per_run: str,
         sim_failed_log: str,
         sim_mismatch_cnt: int,
+        interface: str | None = None,
     ) -> Tuple[bool, str]:
         # 1. Initialize the history
         # 2. Generate the initial prompt messages (with functool information)
@@ -394,6 +403,7 @@ class RTLEditor:
         self.tb_path = f"{output_dir_per_run}/tb.sv"
         self.rtl_path = f"{output_dir_per_run}/rtl.sv"
         self.sim_failed_log = sim_failed_log
+        self.interface = interface
         self.last_mismatch_cnt = sim_mismatch_cnt
 
         self.history.extend(self.get_init_prompt_messages())
@@ -1,14 +1,17 @@
 import json
+import time
 from typing import Dict, List, Tuple
 
 from llama_index.core.base.llms.types import ChatMessage, ChatResponse, MessageRole
 from pydantic import BaseModel
 
+from .bash_tools import CommandResult
 from .log_utils import get_logger
 from .prompts import FAILED_TRIAL_PROMPT, ORDER_PROMPT, RTL_4_SHOT_EXAMPLES
-from .sim_reviewer import check_syntax
+from .rtl_canonical import get_rtl_hash
+from .sim_reviewer import acheck_syntax, check_syntax
 from .token_counter import TokenCounter, TokenCounterCached
-from .utils import add_lineno
+from .utils import add_lineno, run_until_complete
 
 logger = get_logger(__name__)
 
@@ -135,6 +138,13 @@ class RTLGenerator:
         logger.info(f"{resp.message.content}")
         return resp
 
+    async def agenerate(self, messages: List[ChatMessage]) -> ChatResponse:
+        logger.info(f"RTL generator input message: {messages}")
+        resp, token_cnt = await self.token_counter.count_achat(messages)
+        logger.info(f"Token count: {token_cnt}")
+        logger.info(f"{resp.message.content}")
+        return resp
+
     def batch_generate(
         self, messages_list: List[List[ChatMessage]]
     ) -> List[ChatResponse]:
@@ -239,12 +249,16 @@ class RTLGenerator:
             rtl_code = resp_obj.module
             with open(rtl_path, "w") as f:
                 f.write(rtl_code)
-            syntax_correct, syntax_output = check_syntax(rtl_path=rtl_path)
+            syntax_correct, syntax_output = check_syntax(
+                rtl_path=rtl_path, interface=self.generated_if
+            )
             if syntax_correct:
                 break
             self.history.extend(
                 [response.message]
-                + self.get_format_error_prompt_messages(syntax_output, rtl_code)
+                + self.get_format_error_prompt_messages(
+                    syntax_output.render(), rtl_code
+                )
             )
         return (syntax_correct, rtl_code)
 
@@ -257,6 +271,32 @@ class RTLGenerator:
         candidates_num: int,
         enable_cache: bool = False,
     ) -> List[Tuple[bool, str]]:
+        return run_until_complete(
+            self.agen_candidates(
+                input_spec=input_spec,
+                testbench=testbench,
+                interface=interface,
+                rtl_path=rtl_path,
+                candidates_num=candidates_num,
+                enable_cache=enable_cache,
+            )
+        )
+
+    async def agen_candidates(
+        self,
+        input_spec: str,
+        testbench: str,
+        interface: str,
+        rtl_path: str,
+        candidates_num: int,
+        enable_cache: bool = False,
+    ) -> List[Tuple[bool, str]]:
+        """
+        Generate candidates concurrently.
+        Each candidate is syntax checked (and fixed) as soon as its response
+        arrives, while responses for the other candidates are still in flight.
+        Candidates with the same canonical form share one passing syntax check.
+        """
         if isinstance(self.token_counter, TokenCounterCached):
             self.token_counter.set_enable_cache(enable_cache)
         self.history = []
@@ -270,14 +310,37 @@ class RTLGenerator:
             for _ in range(candidates_num)
         ]
         logger.info(f"gen_candidates init input message: {messages[0]}")
-        init_responses = self.batch_generate(messages)
-        for i, response in enumerate(init_responses):
+        passed_hashes: Dict[str, Tuple[bool, CommandResult]] = {}
+        syntax_check_cnt = 0
+        syntax_failed_cnt = 0
+        start_time = time.time()
+        async for i, (response, token_cnt) in self.token_counter.count_achat_stream(
+            messages
+        ):
+            logger.info(
+                f"Message {i+1} token count: {token_cnt}, arrived after {time.time() - start_time:.2f}s"
+            )
             rtl_code = self.parse_output(response).module
             candidate_history: List[ChatMessage] = [response.message]
             for j in range(self.max_trials):
                 with open(rtl_path, "w") as f:
                     f.write(rtl_code)
-                syntax_correct, syntax_output = check_syntax(rtl_path=rtl_path)
+                rtl_hash = get_rtl_hash(rtl_code)
+                syntax_check_cnt += 1
+                if rtl_hash in passed_hashes:
+                    logger.info(
+                        f"Candidate {i + 1} is a duplicate, reuse its syntax check"
+                    )
+                    syntax_correct, syntax_output = passed_hashes[rtl_hash]
+                else:
+                    syntax_correct, syntax_output = await acheck_syntax(
+                        rtl_path=rtl_path, interface=self.generated_if
+                    )
+                    # Errors are not shared: their line numbers are of this code
+                    if syntax_correct:
+                        passed_hashes[rtl_hash] = (syntax_correct, syntax_output)
+                    else:
+                        syntax_failed_cnt += 1
                 ret[i] = (syntax_correct, rtl_code)
                 logger.info(
                     f"Candidate {i + 1} / {candidates_num} trial {j + 1} / {self.max_trials} syntax_correct: {syntax_correct}"
@@ -287,14 +350,22 @@ class RTLGenerator:
                     break
                 elif j < self.max_trials - 1:
                     candidate_history.extend(
-                        self.get_format_error_prompt_messages(syntax_output, rtl_code)
+                        self.get_format_error_prompt_messages(
+                            syntax_output.render(), rtl_code
+                        )
                     )
-                    response = self.generate(
+                    response = await self.agenerate(
                         self.history
                         + candidate_history
                         + self.get_order_prompt_messages()
                     )
                     rtl_code = self.parse_output(response).module
+        logger.info(
+            f"Total candidates generation time: {time.time() - start_time:.2f}s"
+        )
+        logger.info(
+            f"Candidate syntax check dedup: {syntax_check_cnt - syntax_failed_cnt - len(passed_hashes)} / {syntax_check_cnt} duplicates"
+        )
         return ret
 
     def ablation_chat(self, input_spec: str, rtl_path: str) -> Tuple[bool, str]:
@@ -316,6 +387,6 @@ class RTLGenerator:
             if syntax_correct:
                 break
             self.history.extend(
-                self.get_format_error_prompt_messages(syntax_output, rtl_code)
+                self.get_format_error_prompt_messages(syntax_output.render(), rtl_code)
             )
         return (syntax_correct, rtl_code)
@@ -0,0 +1,175 @@
+import re
+from typing import Dict, List, Tuple
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Comments and strings, replaced by blanks (keeping newlines) before checking
+COMMENT_OR_STRING_PATTERN = re.compile(r'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"', re.S)
+# Preprocessor use other than these may hide keywords or ports from a lexical pass
+PREPROCESSOR_PATTERN = re.compile(r"`(?!timescale\b|default_nettype\b|resetall\b)\w+")
+# An escaped identifier (e.g. \begin ) is one token, never a keyword or bracket
+TOKEN_PATTERN = re.compile(r"\\\S+|[A-Za-z_][\w$]*|[()\[\]{}]")
+MODULE_HEADER_PATTERN = re.compile(
+    r"\b(?:module|macromodule)\s+(?:(?:static|automatic)\s+)?([A-Za-z_][\w$]*)"
+)
+IDENTIFIER_PATTERN = re.compile(r"[A-Za-z_][\w$]*")
+
+# Closing keyword -> opening keywords it closes.
+# Only pairs that are always balanced in synthesizable RTL are checked
+# (e.g. not fork, which "wait fork" uses without join).
+KEYWORD_PAIRS: Dict[str, Tuple[str, ...]] = {
+    "endmodule": ("module", "macromodule"),
+    "end": ("begin",),
+    "endcase": ("case", "casez", "casex", "randcase"),
+}
+BRACKET_PAIRS = {")": "(", "]": "[", "}": "{"}
+
+
+def blank_comments_and_strings(code: str) -> str:
+    return COMMENT_OR_STRING_PATTERN.sub(
+        lambda m: re.sub(r"[^\n]", " ", m.group(0)), code
+    )
+
+
+def get_line_no(code: str, pos: int) -> int:
+    return code.count("\n", 0, pos) + 1
+
+
+def check_balance(code: str) -> List[str]:
+    """Errors of unbalanced module / begin / case blocks and brackets"""
+    openers = {o: c for c, opener_list in KEYWORD_PAIRS.items() for o in opener_list}
+    openers.update({o: c for c, o in BRACKET_PAIRS.items()})
+    stack: List[Tuple[str, int]] = []
+    for m in TOKEN_PATTERN.finditer(code):
+        token = m.group(0)
+        if token in openers:
+            stack.append((token, m.start()))
+            continue
+        expected = KEYWORD_PAIRS.get(token) or (
+            (BRACKET_PAIRS[token],) if token in BRACKET_PAIRS else None
+        )
+        if expected is None:
+            continue
+        line_no = get_line_no(code, m.start())
+        if not stack:
+            return [f"line {line_no}: '{token}' has no matching '{expected[0]}'"]
+        opener, opener_pos = stack.pop()
+        if opener not in expected:
+            return [
+                f"line {line_no}: '{token}' closes '{opener}' opened at line "
+                f"{get_line_no(code, opener_pos)}, expected '{openers[opener]}'"
+            ]
+    return [
+        f"line {get_line_no(code, pos)}: '{opener}' is never closed by '{openers[opener]}'"
+        for opener, pos in stack
+    ]
+
+
+def get_module_ports(code: str) -> Dict[str, List[str] | None]:
+    """
+    Port names of each module header in code.
+    None when the port list is not parsed (e.g. explicit .name(expr) ports).
+    """
+    ret: Dict[str, List[str] | None] = {}
+    for m in MODULE_HEADER_PATTERN.finditer(code):
+        pos = m.end()
+        # Skip the parameter list #( ... )
+        rest = code[pos:].lstrip()
+        pos = len(code) - len(rest)
+        if rest.startswith("#"):
+            paren_pos = code.find("(", pos)
+            if paren_pos < 0:
+                ret[m.group(1)] = None
+                continue
+            pos = find_closing(code, paren_pos) + 1
+            rest = code[pos:].lstrip()
+            pos = len(code) - len(rest)
+        if not rest.startswith("("):
+            ret[m.group(1)] = []  # No port list
+            continue
+        port_list = code[pos + 1 : find_closing(code, pos)]
+        ret[m.group(1)] = get_port_names(port_list)
+    return ret
+
+
+def find_closing(code: str, open_pos: int) -> int:
+    """Position of the bracket closing the one at open_pos, or len(code)"""
+    depth = 0
+    for i in range(open_pos, len(code)):
+        if code[i] in "([{":
+            depth += 1
+        elif code[i] in ")]}":
+            depth -= 1
+            if depth == 0:
+                return i
+    return len(code)
+
+
+def get_port_names(port_list: str) -> List[str] | None:
+    items: List[str] = []
+    depth = 0
+    item_start = 0
+    for i, c in enumerate(port_list):
+        if c in "([{":
+            depth += 1
+        elif c in ")]}":
+            depth -= 1
+        elif c == "," and depth == 0:
+            items.append(port_list[item_start:i])
+            item_start = i + 1
+    items.append(port_list[item_start:])
+    names: List[str] = []
+    for item in items:
+        item = item.split("=")[0]
+        if item.strip().startswith("."):
+            return None
+        # Drop packed / unpacked dimensions, then the port name is the last identifier
+        item = re.sub(r"\[[^\]]*\]", " ", item)
+        identifiers = IDENTIFIER_PATTERN.findall(item)
+        if identifiers:
+            names.append(identifiers[-1])
+    return names
+
+
+def check_interface(code: str, interface: str) -> List[str]:
+    """Errors of the module of interface missing from code or with other ports"""
+    if_ports = get_module_ports(blank_comments_and_strings(interface))
+    if not if_ports:
+        return []
+    name, expected_ports = next(iter(if_ports.items()))
+    rtl_ports = get_module_ports(code)
+    if name not in rtl_ports:
+        return [f"module '{name}' of the given interface is not defined"]
+    ports = rtl_ports[name]
+    if expected_ports is None or ports is None:
+        return []
+    errors = []
+    missing = [p for p in expected_ports if p not in ports]
+    extra = [p for p in ports if p not in expected_ports]
+    if missing:
+        errors.append(f"module '{name}' lacks ports of the interface: {missing}")
+    if extra:
+        errors.append(f"module '{name}' has ports not in the interface: {extra}")
+    return errors
+
+
+def precheck_rtl(rtl_code: str, interface: str | None = None) -> List[str]:
+    """
+    Cheap in-process lexical / structural check of RTL code before compiling.
+    Return errors found; an empty list means the code is left to the compiler.
+    Only reports code the compiler would reject, or a module not matching
+    the given interface (which the testbench instantiates).
+    """
+    if not rtl_code.strip():
+        return ["no RTL code given"]
+    code = blank_comments_and_strings(rtl_code)
+    if PREPROCESSOR_PATTERN.search(code):
+        return []
+    if not MODULE_HEADER_PATTERN.search(code):
+        return ["no module defined"]
+    errors = check_balance(code)
+    if not errors and interface:
+        errors = check_interface(code, interface)
+    return errors
@@ -1,11 +1,33 @@
 import json
+import multiprocessing
 import os
 import re
-from typing import Dict, List, Tuple
+import shlex
+import shutil
+import sys
+import threading
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Tuple
 
-from .bash_tools import CommandResult, run_bash_command
+from pydantic import BaseModel
+
+from .bash_tools import (
+    CommandResult,
+    OutputLimits,
+    ResourceLimits,
+    arun_command,
+    get_output_limits,
+    get_resource_limits,
+    run_command,
+    set_output_limits,
+    set_resource_limits,
+)
 from .benchmark_read_helper import TypeBenchmark
-from .log_utils import get_logger, set_log_dir
+from .disk_cache import DiskCache
+from .log_utils import get_logger, log_to_file
+from .rtl_precheck import precheck_rtl
+from .simulator import VerilatorBackend, get_simulator, set_simulator
 
 logger = get_logger(__name__)
 
@@ -21,62 +43,552 @@ def stderr_all_lines_benign(stderr: str) -> bool:
     )
 
 
-def check_syntax(rtl_path: str) -> Tuple[bool, str]:
-    cmd = f"iverilog -t null -Wall -Winfloop -Wno-timescale -g2012 -o /dev/null {rtl_path}"
-    is_pass, sim_output = run_bash_command(cmd, timeout=60)
-    sim_output_obj = CommandResult.model_validate_json(sim_output)
-    is_pass = (
-        is_pass
-        and "syntax error" not in sim_output_obj.stdout
-        and (
-            sim_output_obj.stderr == ""
-            or stderr_all_lines_benign(sim_output_obj.stderr)
+# Suggested location of the simulation cache, which is off unless set
+SIM_CACHE_DEFAULT_PATH = os.path.expanduser("~/.cache/mage/sim_cache.sqlite3")
+SIM_CACHE_MAX_SIZE_BYTES = 1 << 30
+
+# Opt-in: MAGE_SIM_CACHE_PATH, set_sim_cache or the sim_cache_path run setting
+sim_cache: DiskCache | None = (
+    DiskCache(
+        os.environ["MAGE_SIM_CACHE_PATH"], max_size_bytes=SIM_CACHE_MAX_SIZE_BYTES
+    )
+    if os.environ.get("MAGE_SIM_CACHE_PATH")
+    else None
+)
+
+
+def set_sim_cache(
+    path: str | None, max_size_bytes: int | None = SIM_CACHE_MAX_SIZE_BYTES
+) -> None:
+    """Set the simulation result cache file. None disables the cache."""
+    global sim_cache
+    sim_cache = DiskCache(path, max_size_bytes=max_size_bytes) if path else None
+
+
+SIM_CACHE_VERSION = "3"  # Bump when the format of cached results changes
+
+
+def get_sim_cache_key(cmd_template: List[str], file_paths: List[str]) -> str:
+    """Cache key on the command (simulator flags) and contents of input files"""
+    parts: List[str | bytes] = [SIM_CACHE_VERSION, shlex.join(cmd_template)]
+    for file_path in file_paths:
+        if not file_path:
+            continue
+        if os.path.isfile(file_path):
+            with open(file_path, "rb") as f:
+                parts.append(f.read())
+        else:
+            parts.append(f"<missing {os.path.basename(file_path)}>")
+    return DiskCache.make_key(*parts)
+
+
+def replace_result_paths(
+    result: CommandResult, replacements: List[Tuple[str, str]]
+) -> CommandResult:
+    def replace(text: str) -> str:
+        for old, new in replacements:
+            if old:
+                text = text.replace(old, new)
+        return text
+
+    return result.model_copy(
+        update={
+            "cmd": replace(result.cmd),
+            "stdout": replace(result.stdout),
+            "stderr": replace(result.stderr),
+        }
+    )
+
+
+def sim_cache_get(key: str, paths: Dict[str, str]) -> Dict[str, Any] | None:
+    """
+    Look up a cached review. Results are stored with run-specific paths
+    replaced by placeholders; paths maps placeholder to the current path.
+    """
+    if sim_cache is None:
+        return None
+    ret = sim_cache.get(key)
+    if ret is None:
+        return None
+    ret["result"] = replace_result_paths(
+        CommandResult.model_validate(ret["result"]), list(paths.items())
+    )
+    logger.info(f"Simulation cache hit: {key}")
+    return ret
+
+
+def sim_cache_put(key: str, paths: Dict[str, str], value: Dict[str, Any]) -> None:
+    if sim_cache is None:
+        return
+    result: CommandResult = value["result"]
+    if result.is_interrupted:
+        # Interrupted runs say nothing about the design
+        return
+    # Longest first, so that a path is not replaced by a placeholder of its prefix
+    replacements = sorted(
+        ((path, placeholder) for placeholder, path in paths.items()),
+        key=lambda x: -len(x[0]),
+    )
+    value = dict(value)
+    value["result"] = replace_result_paths(result, replacements).model_dump()
+    sim_cache.put(key, value)
+
+
+SYNTAX_CHECK_PATTERNS = {"syntax_error": r"syntax error"}
+SYNTAX_PRECHECK_CMD = "rtl_precheck"
+
+# Lint rtl.sv with Verilator before the simulator's own check
+syntax_check_verilator_lint = False
+
+
+def set_syntax_check_verilator_lint(enable: bool) -> None:
+    global syntax_check_verilator_lint
+    syntax_check_verilator_lint = enable
+
+
+def is_syntax_tier_pass(result: CommandResult) -> bool:
+    return result.is_success and "syntax_error" not in result.matches
+
+
+class SyntaxCheckJob:
+    """
+    Tiers, cache lookup and verdict of a syntax check, shared by sync and async.
+    Tiers go from cheap to expensive, and the first failing tier decides:
+    an in-process precheck (see rtl_precheck), then optionally verilator --lint-only,
+    then the simulator's lint. Earlier tiers reject only on errors,
+    so warnings are judged by the simulator alone.
+    """
+
+    def __init__(self, rtl_path: str, interface: str | None = None) -> None:
+        simulator = get_simulator()
+        self.rtl_path = rtl_path
+        self.interface = interface
+        self.cmds = [simulator.lint_cmd(rtl_path)]
+        cmd_templates = [simulator.name, *simulator.lint_cmd("{rtl_path}")]
+        if (
+            syntax_check_verilator_lint
+            and simulator.name != VerilatorBackend.name
+            and shutil.which("verilator")
+        ):
+            verilator = VerilatorBackend()
+            self.cmds.insert(0, verilator.lint_cmd(rtl_path))
+            cmd_templates += verilator.lint_cmd("{rtl_path}")
+        self.cache_key = get_sim_cache_key(
+            [*cmd_templates, SYNTAX_PRECHECK_CMD, interface or ""], [rtl_path]
+        )
+        self.cache_paths = {"{rtl_path}": rtl_path}
+
+    def get_cached(self) -> Tuple[bool, CommandResult] | None:
+        cached = sim_cache_get(self.cache_key, self.cache_paths)
+        if cached is None:
+            return None
+        is_pass, result = cached["is_pass"], cached["result"]
+        logger.info(f"Syntax check is_pass: {is_pass}, \noutput: {result.summary()}")
+        return is_pass, result
+
+    def precheck(self) -> CommandResult | None:
+        """Result of a failed precheck, None if the compiler has to decide"""
+        with open(self.rtl_path, "r") as f:
+            errors = precheck_rtl(f.read(), self.interface)
+        if not errors:
+            return None
+        return CommandResult(
+            cmd=f"{SYNTAX_PRECHECK_CMD} {self.rtl_path}",
+            returncode=1,
+            stderr="".join(f"{self.rtl_path}: error: {e}\n" for e in errors),
+        )
+
+    def finish(self, result: CommandResult) -> Tuple[bool, CommandResult]:
+        is_pass = is_syntax_tier_pass(result) and (
+            result.stderr == "" or stderr_all_lines_benign(result.stderr)
         )
+        logger.info(f"Syntax check is_pass: {is_pass}, \noutput: {result.summary()}")
+        sim_cache_put(
+            self.cache_key, self.cache_paths, {"is_pass": is_pass, "result": result}
+        )
+        return is_pass, result
+
+
+def check_syntax(
+    rtl_path: str, interface: str | None = None
+) -> Tuple[bool, CommandResult]:
+    """
+    Check syntax of rtl_path, and with interface,
+    that it defines the module of interface with the same ports.
+    """
+    job = SyntaxCheckJob(rtl_path, interface)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    result = job.precheck()
+    if result is None:
+        for cmd in job.cmds:
+            result = run_command(
+                cmd, timeout=SIM_TIMEOUT, match_patterns=SYNTAX_CHECK_PATTERNS
+            )
+            if not is_syntax_tier_pass(result):
+                break
+    assert result is not None
+    return job.finish(result)
+
+
+async def acheck_syntax(
+    rtl_path: str, interface: str | None = None
+) -> Tuple[bool, CommandResult]:
+    job = SyntaxCheckJob(rtl_path, interface)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    result = job.precheck()
+    if result is None:
+        for cmd in job.cmds:
+            result = await arun_command(
+                cmd, timeout=SIM_TIMEOUT, match_patterns=SYNTAX_CHECK_PATTERNS
+            )
+            if not is_syntax_tier_pass(result):
+                break
+    assert result is not None
+    return job.finish(result)
+
+
+# Watched in simulation output as it streams, so verdicts survive truncation
+SIM_OUTPUT_PATTERNS = {
+    "passed": r"SIMULATION PASSED",
+    "failed": r"SIMULATION FAILED",
+    "mismatch_cnt": r"SIMULATION FAILED - (\d*) MISMATCHES DETECTED",
+    "golden_mismatch": r"First mismatch occurred at time",
+}
+# Mismatch records kept from the middle of long simulation output,
+# not counting reports of zero mismatches ("0 mismatches", "mismatch: 0")
+SIM_MISMATCH_LINE_PATTERN = (
+    r"(?i)^(?!.*\b(?:no|0) mismatch)(?!.*mismatch\w*\s*[:=]\s*0\b).*mismatch"
+)
+# Runaway backstop of a run with a mismatch ceiling: it is stopped after
+# this many mismatch lines, or this many per mismatch allowed, if more.
+# Well-behaved testbenches $finish at the ceiling long before.
+SIM_RUNAWAY_MISMATCH_LINES = 10000
+SIM_RUNAWAY_MISMATCH_LINES_PER_MISMATCH = 64
+
+
+def sim_review_mismatch_cnt(result: CommandResult) -> int:
+    if "failed" not in result.matches:
+        return 0
+    assert result.matches.get(
+        "mismatch_cnt"
+    ), f"Failed to parse mismatch count from: {result.stdout}"
+    return int(result.matches["mismatch_cnt"])
+
+
+# Generated testbenches $finish once the mismatch count exceeds the ceiling
+SIM_MISMATCH_CEILING_PLUSARG = "+mismatch_ceiling={mismatch_ceiling}"
+
+
+def get_sim_stop_after(mismatch_ceiling: int | None) -> int | None:
+    """
+    Mismatch lines after which a run with mismatch_ceiling is stopped,
+    for testbenches that ignore the plusarg. Lines are no mismatch count,
+    so a stopped run has no count.
+    """
+    if mismatch_ceiling is None:
+        return None
+    return max(
+        SIM_RUNAWAY_MISMATCH_LINES,
+        SIM_RUNAWAY_MISMATCH_LINES_PER_MISMATCH * (mismatch_ceiling + 1),
+    )
+
+
+SIM_TIMEOUT = 60.0  # Seconds, of compile and run together
+# A testbench that ran before gets a run timeout of this factor times its longest
+# completed run, so a hanging design (e.g. a combinational loop) is killed early
+SIM_ADAPTIVE_TIMEOUT_FACTOR = 4.0
+SIM_ADAPTIVE_TIMEOUT_MIN = 10.0  # Seconds
+
+
+def get_sim_timing_key(fixed_paths: List[str]) -> str:
+    """Key of run times learned for a testbench (and golden reference)"""
+    return get_sim_cache_key(["sim_timing", get_simulator().name], fixed_paths)
+
+
+def get_sim_run_timeout(timing_key: str | None) -> float:
+    if sim_cache is None or timing_key is None:
+        return SIM_TIMEOUT
+    timing = sim_cache.get(timing_key)
+    if timing is None:
+        return SIM_TIMEOUT
+    return min(
+        SIM_TIMEOUT,
+        max(
+            SIM_ADAPTIVE_TIMEOUT_MIN,
+            SIM_ADAPTIVE_TIMEOUT_FACTOR * timing["run_wall_time"],
+        ),
     )
-    logger.info(f"Syntax check is_pass: {is_pass}, \noutput: {sim_output}")
-    return is_pass, sim_output
 
 
-def sim_review_mismatch_cnt(stdout: str) -> int:
-    mismatch_cnt = 0
-    if "SIMULATION FAILED" in stdout:
-        re_str = r"SIMULATION FAILED - (\d*) MISMATCHES DETECTED"
-        m = re.search(re_str, stdout)
-        assert m is not None, f"Failed to parse mismatch count from: {stdout}"
-        mismatch_cnt = int(m.group(1))
-    return mismatch_cnt
+def record_sim_run_time(timing_key: str | None, run_result: CommandResult) -> None:
+    """Learn from a run that completed; the longest one is kept"""
+    if sim_cache is None or timing_key is None or not run_result.is_success:
+        return
+    timing = sim_cache.get(timing_key)
+    run_wall_time = max(
+        run_result.wall_time, timing["run_wall_time"] if timing else 0.0
+    )
+    sim_cache.put(timing_key, {"run_wall_time": run_wall_time})
+
+
+def compile_and_simulate(
+    compile_cmd: List[str],
+    run_cmd: List[str],
+    exe_path: str,
+    timeout: float = SIM_TIMEOUT,
+    cancel_event: threading.Event | None = None,
+    timing_key: str | None = None,
+    mismatch_ceiling: int | None = None,
+) -> CommandResult:
+    """
+    Compile, then run the executable within what is left of timeout.
+    With timing_key, the run timeout adapts to earlier runs of the testbench.
+    The run is sandboxed in the rlimits of bash_tools.get_resource_limits().
+    With mismatch_ceiling, a runaway run is stopped (see get_sim_stop_after).
+    """
+    if os.path.isfile(exe_path):
+        os.remove(exe_path)
+    result = run_command(compile_cmd, timeout=timeout, cancel_event=cancel_event)
+    if not result.is_success:
+        return result
+    run_result = run_command(
+        run_cmd,
+        timeout=min(
+            max(timeout - result.wall_time, 0.0), get_sim_run_timeout(timing_key)
+        ),
+        cancel_event=cancel_event,
+        keep_pattern=SIM_MISMATCH_LINE_PATTERN,
+        match_patterns=SIM_OUTPUT_PATTERNS,
+        limits=get_resource_limits(),
+        stop_after=get_sim_stop_after(mismatch_ceiling),
+    )
+    record_sim_run_time(timing_key, run_result)
+    return result + run_result
+
+
+async def acompile_and_simulate(
+    compile_cmd: List[str],
+    run_cmd: List[str],
+    exe_path: str,
+    timeout: float = SIM_TIMEOUT,
+    timing_key: str | None = None,
+    mismatch_ceiling: int | None = None,
+) -> CommandResult:
+    if os.path.isfile(exe_path):
+        os.remove(exe_path)
+    result = await arun_command(compile_cmd, timeout=timeout)
+    if not result.is_success:
+        return result
+    run_result = await arun_command(
+        run_cmd,
+        timeout=min(
+            max(timeout - result.wall_time, 0.0), get_sim_run_timeout(timing_key)
+        ),
+        keep_pattern=SIM_MISMATCH_LINE_PATTERN,
+        match_patterns=SIM_OUTPUT_PATTERNS,
+        limits=get_resource_limits(),
+        stop_after=get_sim_stop_after(mismatch_ceiling),
+    )
+    record_sim_run_time(timing_key, run_result)
+    return result + run_result
+
+
+class SimReviewJob:
+    """Commands, cache lookup and verdict of a review, shared by sync and async"""
+
+    def __init__(
+        self,
+        output_path_per_run: str,
+        golden_rtl_path: str | None = None,
+        mismatch_ceiling: int | None = None,
+    ) -> None:
+        self.simulator = get_simulator()
+        tb_path = f"{output_path_per_run}/tb.sv"
+        rtl_path = f"{output_path_per_run}/rtl.sv"
+        if golden_rtl_path is None:
+            golden_rtl_path = ""
+        self.source_paths = [tb_path, rtl_path, golden_rtl_path]
+        # Sources shared by every rtl.sv reviewed against this testbench
+        self.fixed_paths = [tb_path, golden_rtl_path]
+        self.timing_key = get_sim_timing_key(self.fixed_paths)
+        self.mismatch_ceiling = mismatch_ceiling
+        self.plusargs = (
+            [SIM_MISMATCH_CEILING_PLUSARG.format(mismatch_ceiling=mismatch_ceiling)]
+            if mismatch_ceiling is not None
+            else []
+        )
+        cmd_template, exe_template = self.simulator.compile_cmd(
+            ["{tb_path}", "{rtl_path}", "{golden_rtl_path}"],
+            "{build_dir}",
+            "sim_output",
+        )
+        self.cache_key = get_sim_cache_key(
+            [
+                self.simulator.name,
+                *cmd_template,
+                *self.simulator.run_cmd(exe_template, self.plusargs),
+            ],
+            self.source_paths,
+        )
+        self.cache_paths = {
+            "{output_path_per_run}": output_path_per_run,
+            "{golden_rtl_path}": golden_rtl_path,
+        }
+
+    def get_cmds(self, build_dir: str) -> Tuple[List[str], List[str], str]:
+        """Compile command, run command and executable of a build in build_dir"""
+        compile_cmd, exe_path = self.simulator.compile_cmd(
+            self.source_paths, build_dir, "sim_output"
+        )
+        return compile_cmd, self.simulator.run_cmd(exe_path, self.plusargs), exe_path
+
+    def get_cached(self) -> Tuple[bool, int | None, CommandResult] | None:
+        cached = sim_cache_get(self.cache_key, self.cache_paths)
+        if cached is None:
+            return None
+        is_pass, mismatch_cnt, result = (
+            cached["is_pass"],
+            cached["mismatch_cnt"],
+            cached["result"],
+        )
+        logger.info(
+            f"Simulation is_pass: {is_pass}, mismatch_cnt: {mismatch_cnt}\noutput: {result.summary()}"
+        )
+        return is_pass, mismatch_cnt, result
+
+    def finish(self, result: CommandResult) -> Tuple[bool, int | None, CommandResult]:
+        is_pass = (
+            result.is_success
+            and "passed" in result.matches
+            and (result.stderr == "" or stderr_all_lines_benign(result.stderr))
+        )
+        # Stopped by the harness: the testbench never reported its count
+        mismatch_cnt = None if result.is_stopped else sim_review_mismatch_cnt(result)
+        logger.info(
+            f"Simulation is_pass: {is_pass}, mismatch_cnt: {mismatch_cnt}\noutput: {result.summary()}"
+        )
+        sim_cache_put(
+            self.cache_key,
+            self.cache_paths,
+            {"is_pass": is_pass, "mismatch_cnt": mismatch_cnt, "result": result},
+        )
+        return is_pass, mismatch_cnt, result
 
 
 def sim_review(
     output_path_per_run: str,
     golden_rtl_path: str | None = None,
-) -> Tuple[bool, int, str]:
-    rtl_path = f"{output_path_per_run}/rtl.sv"
-    vvp_name = f"{output_path_per_run}/sim_output.vvp"
-    tb_path = f"{output_path_per_run}/tb.sv"
-    if golden_rtl_path is None:
-        golden_rtl_path = ""
-    if os.path.isfile(vvp_name):
-        os.remove(vvp_name)
-    cmd = "iverilog -Wall -Winfloop -Wno-timescale -g2012 -o {} {} {} {}; vvp -n {}".format(
-        vvp_name, tb_path, rtl_path, golden_rtl_path, vvp_name
-    )
-    is_pass, sim_output = run_bash_command(cmd, timeout=60)
-    sim_output_obj = CommandResult.model_validate_json(sim_output)
-    is_pass = (
-        is_pass
-        and "SIMULATION PASSED" in sim_output_obj.stdout
-        and (
-            sim_output_obj.stderr == ""
-            or stderr_all_lines_benign(sim_output_obj.stderr)
+    cancel_event: threading.Event | None = None,
+    mismatch_ceiling: int | None = None,
+) -> Tuple[bool, int | None, CommandResult]:
+    """
+    With mismatch_ceiling, the testbench may stop as soon as the mismatch count
+    exceeds it; the mismatch count returned is then only a lower bound.
+    The mismatch count is None if the harness stopped a runaway run
+    (see get_sim_stop_after), which only happens with mismatch_ceiling.
+    """
+    job = SimReviewJob(output_path_per_run, golden_rtl_path, mismatch_ceiling)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    with job.simulator.build_dir(output_path_per_run, job.fixed_paths) as build_dir:
+        compile_cmd, run_cmd, exe_path = job.get_cmds(build_dir)
+        result = compile_and_simulate(
+            compile_cmd,
+            run_cmd,
+            exe_path,
+            cancel_event=cancel_event,
+            timing_key=job.timing_key,
+            mismatch_ceiling=job.mismatch_ceiling,
         )
-    )
-    mismatch_cnt = sim_review_mismatch_cnt(sim_output_obj.stdout)
-    logger.info(
-        f"Simulation is_pass: {is_pass}, mismatch_cnt: {mismatch_cnt}\noutput: {sim_output}"
-    )
-    assert isinstance(sim_output, str) and isinstance(is_pass, bool)
-    return is_pass, mismatch_cnt, sim_output
+    return job.finish(result)
+
+
+async def asim_review(
+    output_path_per_run: str,
+    golden_rtl_path: str | None = None,
+    mismatch_ceiling: int | None = None,
+) -> Tuple[bool, int | None, CommandResult]:
+    job = SimReviewJob(output_path_per_run, golden_rtl_path, mismatch_ceiling)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    with job.simulator.build_dir(output_path_per_run, job.fixed_paths) as build_dir:
+        compile_cmd, run_cmd, exe_path = job.get_cmds(build_dir)
+        result = await acompile_and_simulate(
+            compile_cmd,
+            run_cmd,
+            exe_path,
+            timing_key=job.timing_key,
+            mismatch_ceiling=job.mismatch_ceiling,
+        )
+    return job.finish(result)
+
+
+def sim_review_candidates(
+    output_path_per_run: str,
+    rtl_codes: List[str],
+    golden_rtl_path: str | None = None,
+    max_workers: int | None = None,
+) -> List[Tuple[bool, int | None, CommandResult] | None]:
+    """
+    Simulate candidates in parallel, each in its own scratch directory
+    holding a copy of tb.sv and the candidate as rtl.sv.
+    The first (lowest index) passing candidate wins:
+    once it is known, candidates after it are cancelled and their result is None.
+    All candidates before the winner are always simulated.
+    """
+    tb_path = f"{output_path_per_run}/tb.sv"
+    scratch_root = f"{output_path_per_run}/candidates"
+    scratch_dirs: List[str] = []
+    for i, rtl_code in enumerate(rtl_codes):
+        scratch_dir = f"{scratch_root}/candidate_{i}"
+        os.makedirs(scratch_dir, exist_ok=True)
+        shutil.copyfile(tb_path, f"{scratch_dir}/tb.sv")
+        with open(f"{scratch_dir}/rtl.sv", "w") as f:
+            f.write(rtl_code)
+        scratch_dirs.append(scratch_dir)
+
+    ret: List[Tuple[bool, int | None, CommandResult] | None] = [None for _ in rtl_codes]
+    if not rtl_codes:
+        return ret
+    max_workers = max_workers or min(len(rtl_codes), os.cpu_count() or 1)
+    # Each review runs iverilog/vvp as child processes,
+    # so threads are enough to keep max_workers simulators busy.
+    # Threads also let a cancel event kill simulations that are already running.
+    cancel_events = [threading.Event() for _ in rtl_codes]
+    winner = len(rtl_codes)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                sim_review, scratch_dir, golden_rtl_path, cancel_events[i]
+            ): i
+            for i, scratch_dir in enumerate(scratch_dirs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            if i > winner or future.cancelled():
+                continue
+            ret[i] = future.result()
+            is_pass, mismatch_cnt, _ = ret[i]
+            logger.info(
+                f"Candidate {i + 1} / {len(rtl_codes)} is_pass: {is_pass}, mismatch_cnt: {mismatch_cnt}"
+            )
+            if not is_pass:
+                continue
+            winner = i
+            for other_future, j in futures.items():
+                if j > winner:
+                    other_future.cancel()
+                    cancel_events[j].set()
+    for i in range(winner + 1, len(rtl_codes)):
+        ret[i] = None
+    shutil.rmtree(scratch_root, ignore_errors=True)
+    return ret
 
 
 class SimReviewer:
@@ -88,21 +600,39 @@ class SimReviewer:
         self.output_path_per_run = output_path_per_run
         self.golden_rtl_path = golden_rtl_path
 
-    def review(self) -> Tuple[bool, int, str]:
+    def review(
+        self, mismatch_ceiling: int | None = None
+    ) -> Tuple[bool, int | None, CommandResult]:
         return sim_review(
             self.output_path_per_run,
             self.golden_rtl_path,
+            mismatch_ceiling=mismatch_ceiling,
         )
 
+    async def areview(
+        self, mismatch_ceiling: int | None = None
+    ) -> Tuple[bool, int | None, CommandResult]:
+        return await asim_review(
+            self.output_path_per_run,
+            self.golden_rtl_path,
+            mismatch_ceiling=mismatch_ceiling,
+        )
 
-def sim_review_golden(
-    rtl_path: str,
-    task_id: str,
-    benchmark_type: TypeBenchmark,
-    benchmark_path: str,
-    output_path_per_run: str,
-) -> Tuple[bool, str]:
+    def review_candidates(
+        self, rtl_codes: List[str], max_workers: int | None = None
+    ) -> List[Tuple[bool, int | None, CommandResult] | None]:
+        return sim_review_candidates(
+            self.output_path_per_run,
+            rtl_codes,
+            self.golden_rtl_path,
+            max_workers,
+        )
 
+
+def get_golden_sources(
+    task_id: str, benchmark_type: TypeBenchmark, benchmark_path: str
+) -> Tuple[str, str]:
+    """Golden testbench and reference of a benchmark task"""
     if (
         benchmark_type == TypeBenchmark.VERILOG_EVAL_V2
         or benchmark_type == TypeBenchmark.VERILOG_EVAL_V1
@@ -114,25 +644,115 @@ def sim_review_golden(
         )
         tb_path = f"{benchmark_path}/{folder}/{task_id}_test.sv"
         ref_path = f"{benchmark_path}/{folder}/{task_id}_ref.sv"
-        vvp_name = f"{output_path_per_run}/sim_golden.vvp"
-        if os.path.isfile(vvp_name):
-            os.remove(vvp_name)
-        cmd = "iverilog -Wall -Winfloop -Wno-timescale -g2012 -s tb -o {} {} {} {}; vvp -n {}".format(
-            vvp_name, tb_path, rtl_path, ref_path, vvp_name
-        )
-        is_pass, sim_output = run_bash_command(cmd, timeout=60)
-        sim_output_obj = CommandResult.model_validate_json(sim_output)
+        return tb_path, ref_path
+    raise NotImplementedError  # Should not reach here
+
+
+class GoldenReviewJob:
+    """Commands, cache lookup and verdict of a golden review, shared by sync and async"""
+
+    def __init__(
+        self, rtl_path: str, tb_path: str, ref_path: str, output_path_per_run: str
+    ) -> None:
+        self.simulator = get_simulator()
+        self.output_path_per_run = output_path_per_run
+        self.source_paths = [tb_path, rtl_path, ref_path]
+        self.fixed_paths = [tb_path, ref_path]
+        self.timing_key = get_sim_timing_key(self.fixed_paths)
+        cmd_template, exe_template = self.simulator.compile_cmd(
+            ["{tb_path}", "{rtl_path}", "{ref_path}"],
+            "{build_dir}",
+            "sim_golden",
+            top="tb",
+        )
+        self.cache_key = get_sim_cache_key(
+            [
+                self.simulator.name,
+                *cmd_template,
+                *self.simulator.run_cmd(exe_template, []),
+            ],
+            self.source_paths,
+        )
+        self.cache_paths = {
+            "{output_path_per_run}": output_path_per_run,
+            "{tb_path}": tb_path,
+            "{ref_path}": ref_path,
+        }
+
+    def get_cmds(self, build_dir: str) -> Tuple[List[str], List[str], str]:
+        compile_cmd, exe_path = self.simulator.compile_cmd(
+            self.source_paths, build_dir, "sim_golden", top="tb"
+        )
+        return compile_cmd, self.simulator.run_cmd(exe_path, []), exe_path
+
+    def get_cached(self) -> Tuple[bool, CommandResult] | None:
+        cached = sim_cache_get(self.cache_key, self.cache_paths)
+        if cached is None:
+            return None
+        is_pass, result = cached["is_pass"], cached["result"]
+        logger.info(
+            f"Golden simulation is_pass: {is_pass}, \noutput: {result.summary()}"
+        )
+        return is_pass, result
+
+    def finish(self, result: CommandResult) -> Tuple[bool, CommandResult]:
         is_pass = (
-            is_pass
-            and "First mismatch occurred at time" not in sim_output_obj.stdout
-            and (
-                sim_output_obj.stderr == ""
-                or stderr_all_lines_benign(sim_output_obj.stderr)
-            )
+            result.is_success
+            and "golden_mismatch" not in result.matches
+            and (result.stderr == "" or stderr_all_lines_benign(result.stderr))
         )
-        logger.info(f"Golden simulation is_pass: {is_pass}, \noutput: {sim_output}")
-        return is_pass, sim_output
-    raise NotImplementedError  # Should not reach here
+        logger.info(
+            f"Golden simulation is_pass: {is_pass}, \noutput: {result.summary()}"
+        )
+        sim_cache_put(
+            self.cache_key, self.cache_paths, {"is_pass": is_pass, "result": result}
+        )
+        return is_pass, result
+
+
+def sim_review_golden(
+    rtl_path: str,
+    task_id: str,
+    benchmark_type: TypeBenchmark,
+    benchmark_path: str,
+    output_path_per_run: str,
+) -> Tuple[bool, CommandResult]:
+    """
+    Simulate rtl_path against the golden testbench and reference of the task.
+    Results are cached on the contents of the three files, so a task is not
+    simulated again until its rtl.sv changes.
+    """
+    tb_path, ref_path = get_golden_sources(task_id, benchmark_type, benchmark_path)
+    job = GoldenReviewJob(rtl_path, tb_path, ref_path, output_path_per_run)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    with job.simulator.build_dir(output_path_per_run, job.fixed_paths) as build_dir:
+        compile_cmd, run_cmd, exe_path = job.get_cmds(build_dir)
+        result = compile_and_simulate(
+            compile_cmd, run_cmd, exe_path, timing_key=job.timing_key
+        )
+    return job.finish(result)
+
+
+async def asim_review_golden(
+    rtl_path: str,
+    task_id: str,
+    benchmark_type: TypeBenchmark,
+    benchmark_path: str,
+    output_path_per_run: str,
+) -> Tuple[bool, CommandResult]:
+    tb_path, ref_path = get_golden_sources(task_id, benchmark_type, benchmark_path)
+    job = GoldenReviewJob(rtl_path, tb_path, ref_path, output_path_per_run)
+    cached = job.get_cached()
+    if cached is not None:
+        return cached
+    with job.simulator.build_dir(output_path_per_run, job.fixed_paths) as build_dir:
+        compile_cmd, run_cmd, exe_path = job.get_cmds(build_dir)
+        result = await acompile_and_simulate(
+            compile_cmd, run_cmd, exe_path, timing_key=job.timing_key
+        )
+    return job.finish(result)
 
 
 def sim_review_golden_benchmark(
@@ -140,19 +760,127 @@ def sim_review_golden_benchmark(
     output_path: str,
     benchmark_type: TypeBenchmark,
     benchmark_path: str,
-) -> Tuple[bool, str]:
+    work_dir_per_run: str | None = None,
+) -> Tuple[bool, CommandResult]:
+    """
+    Golden review of the task's rtl.sv, written to sim_review_output.json.
+    With work_dir_per_run, rtl.sv is taken from and built in that workspace.
+    """
     output_path_per_run = f"{output_path}/{benchmark_type.name}_{task_id}"
-    rtl_path = f"{output_path_per_run}/rtl.sv"
-    is_pass, sim_output = sim_review_golden(
-        rtl_path, task_id, benchmark_type, benchmark_path, output_path_per_run
+    work_dir_per_run = work_dir_per_run or output_path_per_run
+    rtl_path = f"{work_dir_per_run}/rtl.sv"
+    is_pass, result = sim_review_golden(
+        rtl_path, task_id, benchmark_type, benchmark_path, work_dir_per_run
     )
     with open(f"{output_path_per_run}/sim_review_output.json", "w") as f:
         f.write(
             json.dumps(
-                {"is_pass": is_pass, "sim_output": json.loads(sim_output)}, indent=4
+                {"is_pass": is_pass, "sim_output": result.model_dump()}, indent=4
             )
         )
-    return (is_pass, sim_output)
+    return (is_pass, result)
+
+
+GOLDEN_REVIEW_RESULTS_FILE_NAME = "golden_review_results.jsonl"
+
+
+class GoldenReviewRecord(BaseModel):
+    """Golden review of one task, as kept in golden_review_results.jsonl"""
+
+    task_id: str
+    rtl_hash: str  # Of the rtl.sv contents reviewed
+    is_pass: bool
+    sim_output: CommandResult
+
+
+def get_rtl_file_hash(rtl_path: str) -> str:
+    if not os.path.isfile(rtl_path):
+        return ""
+    with open(rtl_path, "rb") as f:
+        return DiskCache.make_key(f.read())
+
+
+def load_golden_review_results(results_path: str) -> Dict[str, GoldenReviewRecord]:
+    """Records in results_path; the latest record of a task wins"""
+    records: Dict[str, GoldenReviewRecord] = {}
+    if not os.path.exists(results_path):
+        return records
+    with open(results_path) as f:
+        for line_no, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = GoldenReviewRecord.model_validate_json(line)
+            except ValueError:
+                logger.warning(f"Skip corrupted line {line_no} of {results_path}")
+                continue
+            records[record.task_id] = record
+    return records
+
+
+class SimSettings(BaseModel):
+    """Process-wide simulation settings, handed to worker processes"""
+
+    simulator: str
+    sim_cache_path: str | None
+    sim_cache_max_size_bytes: int | None
+    syntax_check_verilator_lint: bool
+    output_limits: OutputLimits
+    resource_limits: ResourceLimits
+
+
+def get_sim_settings() -> SimSettings:
+    return SimSettings(
+        simulator=get_simulator().name,
+        sim_cache_path=sim_cache.path if sim_cache else None,
+        sim_cache_max_size_bytes=sim_cache.max_size_bytes if sim_cache else None,
+        syntax_check_verilator_lint=syntax_check_verilator_lint,
+        output_limits=get_output_limits(),
+        resource_limits=get_resource_limits(),
+    )
+
+
+def set_sim_settings(settings: SimSettings) -> None:
+    set_simulator(settings.simulator)
+    set_sim_cache(settings.sim_cache_path, settings.sim_cache_max_size_bytes)
+    set_syntax_check_verilator_lint(settings.syntax_check_verilator_lint)
+    set_output_limits(**settings.output_limits.model_dump())
+    set_resource_limits(**settings.resource_limits.model_dump())
+
+
+def golden_review_task(
+    task_id: str,
+    log_file: str,
+    output_path: str,
+    benchmark_type: TypeBenchmark,
+    benchmark_path: str,
+) -> GoldenReviewRecord:
+    """Golden review of one task, logged to its own log_file"""
+    rtl_path = f"{output_path}/{benchmark_type.name}_{task_id}/rtl.sv"
+    with log_to_file(log_file):
+        # Hash before reviewing, so a concurrent rewrite gets re-scored next time
+        rtl_hash = get_rtl_file_hash(rtl_path)
+        is_pass, result = sim_review_golden_benchmark(
+            task_id, output_path, benchmark_type, benchmark_path
+        )
+    return GoldenReviewRecord(
+        task_id=task_id, rtl_hash=rtl_hash, is_pass=is_pass, sim_output=result
+    )
+
+
+def make_failed_golden_review_record(task_id: str) -> GoldenReviewRecord:
+    """Record of a task whose review raised; call within the except block"""
+    exc_info = sys.exc_info()
+    traceback.print_exception(*exc_info)
+    # No rtl_hash: reviewed again even with only_changed
+    return GoldenReviewRecord(
+        task_id=task_id,
+        rtl_hash="",
+        is_pass=False,
+        sim_output=CommandResult(
+            cmd="golden review", stderr=f"Exception: {exc_info[1]!r}\n"
+        ),
+    )
 
 
 def sim_review_golden_benchmark_batch(
@@ -161,11 +889,78 @@ def sim_review_golden_benchmark_batch(
     output_path: str,
     benchmark_type: TypeBenchmark,
     benchmark_path: str,
-) -> Dict[str, Tuple[bool, str]]:
-    ret: Dict[str, Tuple[bool, str]] = {}
-    for task_id in task_id_list:
-        set_log_dir(f"{log_path}/golden_review_{benchmark_type.name}_{task_id}")
-        ret[task_id] = sim_review_golden_benchmark(
-            task_id, output_path, benchmark_type, benchmark_path
+    max_workers: int | None = None,
+    only_changed: bool = False,
+) -> Dict[str, Tuple[bool, CommandResult]]:
+    """
+    Golden review of tasks on a process pool of max_workers (default: one per core).
+    Each task logs to {log_path}/golden_review_{benchmark}_{task_id}/mage_rtl_total.log,
+    and its record is appended to {output_path}/golden_review_results.jsonl.
+    With only_changed, tasks whose rtl.sv is unchanged since their last record
+    keep it instead of being reviewed again.
+    A task whose review raises is recorded as failed, and the batch goes on.
+    """
+    results_path = f"{output_path}/{GOLDEN_REVIEW_RESULTS_FILE_NAME}"
+    records: Dict[str, GoldenReviewRecord] = {}
+    if only_changed:
+        records = {
+            task_id: record
+            for task_id, record in load_golden_review_results(results_path).items()
+            if record.rtl_hash
+            == get_rtl_file_hash(
+                f"{output_path}/{benchmark_type.name}_{task_id}/rtl.sv"
+            )
+        }
+        logger.info(
+            f"Golden review: {len(records)} / {len(task_id_list)} tasks unchanged"
         )
-    return ret
+    elif os.path.exists(results_path):
+        os.remove(results_path)
+    pending_task_ids = [t for t in task_id_list if t not in records]
+
+    def on_task_finished(record: GoldenReviewRecord) -> None:
+        records[record.task_id] = record
+        with open(results_path, "a") as f:
+            f.write(record.model_dump_json() + "\n")
+        logger.info(f"Golden review {record.task_id}: is_pass = {record.is_pass}")
+
+    task_args = [
+        (
+            task_id,
+            f"{log_path}/golden_review_{benchmark_type.name}_{task_id}/mage_rtl_total.log",
+            output_path,
+            benchmark_type,
+            benchmark_path,
+        )
+        for task_id in pending_task_ids
+    ]
+    max_workers = max_workers or os.cpu_count() or 1
+    if max_workers <= 1 or len(task_args) <= 1:
+        for args in task_args:
+            try:
+                record = golden_review_task(*args)
+            except Exception:
+                record = make_failed_golden_review_record(args[0])
+            on_task_finished(record)
+    else:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            # Workers are fresh interpreters: pass on the settings in use
+            initializer=set_sim_settings,
+            initargs=(get_sim_settings(),),
+        ) as executor:
+            futures = {
+                executor.submit(golden_review_task, *args): args[0]
+                for args in task_args
+            }
+            for future in as_completed(futures):
+                try:
+                    record = future.result()
+                except Exception:
+                    record = make_failed_golden_review_record(futures[future])
+                on_task_finished(record)
+    return {
+        task_id: (records[task_id].is_pass, records[task_id].sim_output)
+        for task_id in task_id_list
+    }
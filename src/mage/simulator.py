@@ -0,0 +1,263 @@
+import contextlib
+import fcntl
+import os
+import shutil
+from abc import ABC, abstractmethod
+from typing import Dict, Iterator, List, Tuple, Type
+
+from .disk_cache import DiskCache
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+
+def format_cmd(cmd_template: List[str], **kwargs: str) -> List[str]:
+    """Fill in cmd_template; arguments formatted to "" are dropped"""
+    args = [arg.format(**kwargs) for arg in cmd_template]
+    return [arg for arg in args if arg]
+
+
+class SimulatorBackend(ABC):
+    """
+    Lint, compile and run commands of a simulator.
+    A build turns source files into an executable in a build directory,
+    which is held by the caller for the whole compile and run.
+    """
+
+    name = ""
+
+    @abstractmethod
+    def lint_cmd(self, rtl_path: str) -> List[str]:
+        pass
+
+    @abstractmethod
+    def compile_cmd(
+        self,
+        source_paths: List[str],
+        build_dir: str,
+        exe_name: str,
+        top: str | None = None,
+    ) -> Tuple[List[str], str]:
+        """Command building source_paths, and the path of the executable it builds"""
+
+    @abstractmethod
+    def run_cmd(self, exe_path: str, plusargs: List[str]) -> List[str]:
+        pass
+
+    @abstractmethod
+    def build_dir(
+        self, output_path_per_run: str, fixed_paths: List[str]
+    ) -> contextlib.AbstractContextManager[str]:
+        """
+        Build directory of a design whose fixed_paths (testbench, golden reference)
+        stay the same across builds while other sources change.
+        """
+
+
+class IverilogBackend(SimulatorBackend):
+    name = "iverilog"
+    LINT_CMD = [
+        "iverilog",
+        "-t",
+        "null",
+        "-Wall",
+        "-Winfloop",
+        "-Wno-timescale",
+        "-g2012",
+        "-o",
+        "/dev/null",
+        "{rtl_path}",
+    ]
+    COMPILE_CMD = [
+        "iverilog",
+        "-Wall",
+        "-Winfloop",
+        "-Wno-timescale",
+        "-g2012",
+        "{top_flag}",
+        "{top}",
+        "-o",
+        "{exe_path}",
+    ]
+    RUN_CMD = ["vvp", "-n", "{exe_path}"]
+
+    def lint_cmd(self, rtl_path: str) -> List[str]:
+        return format_cmd(self.LINT_CMD, rtl_path=rtl_path)
+
+    def compile_cmd(
+        self,
+        source_paths: List[str],
+        build_dir: str,
+        exe_name: str,
+        top: str | None = None,
+    ) -> Tuple[List[str], str]:
+        exe_path = f"{build_dir}/{exe_name}.vvp"
+        cmd = format_cmd(
+            self.COMPILE_CMD,
+            top_flag="-s" if top else "",
+            top=top or "",
+            exe_path=exe_path,
+        )
+        return cmd + [path for path in source_paths if path], exe_path
+
+    def run_cmd(self, exe_path: str, plusargs: List[str]) -> List[str]:
+        return format_cmd(self.RUN_CMD, exe_path=exe_path) + plusargs
+
+    def build_dir(
+        self, output_path_per_run: str, fixed_paths: List[str]
+    ) -> contextlib.AbstractContextManager[str]:
+        # Compiling is cheap: build next to the sources every time
+        return contextlib.nullcontext(output_path_per_run)
+
+
+VERILATOR_BUILD_DEFAULT_PATH = os.path.expanduser("~/.cache/mage/verilator_build")
+# Build directories of least recently used keys beyond this are evicted
+VERILATOR_BUILD_MAX_KEYS = 64
+
+
+class VerilatorBackend(SimulatorBackend):
+    """
+    Verilator compiles to C++ and then to a native executable,
+    which runs long sequential testbenches much faster than vvp.
+    Build directories persist across builds, keyed on the contents of the fixed
+    sources (testbench, golden reference): the Verilator runtime objects are
+    built once per key, and with ccache installed, generated C++ of unchanged
+    modules hits the compiler cache, so mostly the changed rtl.sv is rebuilt.
+    Concurrent builds of one key each take their own slot of the key.
+    Once there are more than max_build_keys keys, the least recently used ones
+    not being built are removed.
+    Note Verilator is 2-state: X / Z related results may differ from iverilog.
+    """
+
+    name = "verilator"
+    COMPILE_FLAGS = [
+        "--timing",
+        "-Wno-fatal",
+        "-Wno-lint",
+        "-Wno-style",
+    ]
+
+    def __init__(
+        self,
+        build_root: str | None = None,
+        max_build_keys: int = VERILATOR_BUILD_MAX_KEYS,
+    ) -> None:
+        self.build_root = build_root or os.environ.get(
+            "MAGE_VERILATOR_BUILD_PATH", VERILATOR_BUILD_DEFAULT_PATH
+        )
+        self.max_build_keys = max_build_keys
+        # Held shared while taking a slot, exclusive while evicting
+        self.evict_lock_path = f"{self.build_root}/evict.lock"
+        self.use_ccache = shutil.which("ccache") is not None
+
+    def lint_cmd(self, rtl_path: str) -> List[str]:
+        return ["verilator", "--lint-only", *self.COMPILE_FLAGS, rtl_path]
+
+    def compile_cmd(
+        self,
+        source_paths: List[str],
+        build_dir: str,
+        exe_name: str,
+        top: str | None = None,
+    ) -> Tuple[List[str], str]:
+        cmd = ["verilator", "--binary", *self.COMPILE_FLAGS]
+        if self.use_ccache:
+            cmd += ["-MAKEFLAGS", "OBJCACHE=ccache"]
+        if top:
+            cmd += ["--top-module", top]
+        cmd += ["--Mdir", build_dir, "-o", exe_name]
+        return cmd + [path for path in source_paths if path], f"{build_dir}/{exe_name}"
+
+    def run_cmd(self, exe_path: str, plusargs: List[str]) -> List[str]:
+        return [exe_path] + plusargs
+
+    @contextlib.contextmanager
+    def build_dir(
+        self, output_path_per_run: str, fixed_paths: List[str]
+    ) -> Iterator[str]:
+        parts: List[str | bytes] = [" ".join(self.COMPILE_FLAGS)]
+        for path in fixed_paths:
+            if path and os.path.isfile(path):
+                with open(path, "rb") as f:
+                    parts.append(f.read())
+        key_dir = f"{self.build_root}/{DiskCache.make_key(*parts)[:32]}"
+        os.makedirs(self.build_root, exist_ok=True)
+        with open(self.evict_lock_path, "w") as evict_lock:
+            fcntl.flock(evict_lock, fcntl.LOCK_SH)
+            is_new_key = not os.path.isdir(key_dir)
+            os.makedirs(key_dir, exist_ok=True)
+            os.utime(key_dir)  # Last use, for eviction
+            slot = 0
+            while True:
+                # flock is released by the OS if the process dies,
+                # so a crashed run never leaves a slot locked
+                lock_file = open(f"{key_dir}/slot_{slot}.lock", "w")
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    lock_file.close()
+                    slot += 1
+        if is_new_key:
+            self.evict_build_dirs()
+        try:
+            slot_dir = f"{key_dir}/slot_{slot}"
+            os.makedirs(slot_dir, exist_ok=True)
+            logger.info(f"Verilator build directory: {slot_dir}")
+            yield slot_dir
+        finally:
+            lock_file.close()
+
+    @staticmethod
+    def is_key_in_use(key_dir: str) -> bool:
+        for name in os.listdir(key_dir):
+            if not name.endswith(".lock"):
+                continue
+            with open(f"{key_dir}/{name}", "w") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return True
+        return False
+
+    def evict_build_dirs(self) -> None:
+        """Remove least recently used build directories beyond max_build_keys"""
+        with open(self.evict_lock_path, "w") as evict_lock:
+            # No slot can be taken meanwhile, so an idle key stays idle
+            fcntl.flock(evict_lock, fcntl.LOCK_EX)
+            key_dirs = [
+                entry.path
+                for entry in os.scandir(self.build_root)
+                if entry.is_dir(follow_symlinks=False)
+            ]
+            evict_cnt = len(key_dirs) - self.max_build_keys
+            if evict_cnt <= 0:
+                return
+            evicted_cnt = 0
+            for key_dir in sorted(key_dirs, key=os.path.getmtime):
+                if evicted_cnt >= evict_cnt:
+                    break
+                if self.is_key_in_use(key_dir):
+                    continue
+                shutil.rmtree(key_dir, ignore_errors=True)
+                evicted_cnt += 1
+        logger.info(f"Evicted {evicted_cnt} Verilator build directories")
+
+
+SIMULATOR_BACKENDS: Dict[str, Type[SimulatorBackend]] = {
+    IverilogBackend.name: IverilogBackend,
+    VerilatorBackend.name: VerilatorBackend,
+}
+
+simulator: SimulatorBackend = IverilogBackend()
+
+
+def set_simulator(name: str) -> None:
+    global simulator
+    assert name in SIMULATOR_BACKENDS, f"Unknown simulator {name}"
+    simulator = SIMULATOR_BACKENDS[name]()
+    logger.info(f"Simulator: {name}")
+
+
+def get_simulator() -> SimulatorBackend:
+    return simulator
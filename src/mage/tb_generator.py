@@ -35,6 +35,9 @@ The testbench should:
 4. Every time when a check occurs, no matter match or mismatch, display input signals, output signals and expected output signals;
 5. When simulation ends, ADD DISPLAY "SIMULATION PASSED" if no mismatch occurs, otherwise display:
     "SIMULATION FAILED - x MISMATCHES DETECTED, FIRST AT TIME y".
+    Only if $value$plusargs("mismatch_ceiling=%d", ...) returns nonzero (the plusarg is given),
+    display the same failure message and $finish as soon as the mismatch count exceeds it;
+    without the plusarg, never finish early;
 6. To avoid ambiguity, please use the reverse edge to do output check. (If RTL runs at posedge, use negedge to check the output)
 7. For pure combinational module (especially those without clk),
     the expected output should be checked at the exact moment when the input is changed;
@@ -70,6 +73,9 @@ In detail, the testbench you generated should:
 3. MAINTAIN the original logic of error counting;
 4. When simulation ends, ADD DISPLAY "SIMULATION PASSED" if no mismatch occurs, otherwise display:
     "SIMULATION FAILED - x MISMATCHES DETECTED, FIRST AT TIME y".
+    Only if $value$plusargs("mismatch_ceiling=%d", ...) returns nonzero (the plusarg is given),
+    display the same failure message and $finish as soon as the mismatch count exceeds it;
+    without the plusarg, never finish early;
 Please also follow the display prompt below:
 {display_prompt}
 
@@ -173,6 +179,7 @@ Remember that if the golden testbench contradicts the input_spec, ALWAYS FOLLOW
 Especially if the input_spec say some input should not exist, but as long as the golden testbench uses it, you should use it.
 Remember to display "SIMULATION PASSED" when simulation ends if no mismatch occurs, otherwise display "SIMULATION FAILED - x MISMATCHES DETECTED, FIRST AT TIME y".
 Remember to add display for the FIRST mismatch, while maintaining the original logic of error counting;
+Remember to $finish early with the failure display once the error count exceeds the plusarg mismatch_ceiling, only if $value$plusargs returns nonzero for it;
 ALWAYS generate the complete testbench, no matter how long it is.
 Generate interface according to golden testbench, even if it contradicts the input_spec. Declare all ports as logic.
 """
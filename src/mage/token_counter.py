@@ -1,20 +1,24 @@
 import asyncio
+import functools
+import math
+import re
 import time
-from typing import Dict, List, Tuple
+from typing import AsyncIterator, Dict, List, Tuple
 
-import tiktoken
-from anthropic.types import Usage
-from llama_index.core.base.llms.types import ChatMessage, ChatResponse
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    MessageRole,
+)
 from llama_index.core.llms.llm import LLM
-from llama_index.llms.anthropic import Anthropic
-from llama_index.llms.openai import OpenAI
-from llama_index.llms.vertex import Vertex
 from pydantic import BaseModel
-from vertexai.preview.generative_models import GenerativeModel
 
 from .gen_config import get_exp_setting
+from .llm_cache import get_llm_cache
 from .log_utils import get_logger
-from .utils import reformat_json_string
+from .rate_limiter import RateLimiter, get_rate_limiter
+from .token_ledger import TokenLedger
+from .utils import is_instance_of, reformat_json_string, run_until_complete
 
 logger = get_logger(__name__)
 
@@ -25,6 +29,63 @@ setting_args = {
 }
 
 
+# Provider LLM classes, checked by is_instance_of so that only the SDK of the
+# provider in use is ever imported
+ANTHROPIC_LLM = ("llama_index.llms.anthropic", "Anthropic")
+OPENAI_LLM = ("llama_index.llms.openai", "OpenAI")
+VERTEX_LLM = ("llama_index.llms.vertex", "Vertex")
+VERTEX_ANTHROPIC_LLM = (
+    f"{__package__}.vertex_anthropic",
+    "VertexAnthropicWithCredentials",
+)
+OPENAI_COMPATIBLE_LLM = (f"{__package__}.openai_compatible", "OpenAICompatible")
+
+OPENAI_COMPATIBLE_ENCODING = "cl100k_base"
+MESSAGE_TOKEN_MEMO_SIZE = 4096
+CHARS_PER_TOKEN = 4  # Rough estimate, for rate limiting and TokenEstimator
+# Words, and each other non-space character, as pieces of a local token estimate
+TOKEN_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_token_cnt(messages: List[ChatMessage]) -> int:
+    return sum(len(message.content or "") for message in messages) // CHARS_PER_TOKEN
+
+
+@functools.lru_cache(maxsize=1024)
+def estimate_str_token_cnt(text: str) -> int:
+    """
+    Local token estimate of text: a word takes a token per CHARS_PER_TOKEN
+    characters, any other non-space character a token of its own.
+    Memoized, as prompts resend the same history on every call.
+    """
+    return sum(
+        math.ceil(len(piece) / CHARS_PER_TOKEN)
+        for piece in TOKEN_PIECE_PATTERN.findall(text)
+    )
+
+
+class TokenEstimator:
+    """Stands in for an encoding without a local tokenizer; counts, never encodes"""
+
+    def count(self, text: str) -> int:
+        return estimate_str_token_cnt(text)
+
+
+def get_llm_provider(llm: LLM) -> str:
+    """Provider name of llm, as in gen_config.get_llm"""
+    if is_instance_of(llm, *VERTEX_ANTHROPIC_LLM):
+        return "vertexanthropic"
+    if is_instance_of(llm, *ANTHROPIC_LLM):
+        return "anthropic"
+    if is_instance_of(llm, *OPENAI_COMPATIBLE_LLM):
+        return "openai_compatible"
+    if is_instance_of(llm, *OPENAI_LLM):
+        return "openai"
+    if is_instance_of(llm, *VERTEX_LLM):
+        return "vertex"
+    return type(llm).__name__.lower()
+
+
 class TokenCount(BaseModel):
     """Token count of an LLM call"""
 
@@ -70,6 +131,41 @@ class TokenCountCached(TokenCount):
         )
 
 
+def load_token_count(dumped: Dict[str, int]) -> TokenCount:
+    """Inverse of TokenCount.model_dump, for both TokenCount classes"""
+    if "cache_read_cnt" in dumped:
+        return TokenCountCached(**dumped)
+    return TokenCount(**dumped)
+
+
+def get_reported_token_cnt(response: ChatResponse) -> TokenCount | None:
+    """Token count reported in the usage of response, if any"""
+    raw = response.raw
+    if isinstance(raw, dict):
+        # Vertex Gemini
+        usage_metadata = getattr(raw.get("_raw_response"), "usage_metadata", None)
+        if usage_metadata is not None and usage_metadata.prompt_token_count:
+            return TokenCount(
+                in_token_cnt=usage_metadata.prompt_token_count,
+                out_token_cnt=usage_metadata.candidates_token_count,
+            )
+        usage = raw.get("usage")  # Anthropic
+    else:
+        usage = getattr(raw, "usage", None)  # OpenAI
+    if usage is None:
+        return None
+    if getattr(usage, "input_tokens", None) is not None:
+        return TokenCount(
+            in_token_cnt=usage.input_tokens, out_token_cnt=usage.output_tokens
+        )
+    if getattr(usage, "prompt_tokens", None) is not None:
+        return TokenCount(
+            in_token_cnt=usage.prompt_tokens,
+            out_token_cnt=usage.completion_tokens or 0,
+        )
+    return None
+
+
 class TokenCost(BaseModel):
     """Token cost of an LLM call"""
 
@@ -116,31 +212,50 @@ class TokenCounter:
 
     def __init__(self, llm: LLM) -> None:
         self.llm = llm
-        self.token_cnts: Dict[str, List[TokenCount]] = {"": []}
-        self.token_cnts_lock = asyncio.Lock()
+        self.token_ledger = TokenLedger()
+        self.token_ledger_lock = asyncio.Lock()
         self.cur_tag = ""
-        self.max_parallel_requests: int = 10
-        self.enable_reformat_json = isinstance(llm, Vertex)
+        # Estimated token count and seconds of LLM calls skipped by early exit
+        self.skipped_cnts: Dict[str, Tuple[TokenCount, float]] = {}
+        # Window of one batch; actual concurrency is set by the shared RateLimiter
+        self.max_parallel_requests: int = self.get_rate_limiter(llm).max_concurrency
+        self.max_overload_retries = 6
+        # Requests so far per prompt, giving the sample index in the LLM cache
+        self.llm_cache_sample_cnts: Dict[str, int] = {}
+        # Token counts by message role and content. A chat resends its whole
+        # history every round, and the memo outlives reset(), so prompts shared
+        # by tasks (system prompts, examples) are tokenized once per process.
+        self.count_message = functools.lru_cache(maxsize=MESSAGE_TOKEN_MEMO_SIZE)(
+            self.count_role_content
+        )
+        self.enable_reformat_json = is_instance_of(llm, *VERTEX_LLM)
         model = llm.metadata.model_name
-        if isinstance(llm, OpenAI):
+        if is_instance_of(llm, *OPENAI_COMPATIBLE_LLM):
+            import tiktoken
+
+            # Served models have their own tokenizers: counts are approximate
+            try:
+                self.encoding = tiktoken.get_encoding(OPENAI_COMPATIBLE_ENCODING)
+            except Exception as e:
+                # tiktoken downloads encodings, which fails on offline hosts
+                logger.warning(
+                    f"Cannot load tiktoken encoding {OPENAI_COMPATIBLE_ENCODING}: {e}. "
+                    "Estimating token counts from lengths"
+                )
+                self.encoding = TokenEstimator()
+        elif is_instance_of(llm, *OPENAI_LLM):
+            import tiktoken
+
             self.encoding = tiktoken.encoding_for_model(model)
-        elif isinstance(llm, Anthropic):
+        elif is_instance_of(llm, *ANTHROPIC_LLM):
             self.encoding = llm.tokenizer
-        elif isinstance(llm, Vertex):
+        elif is_instance_of(llm, *VERTEX_LLM):
             assert llm.model.startswith(
                 "gemini"
             ), f"Non-gemini Vertex model is not supported: {llm.model}"
-            assert isinstance(llm._client, GenerativeModel)
-
-            class VertexEncoding:
-                def __init__(self, client: GenerativeModel):
-                    self.client = client
-
-                def encode(self, text: str) -> List[str]:
-                    token_len = self.client.count_tokens(text).total_tokens
-                    return ["placeholder" for _ in range(token_len)]
-
-            self.encoding = VertexEncoding(llm._client)
+            # Gemini responses report usage metadata (see get_reported_token_cnt);
+            # counting with its tokenizer would take a count_tokens RPC per call
+            self.encoding = TokenEstimator()
             self.activate_structure_output = True
         else:
             logger.warning(
@@ -162,32 +277,179 @@ class TokenCounter:
 
     def set_cur_tag(self, tag: str) -> None:
         self.cur_tag = tag
-        if tag not in self.token_cnts:
-            self.token_cnts[tag] = []
 
     def count(self, string: str) -> int:
         if self.encoding is None:
             return 0
+        if isinstance(self.encoding, TokenEstimator):
+            return self.encoding.count(string)
         return len(self.encoding.encode(string))
 
+    def count_role_content(self, role: str, content: str) -> int:
+        return self.count(f"{role}: {content}")
+
+    def count_messages(self, messages: List[ChatMessage]) -> int:
+        """Prompt token count of messages, summed over memoized message counts"""
+        return sum(
+            self.count_message(message.role.value, message.content or "")
+            for message in messages
+        )
+
+    def count_response(
+        self, messages: List[ChatMessage], response: ChatResponse
+    ) -> TokenCount:
+        """Token count of a chat: usage reported in response, else counted locally"""
+        reported_cnt = get_reported_token_cnt(response)
+        if reported_cnt is not None:
+            return reported_cnt
+        return TokenCount(
+            in_token_cnt=self.count_messages(messages),
+            out_token_cnt=self.count(response.message.content),
+        )
+
     def reset(self) -> None:
-        self.token_cnts = {"": []}
+        self.token_ledger = TokenLedger(keep_log=self.token_ledger.keep_log)
+        self.skipped_cnts = {}
+        self.llm_cache_sample_cnts = {}
+
+    def dump_token_cnts(self) -> Dict[str, Dict[str, List[float]]]:
+        return self.token_ledger.dump()
+
+    def load_token_cnts(
+        self,
+        dumped: Dict[str, Dict[str, List[float]]] | Dict[str, List[Dict[str, int]]],
+    ) -> None:
+        """Inverse of dump_token_cnts; also takes the former list of counts per tag"""
+        keep_log = self.token_ledger.keep_log
+        if all(isinstance(columns, dict) for columns in dumped.values()):
+            self.token_ledger = TokenLedger.load(dumped, keep_log=keep_log)  # type: ignore
+            return
+        self.token_ledger = TokenLedger(keep_log=keep_log)
+        for tag, token_cnts in dumped.items():
+            for token_cnt in token_cnts:
+                self.token_ledger.add(tag, token_cnt, timestamp=0.0)  # type: ignore
+
+    def record_token_cnt(self, token_cnt: TokenCount, latency: float) -> None:
+        self.token_ledger.add(self.cur_tag, token_cnt.model_dump(), latency=latency)
+
+    def make_token_cnt(self, totals: Dict[str, int]) -> TokenCount:
+        return TokenCount(
+            in_token_cnt=totals["in_token_cnt"], out_token_cnt=totals["out_token_cnt"]
+        )
+
+    def get_llm_cache_key(self, messages: List[ChatMessage], llm: LLM) -> str | None:
+        """Key of this call in the LLM response cache, None if cache is off"""
+        llm_cache = get_llm_cache()
+        if llm_cache is None:
+            return None
+        prompt_key = llm_cache.get_prompt_key(
+            llm.metadata.model_name, messages, settings.temperature, settings.top_p
+        )
+        sample_idx = self.llm_cache_sample_cnts.get(prompt_key, 0)
+        self.llm_cache_sample_cnts[prompt_key] = sample_idx + 1
+        return llm_cache.get_key(prompt_key, sample_idx)
+
+    def load_llm_cache(
+        self, cache_key: str | None
+    ) -> Tuple[ChatResponse, TokenCount] | None:
+        llm_cache = get_llm_cache()
+        if cache_key is None or llm_cache is None:
+            return None
+        cached = llm_cache.get(cache_key)
+        if cached is None:
+            return None
+        logger.info(f"LLM cache hit: {cache_key}")
+        response = ChatResponse(
+            message=ChatMessage(role=MessageRole.ASSISTANT, content=cached["content"])
+        )
+        return response, load_token_count(cached["token_cnt"])
+
+    def save_llm_cache(
+        self, cache_key: str | None, response: ChatResponse, token_cnt: TokenCount
+    ) -> None:
+        llm_cache = get_llm_cache()
+        if cache_key is None or llm_cache is None:
+            return
+        llm_cache.put(
+            cache_key,
+            {"content": response.message.content, "token_cnt": token_cnt.model_dump()},
+        )
+
+    def get_rate_limiter(self, llm: LLM) -> RateLimiter:
+        return get_rate_limiter(get_llm_provider(llm), llm.metadata.model_name)
+
+    def limited_chat(self, messages: List[ChatMessage], llm: LLM) -> ChatResponse:
+        """llm.chat through the shared rate limiter, retrying on overload"""
+        rate_limiter = self.get_rate_limiter(llm)
+        est_tokens = estimate_token_cnt(messages)
+        for attempt in range(self.max_overload_retries + 1):
+            rate_limiter.acquire(est_tokens)
+            try:
+                response = llm.chat(
+                    messages, top_p=settings.top_p, temperature=settings.temperature
+                )
+            except Exception as e:
+                is_overload = rate_limiter.release_on_error(e)
+                if not is_overload or attempt == self.max_overload_retries:
+                    raise
+                continue
+            except BaseException:
+                # Cancelled (e.g. a batch stopped early) or interrupted:
+                # the slot must still be given back, as the limiter is shared
+                rate_limiter.release_on_cancel()
+                raise
+            rate_limiter.release(
+                est_tokens, est_tokens + estimate_token_cnt([response.message])
+            )
+            return response
+        raise AssertionError("Unreachable")
+
+    async def limited_achat(
+        self, messages: List[ChatMessage], llm: LLM
+    ) -> ChatResponse:
+        """llm.achat through the shared rate limiter, retrying on overload"""
+        rate_limiter = self.get_rate_limiter(llm)
+        est_tokens = estimate_token_cnt(messages)
+        for attempt in range(self.max_overload_retries + 1):
+            await rate_limiter.aacquire(est_tokens)
+            try:
+                response = await llm.achat(
+                    messages, top_p=settings.top_p, temperature=settings.temperature
+                )
+            except Exception as e:
+                is_overload = rate_limiter.release_on_error(e)
+                if not is_overload or attempt == self.max_overload_retries:
+                    raise
+                continue
+            except BaseException:
+                # Cancelled (e.g. a batch stopped early) or interrupted:
+                # the slot must still be given back, as the limiter is shared
+                rate_limiter.release_on_cancel()
+                raise
+            rate_limiter.release(
+                est_tokens, est_tokens + estimate_token_cnt([response.message])
+            )
+            return response
+        raise AssertionError("Unreachable")
 
     def count_chat(
         self, messages: List[ChatMessage], llm: LLM | None = None
     ) -> Tuple[ChatResponse, TokenCount]:
         llm = llm or self.llm
-        in_token_cnt = self.count(llm.messages_to_prompt(messages))
         logger.info(
             "TokenCounter count_chat Triggered at temp: %s, top_p: %s"
             % (settings.temperature, settings.top_p)
         )
-        response = llm.chat(
-            messages, top_p=settings.top_p, temperature=settings.temperature
-        )
-        out_token_cnt = self.count(response.message.content)
-        token_cnt = TokenCount(in_token_cnt=in_token_cnt, out_token_cnt=out_token_cnt)
-        self.token_cnts[self.cur_tag].append(token_cnt)
+        cache_key = self.get_llm_cache_key(messages, llm)
+        cached = self.load_llm_cache(cache_key)
+        start_time = time.monotonic()
+        if cached is not None:
+            response, token_cnt = cached
+        else:
+            response = self.limited_chat(messages, llm)
+            token_cnt = self.count_response(messages, response)
+            self.save_llm_cache(cache_key, response, token_cnt)
+        self.record_token_cnt(token_cnt, time.monotonic() - start_time)
         if self.enable_reformat_json:
             response.message.content = reformat_json_string(response.message.content)
         return (response, token_cnt)
@@ -196,64 +458,96 @@ class TokenCounter:
         self, messages: List[ChatMessage], llm: LLM | None = None
     ) -> Tuple[ChatResponse, TokenCount]:
         llm = llm or self.llm
-        in_token_cnt = self.count(llm.messages_to_prompt(messages))
         logger.info(
             "TokenCounter count_achat Triggered at temp: %s, top_p: %s"
             % (settings.temperature, settings.top_p)
         )
-        response = await llm.achat(
-            messages, top_p=settings.top_p, temperature=settings.temperature
-        )
-        out_token_cnt = self.count(response.message.content)
-        token_cnt = TokenCount(in_token_cnt=in_token_cnt, out_token_cnt=out_token_cnt)
-        async with self.token_cnts_lock:
-            self.token_cnts[self.cur_tag].append(token_cnt)
+        cache_key = self.get_llm_cache_key(messages, llm)
+        cached = self.load_llm_cache(cache_key)
+        start_time = time.monotonic()
+        if cached is not None:
+            response, token_cnt = cached
+        else:
+            response = await self.limited_achat(messages, llm)
+            token_cnt = self.count_response(messages, response)
+            self.save_llm_cache(cache_key, response, token_cnt)
+        async with self.token_ledger_lock:
+            self.record_token_cnt(token_cnt, time.monotonic() - start_time)
         if self.enable_reformat_json:
             response.message.content = reformat_json_string(response.message.content)
         return (response, token_cnt)
 
+    async def count_achat_stream(
+        self, chat_inputs: List[List[ChatMessage]], llm: LLM | None = None
+    ) -> AsyncIterator[Tuple[int, Tuple[ChatResponse, TokenCount]]]:
+        """
+        Sliding window over chat_inputs: at most max_parallel_requests in flight,
+        and a new request starts as soon as any one finishes.
+        Yield (index in chat_inputs, result) in completion order.
+        """
+        llm = llm or self.llm
+        semaphore = asyncio.Semaphore(self.max_parallel_requests)
+
+        async def run(
+            i: int, chat_input: List[ChatMessage]
+        ) -> Tuple[int, Tuple[ChatResponse, TokenCount]]:
+            async with semaphore:
+                return i, await self.count_achat(llm=llm, messages=chat_input)
+
+        tasks = [
+            asyncio.ensure_future(run(i, chat_input))
+            for i, chat_input in enumerate(chat_inputs)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # Consumer stopped early or failed: drop requests still in flight
+            for task in tasks:
+                task.cancel()
+            # Let cancelled requests give back their rate limiter slots now
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     async def count_achat_batch(
         self, chat_inputs: List[List[ChatMessage]], llm: LLM | None = None
     ) -> List[Tuple[ChatResponse, TokenCount]]:
-        llm = llm or self.llm
-        results = []
-        for i in range(0, len(chat_inputs), self.max_parallel_requests):
-            batch = chat_inputs[i : i + self.max_parallel_requests]
-            tasks = [
-                self.count_achat(llm=llm, messages=chat_input) for chat_input in batch
-            ]
-            batch_results = await asyncio.gather(*tasks)
-            results.extend(batch_results)
-        return results
+        results: List[Tuple[ChatResponse, TokenCount] | None] = [
+            None for _ in chat_inputs
+        ]
+        async for i, result in self.count_achat_stream(chat_inputs, llm=llm):
+            results[i] = result
+        assert all(result is not None for result in results)
+        return results  # type: ignore
 
     def count_chat_batch(
         self, chat_inputs: List[List[ChatMessage]], llm: LLM | None = None
     ) -> List[Tuple[ChatResponse, TokenCount]]:
         llm = llm or self.llm
-        try:
-            # Get the current event loop
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            # If there is no current event loop, create a new one
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
         start_time = time.time()
-        results = loop.run_until_complete(
+        results = run_until_complete(
             self.count_achat_batch(llm=llm, chat_inputs=chat_inputs)
         )
         logger.info(f"Total batch chat time: {time.time() - start_time:.2f}s")
         return results
 
+    def add_skipped_cnt(self, tag: str, token_cnt: TokenCount, seconds: float) -> None:
+        """Record estimated token count and time of LLM calls that were skipped"""
+        skipped_cnt, skipped_seconds = self.skipped_cnts.get(
+            tag, (TokenCount(in_token_cnt=0, out_token_cnt=0), 0.0)
+        )
+        self.skipped_cnts[tag] = (skipped_cnt + token_cnt, skipped_seconds + seconds)
+
+    def log_skipped_stats(self) -> None:
+        for tag, (skipped_cnt, skipped_seconds) in self.skipped_cnts.items():
+            logger.info(
+                f"{tag + ' saved cnt':<25}: {skipped_cnt}, {skipped_seconds:.1f}s (estimated)"
+            )
+
     def log_token_stats(self) -> None:
-        total_sum_cnt = TokenCount(in_token_cnt=0, out_token_cnt=0)
-        for tag in self.token_cnts:
-            token_cnt = self.token_cnts[tag]
-            if not token_cnt:
-                continue
-            sum_cnt = sum(token_cnt, start=TokenCount(in_token_cnt=0, out_token_cnt=0))
-            assert isinstance(sum_cnt, TokenCount)
-            total_sum_cnt += sum_cnt
+        for tag in self.token_ledger.tags():
+            sum_cnt = self.make_token_cnt(self.token_ledger.get_totals(tag))
             logger.info(f"{tag + ' cnt':<25}: {sum_cnt}")
+        total_sum_cnt = self.make_token_cnt(self.token_ledger.get_totals())
         logger.info((f"{'Total cnt':<25}: {total_sum_cnt}"))
         if self.token_cost:
             total_cost = (
@@ -261,31 +555,17 @@ class TokenCounter:
                 + total_sum_cnt.out_token_cnt * self.token_cost.out_token_cost_per_token
             )
             logger.info(f"{'Total cost':<25}: ${total_cost:.2f} USD")
+        self.log_skipped_stats()
 
     def get_sum_count(self, tag: str | None = None) -> TokenCount:
         # If have tag: return sum of token counts with that tag
         # If no tag: return sum of all token counts
-        if tag:
-            token_cnt = self.token_cnts[tag]
-            sum_cnt = sum(token_cnt, start=TokenCount(in_token_cnt=0, out_token_cnt=0))
-        else:
-            sum_cnt = TokenCount(in_token_cnt=0, out_token_cnt=0)
-            for token_cnt in self.token_cnts.values():
-                sum_cnt += sum(
-                    token_cnt, start=TokenCount(in_token_cnt=0, out_token_cnt=0)
-                )
-        assert isinstance(sum_cnt, TokenCount)
-        return sum_cnt
+        return self.make_token_cnt(self.token_ledger.get_totals(tag or None))
 
     def get_total_token(self) -> int:
         """Return token number regarding to token limit"""
-        sum_cnt = TokenCount(in_token_cnt=0, out_token_cnt=0)
-        for token_cnt in self.token_cnts.values():
-            tag_cnt = sum(token_cnt, start=TokenCount(in_token_cnt=0, out_token_cnt=0))
-            assert isinstance(tag_cnt, TokenCount)
-            sum_cnt += tag_cnt
-        assert isinstance(sum_cnt, TokenCount)
-        return sum_cnt.in_token_cnt + sum_cnt.out_token_cnt
+        totals = self.token_ledger.get_totals()
+        return totals["in_token_cnt"] + totals["out_token_cnt"]
 
 
 class TokenCounterCached(TokenCounter):
@@ -293,7 +573,7 @@ class TokenCounterCached(TokenCounter):
 
     def __init__(self, llm: LLM) -> None:
         super().__init__(llm)
-        assert isinstance(llm, Anthropic)
+        assert is_instance_of(llm, *ANTHROPIC_LLM)
         self.write_cost_ratio: float = 1.25
         self.read_cost_ratio: float = 0.1
         self.enable_cache = True
@@ -301,6 +581,9 @@ class TokenCounterCached(TokenCounter):
     def set_enable_cache(self, enable_cache: bool) -> None:
         self.enable_cache = enable_cache
 
+    def make_token_cnt(self, totals: Dict[str, int]) -> TokenCountCached:
+        return TokenCountCached(**totals)
+
     def equivalent_cost(self, token_count_cached: TokenCountCached) -> TokenCount:
         equi_cost = round(
             token_count_cached.in_token_cnt
@@ -314,27 +597,17 @@ class TokenCounterCached(TokenCounter):
 
     @classmethod
     def is_cache_enabled(cls, llm: LLM) -> bool:
-        return isinstance(llm, Anthropic)
+        return is_instance_of(llm, *ANTHROPIC_LLM)
 
     def add_cache_tag(self, target: ChatMessage) -> None:
         target.additional_kwargs["cache_control"] = {"type": "ephemeral"}
 
-    def count_chat(
-        self, messages: List[ChatMessage], llm: LLM | None = None
-    ) -> Tuple[ChatResponse, TokenCountCached]:
-        llm = llm or self.llm
-        logger.info(
-            "TokenCounterCached count_chat Triggered at temp: %s, top_p: %s"
-            % (settings.temperature, settings.top_p)
-        )
-        response = llm.chat(
-            messages,
-            top_p=settings.top_p,
-            temperature=settings.temperature,
-        )
+    def get_usage_token_cnt(self, response: ChatResponse) -> TokenCountCached:
+        from anthropic.types import Usage
+
         usage = response.raw["usage"]
         assert isinstance(usage, Usage), f"Unknown usage type: {type(usage)}"
-        token_cnt = TokenCountCached(
+        return TokenCountCached(
             in_token_cnt=usage.input_tokens,
             out_token_cnt=usage.output_tokens,
             cache_write_cnt=(
@@ -348,7 +621,26 @@ class TokenCounterCached(TokenCounter):
                 else 0
             ),
         )
-        self.token_cnts[self.cur_tag].append(token_cnt)
+
+    def count_chat(
+        self, messages: List[ChatMessage], llm: LLM | None = None
+    ) -> Tuple[ChatResponse, TokenCountCached]:
+        llm = llm or self.llm
+        logger.info(
+            "TokenCounterCached count_chat Triggered at temp: %s, top_p: %s"
+            % (settings.temperature, settings.top_p)
+        )
+        cache_key = self.get_llm_cache_key(messages, llm)
+        cached = self.load_llm_cache(cache_key)
+        start_time = time.monotonic()
+        if cached is not None:
+            response, token_cnt = cached
+        else:
+            response = self.limited_chat(messages, llm)
+            token_cnt = self.get_usage_token_cnt(response)
+            self.save_llm_cache(cache_key, response, token_cnt)
+        assert isinstance(token_cnt, TokenCountCached)
+        self.record_token_cnt(token_cnt, time.monotonic() - start_time)
         if self.enable_reformat_json:
             response.message.content = reformat_json_string(response.message.content)
         return (response, token_cnt)
@@ -361,45 +653,25 @@ class TokenCounterCached(TokenCounter):
             "TokenCounterCached count_achat Triggered at temp: %s, top_p: %s"
             % (settings.temperature, settings.top_p)
         )
-        response = await llm.achat(
-            messages,
-            top_p=settings.top_p,
-            temperature=settings.temperature,
-        )
-        usage = response.raw["usage"]
-        assert isinstance(usage, Usage), f"Unknown usage type: {type(usage)}"
-        token_cnt = TokenCountCached(
-            in_token_cnt=usage.input_tokens,
-            out_token_cnt=usage.output_tokens,
-            cache_write_cnt=(
-                usage.cache_creation_input_tokens
-                if hasattr(usage, "cache_creation_input_tokens")
-                else 0
-            ),
-            cache_read_cnt=(
-                usage.cache_read_input_tokens
-                if hasattr(usage, "cache_read_input_tokens")
-                else 0
-            ),
-        )
-        async with self.token_cnts_lock:
-            self.token_cnts[self.cur_tag].append(token_cnt)
+        cache_key = self.get_llm_cache_key(messages, llm)
+        cached = self.load_llm_cache(cache_key)
+        start_time = time.monotonic()
+        if cached is not None:
+            response, token_cnt = cached
+        else:
+            response = await self.limited_achat(messages, llm)
+            token_cnt = self.get_usage_token_cnt(response)
+            self.save_llm_cache(cache_key, response, token_cnt)
+        assert isinstance(token_cnt, TokenCountCached)
+        async with self.token_ledger_lock:
+            self.record_token_cnt(token_cnt, time.monotonic() - start_time)
         if self.enable_reformat_json:
             response.message.content = reformat_json_string(response.message.content)
         return (response, token_cnt)
 
     def log_token_stats(self) -> None:
-        total_sum_cnt = TokenCountCached(in_token_cnt=0, out_token_cnt=0)
-        for tag in self.token_cnts:
-            token_cnt = self.token_cnts[tag]
-            if not token_cnt:
-                continue
-            sum_cnt = sum(
-                token_cnt, start=TokenCountCached(in_token_cnt=0, out_token_cnt=0)
-            )
-            assert isinstance(sum_cnt, TokenCountCached)
-
-            total_sum_cnt += sum_cnt
+        for tag in self.token_ledger.tags():
+            sum_cnt = self.make_token_cnt(self.token_ledger.get_totals(tag))
             sum_equal_cnt = self.equivalent_cost(sum_cnt)
 
             if sum_cnt.cache_write_cnt or sum_cnt.cache_read_cnt:
@@ -408,6 +680,7 @@ class TokenCounterCached(TokenCounter):
             else:
                 logger.info(f"{tag + ' cnt':<25}: {sum_equal_cnt}")
 
+        total_sum_cnt = self.make_token_cnt(self.token_ledger.get_totals())
         total_sum_equal_cnt = self.equivalent_cost(total_sum_cnt)
         if total_sum_cnt.cache_write_cnt or total_sum_cnt.cache_read_cnt:
             saved_tokens = round(
@@ -428,39 +701,16 @@ class TokenCounterCached(TokenCounter):
                 * self.token_cost.out_token_cost_per_token
             )
             logger.info(f"{'Total cost':<25}: ${total_cost:.2f} USD")
+        self.log_skipped_stats()
 
-    def get_sum_count_cached(self, tag: str | None = None) -> TokenCount:
+    def get_sum_count_cached(self, tag: str | None = None) -> TokenCountCached:
         # If have tag: return sum of token counts with that tag
         # If no tag: return sum of all token counts
-        if tag:
-            token_cnt = self.token_cnts[tag]
-            sum_cnt = sum(
-                token_cnt, start=TokenCountCached(in_token_cnt=0, out_token_cnt=0)
-            )
-        else:
-            sum_cnt = TokenCountCached(in_token_cnt=0, out_token_cnt=0)
-            for token_cnt in self.token_cnts.values():
-                sum_cnt += sum(
-                    token_cnt, start=TokenCountCached(in_token_cnt=0, out_token_cnt=0)
-                )
-        assert isinstance(sum_cnt, TokenCount)
-        return sum_cnt
+        return self.make_token_cnt(self.token_ledger.get_totals(tag or None))
 
     def get_sum_count(self, tag: str | None = None) -> TokenCount:
-        sum_cnt_cached = self.get_sum_count_cached(tag)
-        sum_cnt = (
-            self.equivalent_cost(sum_cnt_cached)
-            if isinstance(sum_cnt_cached, TokenCountCached)
-            else sum_cnt_cached
-        )
-        return sum_cnt
+        return self.equivalent_cost(self.get_sum_count_cached(tag))
 
     def get_total_token(self) -> int:
         """Return token number regarding to token limit"""
-        sum_cnt_cached = self.get_sum_count_cached()
-        sum_token_cnt = sum_cnt_cached.in_token_cnt + sum_cnt_cached.out_token_cnt
-        if isinstance(sum_cnt_cached, TokenCountCached):
-            sum_token_cnt += (
-                sum_cnt_cached.cache_write_cnt + sum_cnt_cached.cache_read_cnt
-            )
-        return sum_token_cnt
+        return sum(self.token_ledger.get_totals().values())
@@ -0,0 +1,113 @@
+import time
+from array import array
+from typing import Any, Dict, List
+
+# Token count fields of a call, as in TokenCount / TokenCountCached
+TOKEN_FIELDS = ("in_token_cnt", "out_token_cnt", "cache_write_cnt", "cache_read_cnt")
+# Columns of the call log: token counts, then seconds of the call and Unix time
+LOG_COLUMNS = TOKEN_FIELDS + ("latency", "timestamp")
+
+
+def make_log() -> Dict[str, array]:
+    return {
+        column: array("q" if column in TOKEN_FIELDS else "d") for column in LOG_COLUMNS
+    }
+
+
+class TokenLedger:
+    """
+    Token accounting of LLM calls by tag.
+    Running totals per tag and overall make every aggregate O(1).
+    With keep_log, each call is also appended to a columnar log per tag
+    (typed arrays of token counts, latency and timestamp) for analysis.
+    """
+
+    def __init__(self, keep_log: bool = True) -> None:
+        self.keep_log = keep_log
+        self.totals: Dict[str, List[int]] = {}
+        self.call_cnts: Dict[str, int] = {}
+        self.total: List[int] = [0 for _ in TOKEN_FIELDS]
+        self.total_call_cnt = 0
+        self.logs: Dict[str, Dict[str, array]] = {}
+
+    def add(
+        self,
+        tag: str,
+        token_cnts: Dict[str, int],
+        latency: float = 0.0,
+        timestamp: float | None = None,
+    ) -> None:
+        """Record a call; token_cnts maps TOKEN_FIELDS, missing ones are 0"""
+        tag_total = self.totals.setdefault(tag, [0 for _ in TOKEN_FIELDS])
+        for i, field in enumerate(TOKEN_FIELDS):
+            cnt = token_cnts.get(field, 0)
+            tag_total[i] += cnt
+            self.total[i] += cnt
+        self.call_cnts[tag] = self.call_cnts.get(tag, 0) + 1
+        self.total_call_cnt += 1
+        if not self.keep_log:
+            return
+        log = self.logs.setdefault(tag, make_log())
+        for field in TOKEN_FIELDS:
+            log[field].append(token_cnts.get(field, 0))
+        log["latency"].append(latency)
+        log["timestamp"].append(time.time() if timestamp is None else timestamp)
+
+    def tags(self) -> List[str]:
+        """Tags with calls, in order of their first call"""
+        return list(self.totals)
+
+    def get_totals(self, tag: str | None = None) -> Dict[str, int]:
+        """Sum of token counts of tag, or of all tags"""
+        total = self.total if tag is None else self.totals.get(tag)
+        if total is None:
+            return {field: 0 for field in TOKEN_FIELDS}
+        return dict(zip(TOKEN_FIELDS, total))
+
+    def get_call_cnt(self, tag: str | None = None) -> int:
+        return self.total_call_cnt if tag is None else self.call_cnts.get(tag, 0)
+
+    def to_columns(self) -> Dict[str, List[Any]]:
+        """Call log of all tags as columns (tag + LOG_COLUMNS), e.g. for a DataFrame"""
+        columns: Dict[str, List[Any]] = {"tag": []}
+        columns.update({column: [] for column in LOG_COLUMNS})
+        for tag, log in self.logs.items():
+            columns["tag"] += [tag] * len(log["timestamp"])
+            for column in LOG_COLUMNS:
+                columns[column] += log[column].tolist()
+        return columns
+
+    def dump(self) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Columns of each tag. Without the log, a tag dumps its totals
+        as a single call.
+        """
+        if self.keep_log:
+            return {
+                tag: {column: log[column].tolist() for column in LOG_COLUMNS}
+                for tag, log in self.logs.items()
+            }
+        return {
+            tag: {
+                **{field: [cnt] for field, cnt in zip(TOKEN_FIELDS, total)},
+                "latency": [0.0],
+                "timestamp": [0.0],
+            }
+            for tag, total in self.totals.items()
+        }
+
+    @classmethod
+    def load(
+        cls, dumped: Dict[str, Dict[str, List[float]]], keep_log: bool = True
+    ) -> "TokenLedger":
+        """Inverse of dump"""
+        ledger = cls(keep_log=keep_log)
+        for tag, columns in dumped.items():
+            for i in range(len(columns["timestamp"])):
+                ledger.add(
+                    tag,
+                    {field: int(columns[field][i]) for field in TOKEN_FIELDS},
+                    latency=columns["latency"][i],
+                    timestamp=columns["timestamp"][i],
+                )
+        return ledger
@@ -1,7 +1,31 @@
+import asyncio
 import re
+import sys
+from typing import Any, Coroutine, TypeVar
 
-import anthropic
-from llama_index.llms.anthropic import Anthropic
+T = TypeVar("T")
+
+
+def run_until_complete(coro: Coroutine[Any, Any, T]) -> T:
+    """Run coro to completion on the current event loop of this thread"""
+    try:
+        # Get the current event loop
+        loop = asyncio.get_event_loop()
+    except RuntimeError:
+        # If there is no current event loop, create a new one
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+    return loop.run_until_complete(coro)
+
+
+def is_instance_of(obj: object, module_name: str, class_name: str) -> bool:
+    """
+    isinstance(obj, module_name.class_name) without importing module_name:
+    obj cannot be of a class whose module is not imported yet.
+    Keeps provider SDKs unimported until a provider is used.
+    """
+    module = sys.modules.get(module_name)
+    return module is not None and isinstance(obj, getattr(module, class_name))
 
 
 def add_lineno(file_content: str) -> str:
@@ -30,37 +54,11 @@ def reformat_json_string(output: str) -> str:
     return output.strip()
 
 
-class VertexAnthropicWithCredentials(Anthropic):
-    def __init__(self, credentials, **kwargs):
-        """
-        In addition to all parameters accepted by Anthropic, this class accepts a
-        new parameter `credentials` that will be passed to the underlying clients.
-        """
-        # Pop parameters that determine client type so we can reuse them in our branch.
-        region = kwargs.get("region")
-        project_id = kwargs.get("project_id")
-        aws_region = kwargs.get("aws_region")
-
-        # Call the parent initializer; this sets up a default _client and _aclient.
-        super().__init__(**kwargs)
+def __getattr__(name: str) -> Any:
+    # Moved to vertex_anthropic; still importable from here
+    # without importing the Anthropic SDK along with utils
+    if name == "VertexAnthropicWithCredentials":
+        from .vertex_anthropic import VertexAnthropicWithCredentials
 
-        # If using AnthropicVertex (i.e., region and project_id are provided and aws_region is None),
-        # override the _client and _aclient with the additional credentials parameter.
-        if region and project_id and not aws_region:
-            self._client = anthropic.AnthropicVertex(
-                region=region,
-                project_id=project_id,
-                credentials=credentials,  # extra argument
-                timeout=self.timeout,
-                max_retries=self.max_retries,
-                default_headers=kwargs.get("default_headers"),
-            )
-            self._aclient = anthropic.AsyncAnthropicVertex(
-                region=region,
-                project_id=project_id,
-                credentials=credentials,  # extra argument
-                timeout=self.timeout,
-                max_retries=self.max_retries,
-                default_headers=kwargs.get("default_headers"),
-            )
-        # Optionally, you could add similar overrides for the aws_region branch if needed.
+        return VertexAnthropicWithCredentials
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,82 @@
+import filecmp
+import os
+import shutil
+import tempfile
+from typing import List
+
+from .log_utils import get_logger
+
+logger = get_logger(__name__)
+
+# Files of a run kept in its output directory; everything else is scratch
+FINAL_ARTIFACTS = ["tb.sv", "if.sv", "rtl.sv"]
+
+
+def get_default_workspace_root() -> str | None:
+    """/dev/shm when available, else None for the system temporary directory"""
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return None
+
+
+workspace_root: str | None = get_default_workspace_root()
+
+
+def set_workspace_root(root: str | None) -> None:
+    """Where workspaces are created. None uses the system temporary directory."""
+    global workspace_root
+    workspace_root = root
+
+
+def get_workspace_root() -> str | None:
+    return workspace_root
+
+
+class Workspace:
+    """
+    Scratch directory of a run, on RAM-backed storage by default,
+    where all intermediate writes, compiles and simulations happen.
+    Only final artifacts are copied to the output directory,
+    on sync() and when the workspace is closed, which also removes it.
+    Artifacts already in the output directory are copied in on creation,
+    so a resumed run starts from them.
+    """
+
+    def __init__(
+        self, output_dir_per_run: str, artifacts: List[str] = FINAL_ARTIFACTS
+    ) -> None:
+        self.output_dir_per_run = output_dir_per_run
+        self.artifacts = artifacts
+        self.path = tempfile.mkdtemp(
+            prefix=f"mage_{os.path.basename(os.path.abspath(output_dir_per_run))}_",
+            dir=workspace_root,
+        )
+        logger.info(f"Workspace of {output_dir_per_run}: {self.path}")
+        for name in self.artifacts:
+            src = f"{output_dir_per_run}/{name}"
+            if os.path.isfile(src):
+                shutil.copyfile(src, f"{self.path}/{name}")
+
+    def sync(self) -> None:
+        """Copy changed final artifacts to the output directory"""
+        for name in self.artifacts:
+            src = f"{self.path}/{name}"
+            dst = f"{self.output_dir_per_run}/{name}"
+            if not os.path.isfile(src):
+                continue
+            if os.path.isfile(dst) and filecmp.cmp(src, dst, shallow=False):
+                continue
+            shutil.copyfile(src, f"{dst}.tmp")
+            os.replace(f"{dst}.tmp", dst)
+
+    def close(self) -> None:
+        try:
+            self.sync()
+        finally:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self) -> "Workspace":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
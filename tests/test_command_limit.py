@@ -0,0 +1,50 @@
+import asyncio
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mage.bash_tools import (
+    arun_command,
+    get_max_concurrent_commands,
+    run_command,
+    set_max_concurrent_commands,
+)
+
+SLEEP_CMD = [sys.executable, "-c", "import time; time.sleep(0.3)"]
+
+
+@pytest.fixture
+def two_command_slots():
+    max_concurrent = get_max_concurrent_commands()
+    set_max_concurrent_commands(2)
+    yield
+    set_max_concurrent_commands(max_concurrent)
+
+
+def test_limit_shared_by_threads_and_event_loops(two_command_slots):
+    def run(i: int) -> bool:
+        if i % 2:
+            # Each thread runs its own event loop
+            return asyncio.run(arun_command(SLEEP_CMD)).is_success
+        return run_command(SLEEP_CMD).is_success
+
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        assert all(executor.map(run, range(6)))
+    # Three rounds of two commands
+    assert time.monotonic() - start_time >= 0.9
+
+
+def test_cancel_while_waiting_for_slot(two_command_slots):
+    cancel_event = threading.Event()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        busy = [executor.submit(run_command, SLEEP_CMD) for _ in range(2)]
+        time.sleep(0.1)
+        waiting = executor.submit(run_command, SLEEP_CMD, cancel_event=cancel_event)
+        cancel_event.set()
+        result = waiting.result()
+        assert result.is_cancelled and result.returncode is None
+        assert all(future.result().is_success for future in busy)
@@ -0,0 +1,81 @@
+import json
+import sqlite3
+
+from mage.disk_cache import DiskCache
+
+
+def get_sum_size(cache: DiskCache) -> int:
+    (sum_size,) = (
+        cache.get_connection()
+        .execute(f"SELECT COALESCE(SUM(size), 0) FROM {cache.table}")
+        .fetchone()
+    )
+    return sum_size
+
+
+def test_put_get(tmp_path):
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"))
+    assert cache.get("missing") is None
+    cache.put("a", {"x": [1, 2], "y": "z"})
+    cache.put("b", 3)
+    assert cache.get("a") == {"x": [1, 2], "y": "z"}
+    assert cache.get("b") == 3
+    cache.put("a", "replaced")
+    assert cache.get("a") == "replaced"
+    # Running total follows replaces
+    assert cache.get_total_size() == get_sum_size(cache)
+    cache.clear()
+    assert cache.get("b") is None
+    assert cache.get_total_size() == 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    value = "v" * 98  # 100 bytes as JSON
+    cache = DiskCache(str(tmp_path / "cache.sqlite3"), max_size_bytes=300)
+    for key in ("a", "b", "c"):
+        cache.put(key, value)
+    assert cache.get("a") == value  # "b" is now the least recently used
+    cache.put("d", value)
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in ("a", "c", "d")] == [value] * 3
+    assert cache.get_total_size() == get_sum_size(cache) == 300
+
+
+def test_total_shared_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    DiskCache(path).put("a", "x" * 10)
+    cache = DiskCache(path, max_size_bytes=20)
+    cache.put("b", "y" * 10)
+    assert cache.get("a") is None
+    assert cache.get_total_size() == get_sum_size(cache) == len(json.dumps("y" * 10))
+
+
+def test_total_of_cache_file_without_total_table(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskCache(path)
+    cache.put("a", "x" * 10)
+    conn = sqlite3.connect(path)
+    conn.execute(f"DROP TABLE {cache.table}_total")
+    conn.commit()
+    conn.close()
+    assert DiskCache(path).get_total_size() == len(json.dumps("x" * 10))
+
+
+def test_corrupt_row_is_a_miss_and_dropped(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = DiskCache(path)
+    cache.put("a", {"x": 1})
+    cache.put("b", {"y": 2})
+    conn = sqlite3.connect(path)
+    conn.execute(f"UPDATE {cache.table} SET value = '{{\"x\": ' WHERE key = 'a'")
+    conn.commit()
+    conn.close()
+    assert cache.get("a") is None
+    (row_cnt,) = (
+        cache.get_connection()
+        .execute(f"SELECT COUNT(*) FROM {cache.table} WHERE key = 'a'")
+        .fetchone()
+    )
+    assert row_cnt == 0
+    assert cache.get("b") == {"y": 2}
+    assert cache.get_total_size() == get_sum_size(cache)
@@ -0,0 +1,72 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+import mage.sim_reviewer as sim_reviewer
+from mage.benchmark_read_helper import TypeBenchmark
+from mage.sim_reviewer import (
+    GOLDEN_REVIEW_RESULTS_FILE_NAME,
+    get_sim_settings,
+    load_golden_review_results,
+    set_sim_settings,
+    sim_review_golden_benchmark_batch,
+)
+
+
+@pytest.fixture
+def restore_sim_settings():
+    settings = get_sim_settings()
+    yield
+    set_sim_settings(settings)
+
+
+def test_spawn_workers_get_sim_settings(tmp_path, restore_sim_settings):
+    set_sim_settings(
+        get_sim_settings().model_copy(
+            update={
+                "sim_cache_path": str(tmp_path / "sim_cache.sqlite3"),
+                "syntax_check_verilator_lint": True,
+            }
+        )
+    )
+    sim_reviewer.set_resource_limits(file_size_bytes=1 << 20)
+    sim_reviewer.set_output_limits(head_lines=7)
+    settings = get_sim_settings()
+    with ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=set_sim_settings,
+        initargs=(settings,),
+    ) as executor:
+        assert executor.submit(get_sim_settings).result() == settings
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_raising_task_recorded_and_batch_continues(tmp_path, max_workers):
+    log_path = tmp_path / "log"
+    log_path.mkdir()
+    # The log directory of task "bad" cannot be created, so its review raises
+    (log_path / "golden_review_VERILOG_EVAL_V2_bad").write_text("")
+    output_path = tmp_path / "output"
+    (output_path / "VERILOG_EVAL_V2_good").mkdir(parents=True)
+    (output_path / "VERILOG_EVAL_V2_good" / "rtl.sv").write_text(
+        "module m;\nendmodule\n"
+    )
+    results = sim_review_golden_benchmark_batch(
+        ["bad", "good"],
+        str(log_path),
+        str(output_path),
+        TypeBenchmark.VERILOG_EVAL_V2,
+        str(tmp_path / "benchmark"),
+        max_workers=max_workers,
+    )
+    assert set(results) == {"bad", "good"}
+    is_pass, result = results["bad"]
+    assert not is_pass and "Exception:" in result.stderr
+    assert "Exception:" not in results["good"][1].stderr
+    records = load_golden_review_results(
+        str(output_path / GOLDEN_REVIEW_RESULTS_FILE_NAME)
+    )
+    assert set(records) == {"bad", "good"}
+    assert records["bad"].rtl_hash == ""
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from llama_index.core.base.llms.types import ChatMessage, MessageRole
+
+from mage.openai_compatible import OpenAICompatible
+from mage.token_counter import TokenCounter
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Chat completions endpoint echoing the last message, with fixed usage"""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_POST(self) -> None:
+        self.server.client_ports.add(self.client_address[1])  # type: ignore
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = f"echo {body['messages'][-1]['content']}"
+        response = json.dumps(
+            {
+                "id": "chatcmpl-0",
+                "object": "chat.completion",
+                "created": 0,
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": 5,
+                    "completion_tokens": 1,
+                    "total_tokens": 6,
+                },
+            }
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.client_ports = set()  # type: ignore
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_llm(server: ThreadingHTTPServer) -> OpenAICompatible:
+    host, port = server.server_address[:2]
+    return OpenAICompatible(
+        model="stand-in", api_key="EMPTY", api_base=f"http://{host}:{port}/v1"
+    )
+
+
+def user_message(content: str) -> ChatMessage:
+    return ChatMessage(role=MessageRole.USER, content=content)
+
+
+def test_sync_chat_shares_one_connection(server):
+    llms = [make_llm(server) for _ in range(3)]
+    for i, llm in enumerate(llms):
+        response = llm.chat([user_message(f"sync {i}")])
+        assert response.message.content == f"echo sync {i}"
+    # Sequential calls of all LLM instances go through one kept-alive connection
+    assert len(server.client_ports) == 1
+
+
+def test_async_chat_reuses_connections(server):
+    llm = make_llm(server)
+
+    async def chat_batch(tag: str) -> None:
+        responses = await asyncio.gather(
+            *[llm.achat([user_message(f"{tag} {i}")]) for i in range(4)]
+        )
+        assert [r.message.content for r in responses] == [
+            f"echo {tag} {i}" for i in range(4)
+        ]
+
+    async def main() -> None:
+        await chat_batch("first")
+        port_cnt = len(server.client_ports)
+        await chat_batch("second")
+        # The second batch on the same loop opens no new connection
+        assert len(server.client_ports) == port_cnt
+
+    asyncio.run(main())
+
+
+def test_token_counts_from_reported_usage(server):
+    llm = make_llm(server)
+    token_counter = TokenCounter(llm)
+    response, token_cnt = token_counter.count_chat([user_message("counted")])
+    assert response.message.content == "echo counted"
+    assert (token_cnt.in_token_cnt, token_cnt.out_token_cnt) == (5, 1)
+
+    async def achat():
+        return await token_counter.count_achat([user_message("counted async")])
+
+    response, token_cnt = asyncio.run(achat())
+    assert response.message.content == "echo counted async"
+    assert (token_cnt.in_token_cnt, token_cnt.out_token_cnt) == (5, 1)
+    assert token_counter.get_total_token() == 12
@@ -0,0 +1,95 @@
+import sys
+
+from mage.bash_tools import OutputCapture, OutputLimits, get_output_limits, run_command
+
+
+def feed_in_chunks(capture: OutputCapture, data: bytes, chunk_size: int) -> None:
+    for i in range(0, len(data), chunk_size):
+        capture.feed(data[i : i + chunk_size])
+    capture.close()
+
+
+def test_head_and_tail():
+    capture = OutputCapture(OutputLimits(head_lines=3, tail_lines=2))
+    data = b"".join(f"l{i}\n".encode() for i in range(10))
+    # Chunks split lines anywhere
+    feed_in_chunks(capture, data, 4)
+    assert capture.get_text() == ("l0\nl1\nl2\n[... 5 lines omitted]\nl8\nl9\n", 5)
+
+
+def test_short_output_kept_whole():
+    capture = OutputCapture(OutputLimits(head_lines=3, tail_lines=2))
+    feed_in_chunks(capture, b"a\nb\nc\nd\n", 3)
+    assert capture.get_text() == ("a\nb\nc\nd\n", 0)
+    capture = OutputCapture(OutputLimits())
+    feed_in_chunks(capture, b"a\nno final newline", 5)
+    assert capture.get_text() == ("a\nno final newline", 0)
+
+
+def test_long_line_truncated():
+    capture = OutputCapture(OutputLimits())
+    max_line_bytes = capture.limits.max_line_bytes
+    assert max_line_bytes == 2048
+    capture.feed(b"short\n")
+    for _ in range(10):
+        capture.feed(b"x" * 1000)
+        # A line without newline yet is not held in full
+        assert len(capture.pending) <= max_line_bytes + 1
+    capture.feed(b"\nafter\n")
+    capture.close()
+    text, omitted_lines = capture.get_text()
+    assert text == ("short\n" + "x" * max_line_bytes + " [... line truncated]\nafter\n")
+    assert omitted_lines == 0
+
+
+def test_keep_pattern_overflow():
+    limits = OutputLimits(head_lines=1, tail_lines=1, keep_lines=2)
+    capture = OutputCapture(limits, keep_pattern=r"^m")
+    feed_in_chunks(capture, b"a\nm1\nb\nm2\nm3\nc\nz\n", 64)
+    text, omitted_lines = capture.get_text()
+    # m3 is past keep_lines, so it is omitted like any middle line
+    assert text == "a\nm1\n[... 1 lines omitted]\nm2\n[... 2 lines omitted]\nz\n"
+    assert omitted_lines == 3
+
+
+def test_match_patterns_first_match():
+    capture = OutputCapture(
+        OutputLimits(head_lines=1, tail_lines=1),
+        match_patterns={"cnt": r"FAILED - (\d+)", "passed": r"PASSED"},
+    )
+    data = b"".join(f"line {i}\n".encode() for i in range(1000))
+    data += b"FAILED - 12 mismatches\nFAILED - 34 mismatches\n"
+    feed_in_chunks(capture, data, 7)
+    assert capture.matches == {"cnt": "12"}
+
+
+def test_stop_after():
+    stops = []
+    capture = OutputCapture(
+        OutputLimits(head_lines=10, keep_lines=1),
+        keep_pattern="m",
+        stop_after=3,
+        on_stop=lambda: stops.append(capture.line_cnt),
+    )
+    # Matches in the head count too, and on_stop is called once
+    feed_in_chunks(capture, b"m\nm\nx\nm\n", 64)
+    assert not capture.is_stopped
+    feed_in_chunks(capture, b"m\nm\n", 64)
+    assert capture.is_stopped and len(stops) == 1
+
+
+def test_omitted_lines_of_both_streams():
+    limits = get_output_limits()
+    result = run_command(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "for i in range(1000): print(i)\n"
+            "for i in range(500): print(i, file=sys.stderr)\n",
+        ]
+    )
+    kept_lines = limits.head_lines + limits.tail_lines
+    assert result.omitted_lines == (1000 - kept_lines) + (500 - kept_lines)
+    assert result.stdout.startswith("0\n1\n")
+    assert result.stdout.endswith("998\n999\n")
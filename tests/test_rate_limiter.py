@@ -0,0 +1,36 @@
+import asyncio
+
+import pytest
+from llama_index.core.base.llms.types import ChatMessage, ChatResponse, MessageRole
+from llama_index.core.llms.mock import MockLLM
+
+from mage.token_counter import TokenCounter
+
+
+class FailingBatchLLM(MockLLM):
+    """Request "fail" raises soon, every other request is still in flight then"""
+
+    async def achat(self, messages, **kwargs):
+        if messages[-1].content == "fail":
+            await asyncio.sleep(0.05)
+            raise ValueError("request failed")
+        await asyncio.sleep(5)
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=""))
+
+
+def test_failed_request_in_stream_releases_all_slots():
+    llm = FailingBatchLLM()
+    token_counter = TokenCounter(llm)
+    rate_limiter = token_counter.get_rate_limiter(llm)
+    chat_inputs = [
+        [ChatMessage(role=MessageRole.USER, content="fail" if i == 2 else f"ok {i}")]
+        for i in range(6)
+    ]
+
+    async def consume() -> None:
+        async for _ in token_counter.count_achat_stream(chat_inputs):
+            pass
+
+    with pytest.raises(ValueError):
+        asyncio.run(consume())
+    assert rate_limiter.in_flight == 0
@@ -0,0 +1,79 @@
+from mage.rtl_canonical import get_rtl_hash
+
+FUNCTION_RTL = """
+module TopModule(input [3:0] a, input b, output [3:0] q);
+  function [3:0] f;
+    input [3:0] x;
+    input y;
+    f = y ? x : ~x;
+  endfunction
+  assign q = f(a, b);
+endmodule
+"""
+
+
+def test_declarations_and_comments_do_not_change_hash():
+    rtl_a = "module m(input a, b, output q);\n  wire x;\n  wire y;\n  assign q = a;\nendmodule"
+    rtl_b = "module m(input a, b, output q); // top\n  wire y; wire x;\n  assign q  =  a;\nendmodule"
+    assert get_rtl_hash(rtl_a) == get_rtl_hash(rtl_b)
+
+
+def test_function_argument_order_changes_hash():
+    swapped = FUNCTION_RTL.replace(
+        "    input [3:0] x;\n    input y;", "    input y;\n    input [3:0] x;"
+    )
+    assert swapped != FUNCTION_RTL
+    assert get_rtl_hash(FUNCTION_RTL) != get_rtl_hash(swapped)
+
+
+def test_task_argument_order_changes_hash():
+    rtl = (
+        "module m;\n  task t;\n    input a;\n    input b;\n    ;\n  endtask\nendmodule"
+    )
+    swapped = rtl.replace("input a;\n    input b;", "input b;\n    input a;")
+    assert get_rtl_hash(rtl) != get_rtl_hash(swapped)
+
+
+def test_define_line_breaks_change_hash():
+    rtl = "`define X 1\n+1\nmodule m(output [3:0] q);\n  assign q = `X;\nendmodule"
+    joined = rtl.replace("`define X 1\n+1", "`define X 1 +1")
+    assert get_rtl_hash(rtl) != get_rtl_hash(joined)
+
+
+STRUCT_RTL = """
+module TopModule(input [6:0] d, output [6:0] q);
+  typedef struct packed {
+    logic [3:0] hi;
+    logic b;
+    logic [1:0] c;
+  } fields_t;
+  fields_t f;
+  assign f = d;
+  assign q = {f.c, f.b, f.hi};
+endmodule
+"""
+
+
+def test_struct_field_order_changes_hash():
+    swapped = STRUCT_RTL.replace(
+        "    logic b;\n    logic [1:0] c;", "    logic [1:0] c;\n    logic b;"
+    )
+    assert swapped != STRUCT_RTL
+    assert get_rtl_hash(STRUCT_RTL) != get_rtl_hash(swapped)
+
+
+def test_union_member_order_changes_hash():
+    rtl = (
+        "module m;\n  union packed { logic [1:0] a; logic [1:0] b; } u;\n"
+        "  wire x;\nendmodule"
+    )
+    swapped = rtl.replace(
+        "logic [1:0] a; logic [1:0] b;", "logic [1:0] b; logic [1:0] a;"
+    )
+    assert get_rtl_hash(rtl) != get_rtl_hash(swapped)
+
+
+def test_declarations_after_struct_still_sorted():
+    rtl = STRUCT_RTL.replace("  fields_t f;", "  fields_t f;\n  wire x;\n  wire y;")
+    swapped = STRUCT_RTL.replace("  fields_t f;", "  fields_t f;\n  wire y;\n  wire x;")
+    assert get_rtl_hash(rtl) == get_rtl_hash(swapped)
@@ -0,0 +1,146 @@
+from mage.rtl_precheck import precheck_rtl
+
+INTERFACE = """
+module TopModule (
+  input clk,
+  input [7:0] in,
+  output reg [7:0] out
+);
+"""
+
+
+def test_begin_end_in_strings_and_comments():
+    rtl_code = """
+// begin: the register; case (in) is not used here
+module TopModule (
+  input clk,
+  input [7:0] in,  // begin of the port list (
+  output reg [7:0] out
+);
+  /* begin
+     case ( { [ */
+  always @(posedge clk) begin
+    out <= in;
+    $display("begin case ( \\" end endmodule");
+  end
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+
+
+def test_escaped_identifiers():
+    rtl_code = """
+module TopModule (input clk, input [7:0] in, output reg [7:0] out);
+  wire \\begin ;
+  wire \\bus[0] ;
+  always @(posedge clk) out <= in;
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+
+
+def test_casez_casex():
+    rtl_code = """
+module TopModule (
+  input clk,
+  input [7:0] in,
+  output reg [7:0] out
+);
+  always @(*) begin
+    casez (in)
+      8'b1???????: out = 8'd7;
+      8'b01??????: begin out = 8'd6; end
+      default: out = 8'd0;
+    endcase
+  end
+  (* parallel_case *)
+  always @(posedge clk)
+    unique casex (in[1:0])
+      2'b1x: ;
+      default: ;
+    endcase
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+
+
+def test_generate_blocks():
+    rtl_code = """
+module TopModule #(parameter W = 8) (
+  input clk,
+  input [W-1:0] in,
+  output reg [W-1:0] out
+);
+  genvar i;
+  generate
+    for (i = 0; i < W; i = i + 1) begin : gen_bit
+      always @(posedge clk) out[i] <= in[W-1-i];
+    end
+    if (W > 4) begin : gen_wide
+      wire unused = 1'b0;
+    end else begin : gen_narrow
+      wire unused = 1'b1;
+    end
+  endgenerate
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+
+
+def test_unbalanced_blocks():
+    errors = precheck_rtl(
+        "module TopModule;\n  always @(*) begin\n    case (x)\n  end\nendmodule\n"
+    )
+    assert errors == [
+        "line 4: 'end' closes 'case' opened at line 3, expected 'endcase'"
+    ]
+    errors = precheck_rtl("module TopModule;\n  assign y = (a & b;\nendmodule\n")
+    assert len(errors) == 1 and "'('" in errors[0]
+    assert precheck_rtl("module TopModule;\n  begin\n") != []
+
+
+def test_port_name_mismatch():
+    rtl_code = """
+module TopModule (
+  input clk,
+  input [7:0] data,
+  output reg [7:0] out
+);
+  always @(posedge clk) out <= data;
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == [
+        "module 'TopModule' lacks ports of the interface: ['in']",
+        "module 'TopModule' has ports not in the interface: ['data']",
+    ]
+    assert precheck_rtl(rtl_code.replace("TopModule", "Top"), INTERFACE) == [
+        "module 'TopModule' of the given interface is not defined"
+    ]
+
+
+def test_port_names_match_in_other_styles():
+    # Non-ANSI header, with the ports in another order
+    rtl_code = """
+module TopModule (out, in, clk);
+  input clk;
+  input [7:0] in;
+  output reg [7:0] out;
+  always @(posedge clk) out <= in;
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+    rtl_code = """
+module TopModule (
+  input logic clk,
+  input logic [7:0] in,
+  output logic [7:0] out = 8'd0
+);
+  always_ff @(posedge clk) out <= in;
+endmodule
+"""
+    assert precheck_rtl(rtl_code, INTERFACE) == []
+
+
+def test_macros_left_to_compiler():
+    rtl_code = "`define BEGIN begin\nmodule TopModule;\n  `BEGIN\nendmodule\n"
+    assert precheck_rtl(rtl_code) == []
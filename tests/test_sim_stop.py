@@ -0,0 +1,114 @@
+import asyncio
+import re
+import sys
+import time
+
+import mage.sim_reviewer as sim_reviewer
+from mage.bash_tools import CommandResult, arun_command, run_command
+from mage.sim_reviewer import (
+    SIM_MISMATCH_LINE_PATTERN,
+    SimReviewJob,
+    compile_and_simulate,
+    get_sim_stop_after,
+    sim_review_mismatch_cnt,
+)
+
+# Prints mismatch lines, then hangs as a testbench ignoring the ceiling would
+SPAM_MISMATCHES = [
+    sys.executable,
+    "-c",
+    "import sys, time\n"
+    "for i in range(50):\n"
+    "    print(f'Mismatch at time {i}: got 0 exp 1', flush=True)\n"
+    "time.sleep(30)\n",
+]
+# Testbench printing five lines per mismatch, with a running count
+VERBOSE_MISMATCHES = [
+    sys.executable,
+    "-c",
+    "for i in range(1, 5):\n"
+    "    print(f'Mismatch at time {i}0:')\n"
+    "    print('  in  = 1 (mismatch)')\n"
+    "    print('  out = 0 (mismatch)')\n"
+    "    print('  exp = 1 (mismatch)')\n"
+    "    print(f'  mismatches so far = {i}')\n"
+    "print('SIMULATION FAILED - 4 MISMATCHES DETECTED, FIRST AT TIME 10')\n",
+]
+
+
+def test_mismatch_line_pattern():
+    pattern = re.compile(SIM_MISMATCH_LINE_PATTERN)
+    for line in [
+        "Mismatch at time 10: got 0 exp 1",
+        "Got Mismatch at",
+        "SIMULATION FAILED - 3 MISMATCHES DETECTED, FIRST AT TIME 10",
+    ]:
+        assert pattern.search(line), line
+    for line in [
+        "time 10: in=1 out=1 exp=1 mismatch=0",
+        "Mismatches: 0",
+        "SIMULATION PASSED - 0 mismatches",
+        "no mismatch at time 10",
+        "time 10: in=1 out=1 exp=1",
+    ]:
+        assert not pattern.search(line), line
+
+
+def test_run_stops_after_matching_lines():
+    start_time = time.monotonic()
+    result = run_command(
+        SPAM_MISMATCHES,
+        timeout=20,
+        keep_pattern=SIM_MISMATCH_LINE_PATTERN,
+        stop_after=10,
+    )
+    assert time.monotonic() - start_time < 10
+    assert result.is_stopped and not result.is_interrupted
+    assert result.returncode is None
+    assert "Stopped after" in result.stderr
+
+
+def test_arun_stops_after_matching_lines():
+    start_time = time.monotonic()
+    result = asyncio.run(
+        arun_command(
+            SPAM_MISMATCHES,
+            timeout=20,
+            keep_pattern=SIM_MISMATCH_LINE_PATTERN,
+            stop_after=10,
+        )
+    )
+    assert time.monotonic() - start_time < 10
+    assert result.is_stopped and not result.is_timeout
+    assert result.returncode is None
+
+
+def test_run_without_stop_after_is_not_stopped():
+    result = run_command(
+        [sys.executable, "-c", "for i in range(50): print('Mismatch', i)"],
+        keep_pattern=SIM_MISMATCH_LINE_PATTERN,
+    )
+    assert result.is_success and not result.is_stopped
+
+
+def test_multi_line_mismatches_below_ceiling_not_stopped(tmp_path):
+    # 20 mismatch lines for 4 mismatches: under a ceiling of 5, the count stands
+    result = compile_and_simulate(
+        [sys.executable, "-c", "pass"],
+        VERBOSE_MISMATCHES,
+        str(tmp_path / "sim_output"),
+        mismatch_ceiling=5,
+    )
+    assert not result.is_stopped
+    assert sim_review_mismatch_cnt(result) == 4
+
+
+def test_stopped_run_has_no_mismatch_cnt(tmp_path, monkeypatch):
+    monkeypatch.setattr(sim_reviewer, "sim_cache", None)
+    for name in ("tb.sv", "rtl.sv"):
+        (tmp_path / name).write_text("module m; endmodule\n")
+    job = SimReviewJob(str(tmp_path), mismatch_ceiling=0)
+    assert get_sim_stop_after(0) is not None
+    is_pass, mismatch_cnt, _ = job.finish(CommandResult(cmd="vvp", is_stopped=True))
+    assert not is_pass
+    assert mismatch_cnt is None
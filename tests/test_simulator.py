@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+
+from mage.simulator import VerilatorBackend
+
+
+def write_tb(tmp_path, i: int) -> str:
+    tb_path = str(tmp_path / f"tb_{i}.sv")
+    with open(tb_path, "w") as f:
+        f.write(f"module tb_{i}; endmodule\n")
+    return tb_path
+
+
+def get_key_dirs(build_root: str):
+    return {entry.name for entry in os.scandir(build_root) if entry.is_dir()}
+
+
+def test_build_dirs_evicted_lru(tmp_path):
+    build_root = str(tmp_path / "build")
+    backend = VerilatorBackend(build_root=build_root, max_build_keys=2)
+    tb_paths = [write_tb(tmp_path, i) for i in range(4)]
+    key_dirs = []
+    for tb_path in tb_paths[:2]:
+        with backend.build_dir(str(tmp_path), [tb_path]) as slot_dir:
+            key_dirs.append(os.path.basename(os.path.dirname(slot_dir)))
+    # Key 1 is made the least recently used, whatever the mtime resolution
+    os.utime(f"{build_root}/{key_dirs[1]}", (0, 0))
+    with backend.build_dir(str(tmp_path), [tb_paths[0]]):
+        pass
+    with backend.build_dir(str(tmp_path), [tb_paths[2]]) as slot_dir:
+        key_dirs.append(os.path.basename(os.path.dirname(slot_dir)))
+    assert get_key_dirs(build_root) == {key_dirs[0], key_dirs[2]}
+
+
+def test_build_dir_in_use_not_evicted(tmp_path):
+    build_root = str(tmp_path / "build")
+    backend = VerilatorBackend(build_root=build_root, max_build_keys=1)
+    tb_paths = [write_tb(tmp_path, i) for i in range(2)]
+    with backend.build_dir(str(tmp_path), [tb_paths[0]]) as held_dir:
+        with backend.build_dir(str(tmp_path), [tb_paths[1]]):
+            pass
+        assert os.path.isdir(held_dir)
+    assert len(get_key_dirs(build_root)) == 2
+
+
+def test_key_with_any_slot_held_not_evicted(tmp_path):
+    build_root = str(tmp_path / "build")
+    backend = VerilatorBackend(build_root=build_root, max_build_keys=1)
+    tb_paths = [write_tb(tmp_path, i) for i in range(3)]
+    first = backend.build_dir(str(tmp_path), [tb_paths[0]])
+    second = backend.build_dir(str(tmp_path), [tb_paths[0]])
+    first_dir = first.__enter__()
+    second_dir = second.__enter__()
+    assert first_dir != second_dir  # Concurrent builds of a key get their own slot
+    first.__exit__(None, None, None)
+    # Only slot 1 of key 0 is held now
+    with backend.build_dir(str(tmp_path), [tb_paths[1]]):
+        pass
+    assert os.path.isdir(second_dir)
+    second.__exit__(None, None, None)
+    with backend.build_dir(str(tmp_path), [tb_paths[2]]) as slot_dir:
+        pass
+    assert get_key_dirs(build_root) == {os.path.basename(os.path.dirname(slot_dir))}
+
+
+def test_slot_held_by_other_process_not_evicted(tmp_path):
+    build_root = str(tmp_path / "build")
+    tb_paths = [write_tb(tmp_path, i) for i in range(2)]
+    holder = subprocess.Popen(
+        [
+            sys.executable,
+            "-c",
+            "import sys\n"
+            "from mage.simulator import VerilatorBackend\n"
+            f"backend = VerilatorBackend(build_root={build_root!r}, max_build_keys=1)\n"
+            f"with backend.build_dir('.', [{tb_paths[0]!r}]) as slot_dir:\n"
+            "    print('held', slot_dir, flush=True)\n"
+            "    sys.stdin.read()\n",
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+    )
+    try:
+        assert holder.stdout is not None
+        # Other output is logging
+        held_line = next(line for line in holder.stdout if line.startswith("held "))
+        held_dir = held_line.split(" ", 1)[1].strip()
+        backend = VerilatorBackend(build_root=build_root, max_build_keys=1)
+        with backend.build_dir(str(tmp_path), [tb_paths[1]]):
+            pass
+        assert os.path.isdir(held_dir)
+    finally:
+        holder.communicate("")
+    assert len(get_key_dirs(build_root)) == 2